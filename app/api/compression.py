@@ -0,0 +1,158 @@
+import os
+import zlib
+from typing import Optional
+
+import brotli
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class _Compressor:
+    """
+    Incremental encoder. `compress` returns everything encoded so far, so a
+    streamed chunk reaches the client as soon as it is sent.
+    """
+
+    def compress(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+    def finish(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+
+class _GzipCompressor(_Compressor):
+    def __init__(self, level: int) -> None:
+        self._zlib = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes) -> bytes:
+        return self._zlib.compress(data) + self._zlib.flush()
+
+
+class _BrotliCompressor(_Compressor):
+    def __init__(self, quality: int) -> None:
+        self._brotli = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._brotli.process(data) + self._brotli.flush()
+
+    def finish(self, data: bytes) -> bytes:
+        return self._brotli.process(data) + self._brotli.finish()
+
+
+def _accepted(accept_encoding: str) -> set:
+    # Codings the client accepts, i.e. listed without q=0.
+    codings = set()
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        codings.add(coding.strip())
+    return codings
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing response bodies with brotli or gzip,
+    whichever the client accepts, brotli first.
+
+    Bodies under `minimum_size` and responses that already carry a
+    Content-Encoding are sent as they are. Streamed responses are flushed
+    after every chunk so streaming is preserved.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _negotiate(self, scope: Scope) -> Optional[str]:
+        accepted = _accepted(Headers(scope=scope).get("accept-encoding", ""))
+        if "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    def _compressor(self, coding: str) -> _Compressor:
+        if coding == "br":
+            return _BrotliCompressor(self.brotli_quality)
+        return _GzipCompressor(self.gzip_level)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        coding = self._negotiate(scope) if scope["type"] == "http" else None
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                # Held back until the first body shows whether to compress.
+                start = message
+                passthrough = "content-encoding" in Headers(raw=message["headers"])
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            if passthrough:
+                if start is not None:
+                    await send(start)
+                    start = None
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start)
+                    start = None
+                    await send(message)
+                    return
+                headers = MutableHeaders(raw=start["headers"])
+                headers["Content-Encoding"] = coding
+                headers.add_vary_header("Accept-Encoding")
+                compressor = self._compressor(coding)
+                body = compressor.compress(body) if more_body else compressor.finish(body)
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    headers["Content-Length"] = str(len(body))
+                await send(start)
+                start = None
+            else:
+                body = compressor.compress(body) if more_body else compressor.finish(body)
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+def init_compression_kwargs() -> dict:
+    """
+    Reads the CompressionMiddleware settings from the environment.
+    """
+    return dict(
+        minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", "1024")),
+        gzip_level=int(os.getenv("COMPRESSION_GZIP_LEVEL", "6")),
+        brotli_quality=int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4")),
+    )
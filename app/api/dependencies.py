@@ -0,0 +1,35 @@
+from typing import Annotated
+
+from fastapi import Depends
+
+from app.services.async_search import AsyncSearch, get_async_search
+from app.services.encoder import TextEncoder, get_encoder
+from app.services.stats_store import StatsStore, get_stats_store
+
+
+async def async_search() -> AsyncSearch:
+    """
+    Returns the search service of a request. Routes take it as
+    `AsyncSearchDep`; tests can swap it through `app.dependency_overrides`.
+    """
+    # Async so that FastAPI calls it inline instead of in its threadpool.
+    return get_async_search()
+
+
+async def encoder() -> TextEncoder:
+    """
+    Returns the query encoder. Routes take it as `EncoderDep`.
+    """
+    return get_encoder()
+
+
+async def stats_store() -> StatsStore:
+    """
+    Returns the stats snapshot store. Routes take it as `StatsStoreDep`.
+    """
+    return get_stats_store()
+
+
+AsyncSearchDep = Annotated[AsyncSearch, Depends(async_search)]
+EncoderDep = Annotated[TextEncoder, Depends(encoder)]
+StatsStoreDep = Annotated[StatsStore, Depends(stats_store)]
@@ -1,8 +1,9 @@
 from fastapi import APIRouter
 
-from app.api.routes import document, genai, stats
+from app.api.routes import document, export, genai, stats
 
 api_router = APIRouter()
 api_router.include_router(document.router, prefix="/document", tags=["document"])
 api_router.include_router(stats.router, prefix="/stats", tags=["stats"])
 api_router.include_router(genai.router, prefix="/genai", tags=["genai"])
+api_router.include_router(export.router, prefix="/export", tags=["export"])
@@ -0,0 +1,173 @@
+import asyncio
+import functools
+import os
+import time
+from typing import Callable, Iterable
+
+from fastapi import APIRouter, Request, Response
+from fastapi.responses import PlainTextResponse
+from fastapi.routing import APIRoute
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.services.cache import get_document_cache, get_embedding_cache, get_network_cache, get_summary_cache
+from app.services.encoder import get_encoder
+from app.services.metrics import (
+    Family,
+    RequestTimings,
+    http_request_seconds,
+    http_response_bytes,
+    opensearch_round_trips_per_request,
+    record_span,
+    registry,
+    request_timings,
+    route_phase_seconds,
+)
+
+# Requests that matched no route are grouped, so unknown paths cannot grow the label set.
+_UNMATCHED_ROUTE = "unmatched"
+
+
+class TimedRoute(APIRoute):
+    """
+    Route that times its endpoint function apart from the validation and
+    serialization FastAPI does around it.
+    """
+
+    def get_route_handler(self) -> Callable:
+        self.dependant.call = self._timed_endpoint(self.dependant.call)
+        handler = super().get_route_handler()
+        route = self.path_format
+
+        @functools.wraps(handler)
+        async def timed_handler(request: Request) -> Response:
+            timings = request_timings.get()
+            if timings is None:
+                return await handler(request)
+            timings.route = route
+            start = time.perf_counter()
+            try:
+                return await handler(request)
+            finally:
+                total = time.perf_counter() - start
+                endpoint = timings.spans["endpoint"][0] if "endpoint" in timings.spans else 0.0
+                serialize = max(total - endpoint, 0.0)
+                route_phase_seconds.observe(endpoint, route, "endpoint")
+                route_phase_seconds.observe(serialize, route, "serialize")
+                timings.add("serialize", serialize)
+
+        return timed_handler
+
+    @staticmethod
+    def _timed_endpoint(call: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(call):
+
+            @functools.wraps(call)
+            async def async_endpoint(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await call(*args, **kwargs)
+                finally:
+                    record_span("endpoint", time.perf_counter() - start)
+
+            return async_endpoint
+
+        @functools.wraps(call)
+        def endpoint(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return call(*args, **kwargs)
+            finally:
+                record_span("endpoint", time.perf_counter() - start)
+
+        return endpoint
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording each request's latency and response size, and
+    adding its timing breakdown as a Server-Timing header when
+    `server_timing` is set.
+    """
+
+    def __init__(self, app: ASGIApp, server_timing: bool = False) -> None:
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = request_timings.set(timings)
+        start = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_with_metrics(message: Message) -> None:
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing and timings.spans:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", timings.server_timing().encode("latin-1"))
+                    ]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            request_timings.reset(token)
+            # Routes outside the API routers (/health, /metrics) have fixed paths.
+            route = timings.route or (scope["path"] if status != 404 else _UNMATCHED_ROUTE)
+            http_request_seconds.observe(time.perf_counter() - start, route, scope["method"], str(status))
+            http_response_bytes.observe(size, route)
+            # `record_round_trip` counts each round trip as an "opensearch" span.
+            opensearch_round_trips_per_request.observe(timings.spans.get("opensearch", (0, 0))[1], route)
+
+
+def _cache_families() -> Iterable[Family]:
+    caches = {
+        "embedding": get_embedding_cache().stats(),
+        "network": get_network_cache().stats(),
+        "summary": get_summary_cache().stats(),
+        "document": get_document_cache().stats(),
+    }
+    for counter in ("hits", "misses"):
+        yield (
+            f"ndltd_cache_{counter}_total",
+            "counter",
+            f"Cache {counter}.",
+            [({"cache": name}, stats[counter]) for name, stats in caches.items()],
+        )
+    yield (
+        "ndltd_cache_entries",
+        "gauge",
+        "Entries held by each cache.",
+        [({"cache": name}, stats["entries"]) for name, stats in caches.items()],
+    )
+    yield (
+        "ndltd_cache_shared_hits_total",
+        "counter",
+        "Lookups served by the cache tier shared between workers.",
+        [({"cache": "embedding"}, caches["embedding"]["shared_hits"])],
+    )
+    encoder = get_encoder()
+    yield ("ndltd_encoder_batches_total", "counter", "Forward passes of the query encoder.", [({}, encoder.batches)])
+    yield ("ndltd_encoder_texts_total", "counter", "Texts encoded by the query encoder.", [({}, encoder.encoded)])
+
+
+registry.register_collector(_cache_families)
+
+
+def server_timing_enabled() -> bool:
+    return os.getenv("SERVER_TIMING", "false").lower() == "true"
+
+
+router = APIRouter()
+
+@router.get("/metrics", include_in_schema=False)
+def metrics() -> PlainTextResponse:
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
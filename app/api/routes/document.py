@@ -1,26 +1,261 @@
-from typing import List
+import hmac
+import os
+from typing import Annotated, Any, AsyncIterator, Dict, List, Literal, Tuple
 
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
 
-from app.services.classes import Document, NetworkData
-from app.services import os_search
+from app.api.dependencies import AsyncSearchDep, EncoderDep
+from app.api.metrics import TimedRoute
+from app.services.classes import (
+    AnalyzedNetworkData,
+    AnalyzedNode,
+    CompactNetworkData,
+    Document,
+    Edge,
+    NetworkBatchRequest,
+    NetworkChunk,
+    NetworkData,
+    Node,
+    SeedNetwork,
+    TitleSearchPage,
+    UIDwithScore,
+)
+from app.services.encoder import _ENCODER_ERRORS
+from app.services.graph import compact_network
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
+
+def _deadline_ms(deadline_ms: float | None) -> float | None:
+    # Falls back to NETWORK_DEADLINE_MS; unset means no deadline.
+    if deadline_ms is not None:
+        return deadline_ms
+    NETWORK_DEADLINE_MS = os.getenv("NETWORK_DEADLINE_MS")
+    return float(NETWORK_DEADLINE_MS) if NETWORK_DEADLINE_MS else None
+
+_MAX_ABSTRACTS = 200
+
+def _json_response(model: BaseModel) -> Response:
+    # Serializes straight to bytes, without FastAPI revalidating a model the server built.
+    return Response(type(model).__pydantic_serializer__.to_json(model), media_type="application/json")
+
+def _network_model(
+    network: Tuple[List[Node], List[Edge], Dict[str, Document], bool], format: str
+) -> NetworkData | CompactNetworkData:
+    node_list, edge_list, documents, truncated = network
+    if format == "compact":
+        return compact_network(node_list, edge_list, documents, truncated=truncated)
+    model = AnalyzedNetworkData if node_list and isinstance(node_list[0], AnalyzedNode) else NetworkData
+    return model.model_construct(
+        nodes=node_list, edges=edge_list, documents=documents, truncated=truncated
+    )
 
 @router.get("/")
-def search_document(uid: str) -> Document:
-    return os_search.get_document_with_id(uid)
-
-@router.get("/similarity")
-def search_similarity_network(
-    uid: str = "109THU00099005", layer: int = Query(2), n_results: int = Query(5)
-) -> NetworkData:
-    node_list, edge_list, documents = os_search.get_document_similarity_network(
-        uid=uid, layer=layer, n_results=n_results
+async def search_document(uid: str, search: AsyncSearchDep) -> Document:
+    return await search.get_document_with_id(uid)
+
+@router.get(
+    "/similarity",
+    response_model=AnalyzedNetworkData | NetworkData,
+    responses={200: {"model": CompactNetworkData, "description": "With `format=compact`."}},
+)
+async def search_similarity_network(
+    search: AsyncSearchDep,
+    uid: str = "109THU00099005",
+    layer: int = Query(2),
+    n_results: int = Query(5),
+    narrow_field: str | None = Query(None),
+    detailed_field: str | None = Query(None),
+    num_candidates: int | None = Query(None, ge=1, le=10000),
+    symmetric: bool = Query(False),
+    deadline_ms: float | None = Query(None, gt=0),
+    format: Literal["full", "compact"] = Query("full"),
+    analytics: bool = Query(False),
+) -> Response:
+    """
+    Builds the similarity network. With a deadline, the network found when it
+    runs out is returned with `truncated` set.
+
+    `analytics` fills in each node's `weighted_degree`, `pagerank`,
+    `component` and `community` within the network.
+
+    `format=compact` returns `CompactNetworkData`: parallel arrays with each
+    uid sent once and documents without their abstracts, which
+    `/document/abstracts` serves on demand.
+    """
+    network = await search.get_document_similarity_network(
+        uid=uid,
+        layer=layer,
+        n_results=n_results,
+        narrow_field=narrow_field,
+        detailed_field=detailed_field,
+        num_candidates=num_candidates,
+        symmetric=symmetric,
+        deadline_ms=_deadline_ms(deadline_ms),
+        analytics=analytics,
+    )
+    return _json_response(_network_model(network, format))
+
+@router.get("/similarity/stream")
+async def stream_similarity_network(
+    search: AsyncSearchDep,
+    uid: str = "109THU00099005",
+    layer: int = Query(2),
+    n_results: int = Query(5),
+    narrow_field: str | None = Query(None),
+    detailed_field: str | None = Query(None),
+    num_candidates: int | None = Query(None, ge=1, le=10000),
+    symmetric: bool = Query(False),
+    deadline_ms: float | None = Query(None, gt=0),
+) -> StreamingResponse:
+    """
+    Streams the similarity network as NDJSON, one `NetworkChunk` per layer.
+    """
+    chunks = search.iter_document_similarity_network(
+        uid=uid,
+        layer=layer,
+        n_results=n_results,
+        narrow_field=narrow_field,
+        detailed_field=detailed_field,
+        num_candidates=num_candidates,
+        symmetric=symmetric,
+        deadline_ms=_deadline_ms(deadline_ms),
     )
-    return NetworkData(nodes=node_list, edges=edge_list, documents=documents)
+    # Fetch the first layer before responding so a bad uid fails the request
+    # instead of cutting the stream short.
+    first = await anext(chunks)
+
+    async def ndjson(first: NetworkChunk) -> AsyncIterator[str]:
+        yield first.model_dump_json() + "\n"
+        async for chunk in chunks:
+            yield chunk.model_dump_json() + "\n"
+
+    return StreamingResponse(ndjson(first), media_type="application/x-ndjson")
+
+@router.post(
+    "/similarity/batch",
+    responses={200: {"description": "NDJSON of `SeedNetwork`, or one `NetworkData` with `merge`."}},
+)
+async def batch_similarity_networks(request: NetworkBatchRequest, search: AsyncSearchDep) -> Response:
+    """
+    Builds the similarity networks of many seeds in one call, sharing
+    embedding fetches and kNN searches between seeds whose neighbourhoods
+    overlap.
+
+    Streams NDJSON, one `SeedNetwork` per distinct seed in request order,
+    each network equal to `/similarity`'s. With `merge`, returns a single
+    network joining all seeds instead.
+    """
+    params = dict(
+        uids=request.uids,
+        layer=request.layer,
+        n_results=request.n_results,
+        narrow_field=request.narrow_field,
+        detailed_field=request.detailed_field,
+        num_candidates=request.num_candidates,
+        symmetric=request.symmetric,
+        analytics=request.analytics,
+    )
+    if request.merge:
+        network = await search.get_merged_similarity_network(**params)
+        return _json_response(_network_model(network, request.format))
+
+    networks = search.iter_document_similarity_networks(**params)
+    # As in /similarity/stream, a bad uid in the first batch fails the request.
+    first = await anext(networks)
+
+    async def ndjson(first: Tuple[str, Any]) -> AsyncIterator[bytes]:
+        yield _seed_network_line(*first, request.format)
+        async for seed, network in networks:
+            yield _seed_network_line(seed, network, request.format)
+
+    return StreamingResponse(ndjson(first), media_type="application/x-ndjson")
+
+def _seed_network_line(seed: str, network: Tuple, format: str) -> bytes:
+    line = SeedNetwork.model_construct(uid=seed, network=_network_model(network, format))
+    return SeedNetwork.__pydantic_serializer__.to_json(line) + b"\n"
+
+@router.get("/abstracts")
+async def get_abstracts(search: AsyncSearchDep, uid: List[str] = Query(...)) -> Dict[str, str]:
+    """
+    Returns the abstracts of several documents, keyed by uid, e.g. for the
+    nodes of a compact network. Unknown uids are left out.
+    """
+    if len(uid) > _MAX_ABSTRACTS:
+        raise HTTPException(status_code=400, detail=f"At most {_MAX_ABSTRACTS} uids per request")
+    documents = await search.get_documents(uids=uid)
+    return {x: document.abstract for x, document in documents.items()}
+
+@router.delete("/similarity/cache")
+async def invalidate_similarity_cache(
+    search: AsyncSearchDep,
+    admin_token: Annotated[str | None, Header()] = None
+) -> dict:
+    """
+    Drops every cached similarity network, document and embedding, in the
+    caches shared between workers too. Call after reindexing.
+    Disabled unless CACHE_ADMIN_TOKEN is set; the token must be sent in the admin-token header.
+    """
+    expected = os.getenv("CACHE_ADMIN_TOKEN")
+    if not expected or not admin_token or not hmac.compare_digest(admin_token, expected):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    search.network_cache.invalidate()
+    search.document_cache.invalidate()
+    search.embedding_cache.clear()
+    return {"status": "ok"}
 
 
 @router.get("/title")
-def search_title(query: str) -> List[Document]:
-    return os_search.search_title(query)
+async def search_title(query: str, search: AsyncSearchDep) -> List[Document]:
+    return await search.search_title(query)
+
+@router.get("/title/hybrid")
+async def search_title_hybrid(
+    search: AsyncSearchDep,
+    encoder: EncoderDep,
+    query: str,
+    size: int = Query(10, ge=1, le=100),
+    search_after: str | None = Query(None),
+) -> TitleSearchPage:
+    """
+    Fuses lexical and semantic title matches with reciprocal rank fusion.
+    Falls back to the lexical ranking alone when the encoder cannot be loaded or fails.
+    Pass the returned search_after to fetch the next page.
+    """
+    try:
+        vector = (await encoder.aencode(query.strip())).tolist()
+    except _ENCODER_ERRORS:
+        vector = None
+    try:
+        return await search.search_title_hybrid(
+            query, vector=vector, size=size, search_after=search_after
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/semantic")
+async def search_semantic(
+    search: AsyncSearchDep,
+    encoder: EncoderDep,
+    query: str,
+    top_k: int = Query(10, ge=1, le=100),
+    narrow_field: str | None = Query(None),
+    detailed_field: str | None = Query(None),
+    num_candidates: int = Query(100, ge=1, le=10000),
+) -> List[UIDwithScore]:
+    """
+    Searches titles by meaning: the query is embedded with the local encoder and matched by kNN.
+    """
+    try:
+        vector = await encoder.aencode(query.strip())
+    except _ENCODER_ERRORS:
+        raise HTTPException(status_code=503, detail="Semantic search is not available")
+    return await search.search_title_with_vector(
+        vector=vector.tolist(),
+        narrow_field=narrow_field,
+        detailed_field=detailed_field,
+        top_k=top_k,
+        num_candidates=num_candidates,
+    )
@@ -0,0 +1,77 @@
+import contextlib
+from typing import Any, AsyncIterator, Dict, List, Literal
+
+from fastapi import APIRouter, Query, Response
+from fastapi.responses import StreamingResponse
+from pydantic_core import to_json
+
+from app.api.dependencies import AsyncSearchDep
+from app.api.metrics import TimedRoute
+from app.services.export import EMBEDDING_BLOCK_MEDIA_TYPE, encode_embedding_block
+
+router = APIRouter(route_class=TimedRoute)
+
+_MAX_EXPORT_SLICES = 16
+
+def _ndjson_page(page: List[Dict[str, Any]]) -> bytes:
+    return b"".join(to_json(source) + b"\n" for source in page)
+
+@router.get(
+    "/documents",
+    responses={
+        200: {
+            "description": "NDJSON of document sources, or float32 embedding blocks with `format=f32`.",
+            "content": {"application/x-ndjson": {}, EMBEDDING_BLOCK_MEDIA_TYPE: {}},
+        }
+    },
+)
+async def export_documents(
+    search: AsyncSearchDep,
+    narrow_field: str | None = None,
+    detailed_field: str | None = None,
+    year: int | None = None,
+    fields: List[str] | None = Query(None),
+    embeddings: bool = False,
+    format: Literal["ndjson", "f32"] = "ndjson",
+    batch_size: int = Query(1000, ge=1, le=10000),
+    slices: int = Query(1, ge=1, le=_MAX_EXPORT_SLICES),
+) -> Response:
+    """
+    Exports every document matching the filters, however many, from a
+    consistent point in time of the index.
+
+    Streams NDJSON, one document `_source` per line, with only `uid` and
+    `fields` if given and the embedding with `embeddings`. With `format=f32`,
+    streams the embeddings as binary blocks instead, one per page of
+    `batch_size` documents; see `app.services.export.iter_embedding_blocks`
+    to read them. `slices` pages are fetched in parallel, in no particular
+    order across slices.
+    """
+    if format == "f32":
+        fields, embeddings = ["uid"], True
+        encode = encode_embedding_block
+    else:
+        encode = _ndjson_page
+
+    pages = search.export_documents(
+        narrow_field=narrow_field,
+        detailed_field=detailed_field,
+        year=year,
+        fields=fields,
+        embeddings=embeddings,
+        batch_size=batch_size,
+        slices=slices,
+    )
+    # Opening the point in time before responding lets a cluster error fail the request.
+    first = await anext(pages, None)
+
+    async def body() -> AsyncIterator[bytes]:
+        async with contextlib.aclosing(pages):
+            if first is None:
+                return
+            yield encode(first)
+            async for page in pages:
+                yield encode(page)
+
+    media_type = EMBEDDING_BLOCK_MEDIA_TYPE if format == "f32" else "application/x-ndjson"
+    return StreamingResponse(body(), media_type=media_type)
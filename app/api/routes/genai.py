@@ -1,27 +1,64 @@
 from typing import Annotated
 
 from fastapi import APIRouter, Header, Query
+from fastapi.responses import StreamingResponse
 
-from app.services.rag import RagSummary
-from app.services import os_search
+from app.api.dependencies import AsyncSearchDep
+from app.api.metrics import TimedRoute
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
 
 @router.get("/summary")
-def generate_summary(
+async def generate_summary(
+    search: AsyncSearchDep,
     llm_service: str = Query("google"),
     model_name: str = Query("gemini-1.0-pro"),
     target_uid: str = Query("109THU00099005"),
     n_results: int = Query(6),
     genai_api_key: Annotated[str | None, Header()] = None
 ) -> dict:
+    # LangChain is imported by the first summary request, not at startup.
+    from app.services.rag import RagSummary
+
     rag = RagSummary(
         llm_service=llm_service, 
         model_name=model_name, 
         api_key=genai_api_key, 
         target_uid=target_uid, 
-        n_results=n_results
+        n_results=n_results,
+        async_search=search,
     )
     
-    answer = rag.run()
+    answer = await rag.arun()
     return answer
+
+@router.get("/summary/stream")
+async def stream_summary(
+    search: AsyncSearchDep,
+    llm_service: str = Query("google"),
+    model_name: str = Query("gemini-1.0-pro"),
+    target_uid: str = Query("109THU00099005"),
+    n_results: int = Query(6),
+    genai_api_key: Annotated[str | None, Header()] = None
+) -> StreamingResponse:
+    from app.services.rag import RagSummary
+
+    rag = RagSummary(
+        llm_service=llm_service,
+        model_name=model_name,
+        api_key=genai_api_key,
+        target_uid=target_uid,
+        n_results=n_results,
+        async_search=search,
+    )
+
+    chunks = rag.astream()
+    # Wait for the first token so that lookup and model errors fail the request.
+    first = await anext(chunks, "")
+
+    async def tokens():
+        yield first
+        async for chunk in chunks:
+            yield chunk
+
+    return StreamingResponse(tokens(), media_type="text/plain; charset=utf-8")
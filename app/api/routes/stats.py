@@ -1,18 +1,42 @@
 from typing import Union, List, Dict
 from fastapi import APIRouter, Query
 
-from app.services import os_search
+from app.api.dependencies import AsyncSearchDep, StatsStoreDep
+from app.api.metrics import TimedRoute
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
 
 @router.get("/top_field")
-def get_top_field_count(
+async def get_top_field_count(
+    search: AsyncSearchDep,
+    stats_store: StatsStoreDep,
     year: int = Query(109),
+    bucket_size: int = Query(10, ge=1, le=1000),
 ) -> Dict[str, List[Dict[str, Union[str, int]]]]:
-    return os_search.get_top_field_count(year=year)
+    snapshot = stats_store.get_top_field_count(year=year, bucket_size=bucket_size)
+    if snapshot is not None:
+        return snapshot
+    return await search.get_top_field_count(year=year, bucket_size=bucket_size)
+
+@router.get("/top_field/years")
+async def get_top_field_counts(
+    search: AsyncSearchDep,
+    stats_store: StatsStoreDep,
+    years: List[int] = Query([109]),
+    bucket_size: int = Query(10, ge=1, le=1000),
+) -> Dict[int, Dict[str, List[Dict[str, Union[str, int]]]]]:
+    snapshot = stats_store.get_top_field_counts(years=years, bucket_size=bucket_size)
+    if snapshot is not None:
+        return snapshot
+    return await search.get_top_field_counts(years=years, bucket_size=bucket_size)
 
 @router.get("/institution_department")
-def get_institution_department(
+async def get_institution_department(
+    search: AsyncSearchDep,
+    stats_store: StatsStoreDep,
     year: int = Query(109),
 ) -> List[Dict[str, Union[str, int]]]:
-    return os_search.get_institution_department_stats(year=year)
+    snapshot = stats_store.get_institution_department_stats(year=year)
+    if snapshot is not None:
+        return snapshot
+    return await search.get_institution_department_stats(year=year)
@@ -1,2 +1,16 @@
-from .search import os_search
-from .rag import RagSummary
+from .search import Search, get_search
+from .async_search import AsyncSearch, get_async_search
+
+
+def __getattr__(name: str):
+    # Built on first use rather than at import; the LLM stack is only
+    # imported by whoever asks for `RagSummary`.
+    if name == "os_search":
+        return get_search()
+    if name == "os_async_search":
+        return get_async_search()
+    if name == "RagSummary":
+        from .rag import RagSummary
+
+        return RagSummary
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
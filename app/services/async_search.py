@@ -0,0 +1,710 @@
+import asyncio
+import contextlib
+import functools
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from opensearchpy import AsyncOpenSearch
+from opensearchpy.exceptions import TransportError
+
+from app.services.cache import (
+    EmbeddingCache,
+    ResultCache,
+    get_document_cache,
+    get_embedding_cache,
+    get_network_cache,
+)
+from app.services.classes import (
+    Document,
+    Edge,
+    NetworkChunk,
+    Node,
+    TitleSearchPage,
+    UIDwithEmbedding,
+    UIDwithScore,
+)
+from app.services.constants import _DOCUMENT_SOURCE_EXCLUDES, _INDEX
+from app.services.database import init_async_opensearch
+from app.services.doc_store import DocumentStore, get_doc_store
+from app.services.graph import SimilarityGraph
+from app.services.knn_graph import KnnGraph, get_knn_graph
+from app.services.metrics import timed
+from app.services.search import _EXPORT_KEEP_ALIVE, Search, _bulk_chunks, _Plan
+from app.services.vector_index import VectorIndex, get_vector_index
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSearch:
+    """
+    Asyncio counterpart of `Search` built on `AsyncOpenSearch`.
+
+    Request bodies, response parsing and the plans of the bulk paths are
+    shared with `Search`; only the round trips differ. The client, and with
+    it the aiohttp connection pool, is bound by `connect` at app startup and
+    released by `close` at shutdown; the pool belongs to the event loop that
+    `connect` ran on.
+    """
+
+    def __init__(self, client: Optional[AsyncOpenSearch] = None) -> None:
+        """
+        Initializes the AsyncSearch class.
+
+        Args:
+            client (AsyncOpenSearch, optional): The client to use. Defaults to one built from the environment by `connect`.
+        """
+        self._opensearch = client
+        self.embedding_cache: EmbeddingCache = get_embedding_cache()
+        self.network_cache: ResultCache = get_network_cache()
+        self.document_cache: ResultCache = get_document_cache()
+        self.vector_index: Optional[VectorIndex] = get_vector_index()
+        self.knn_graph: Optional[KnnGraph] = get_knn_graph()
+        self.doc_store: Optional[DocumentStore] = get_doc_store()
+
+    @property
+    def opensearch(self) -> AsyncOpenSearch:
+        if self._opensearch is None:
+            raise RuntimeError("AsyncSearch is not connected; await connect() first")
+        return self._opensearch
+
+    async def connect(self, client: Optional[AsyncOpenSearch] = None) -> None:
+        """
+        Binds the client and opens the shared connection pool.
+
+        Args:
+            client (AsyncOpenSearch, optional): The client to use. Defaults to the one given at construction, or one built from the environment.
+        """
+        if client is not None:
+            self._opensearch = client
+        elif self._opensearch is None:
+            self._opensearch = init_async_opensearch()
+        await self._opensearch.ping()
+
+    async def close(self) -> None:
+        """
+        Closes the shared connection pool and unbinds the client.
+        """
+        if self._opensearch is not None:
+            await self._opensearch.close()
+            self._opensearch = None
+
+    @timed
+    async def search_title_with_vector(
+        self,
+        vector: List[float],
+        narrow_field: str = None,
+        detailed_field: str = None,
+        top_k: int = 10,
+        num_candidates: int = 100,
+        round_decimal: int = 3,
+    ) -> List[UIDwithScore]:
+        """
+        Searches for documents with similar titles based on the given vector.
+
+        See `Search.search_title_with_vector`.
+        """
+        Search._check_round_decimal(round_decimal)
+        if self.vector_index is not None:
+            return (
+                await asyncio.to_thread(
+                    self.vector_index.search,
+                    np.asarray([vector], dtype=np.float32),
+                    top_k=top_k,
+                    narrow_field=narrow_field,
+                    detailed_field=detailed_field,
+                    round_decimal=round_decimal,
+                )
+            )[0]
+
+        response = await self.opensearch.search(
+            index=_INDEX,
+            body=Search._build_knn_query(
+                vector=vector,
+                narrow_field=narrow_field,
+                detailed_field=detailed_field,
+                top_k=top_k,
+                num_candidates=num_candidates,
+            ),
+            _source_includes=["title"],
+        )
+        return Search._parse_knn_hits(response, round_decimal)
+
+    @timed
+    async def search_titles_with_vectors(
+        self,
+        vectors: List[List[float]],
+        narrow_field: str = None,
+        detailed_field: str = None,
+        top_k: int = 10,
+        num_candidates: int = 100,
+        round_decimal: int = 3,
+    ) -> List[List[UIDwithScore]]:
+        """
+        Runs one kNN search per vector in a single `msearch` round trip.
+
+        See `Search.search_titles_with_vectors`.
+        """
+        Search._check_round_decimal(round_decimal)
+        if not vectors:
+            return []
+        if self.vector_index is not None:
+            return await asyncio.to_thread(
+                self.vector_index.search,
+                np.asarray(vectors, dtype=np.float32),
+                top_k=top_k,
+                narrow_field=narrow_field,
+                detailed_field=detailed_field,
+                round_decimal=round_decimal,
+            )
+
+        response = await self.opensearch.msearch(
+            body=Search._build_knn_msearch_body(
+                vectors=vectors,
+                narrow_field=narrow_field,
+                detailed_field=detailed_field,
+                top_k=top_k,
+                num_candidates=num_candidates,
+            )
+        )
+        return Search._parse_knn_msearch(response, round_decimal)
+
+    @timed
+    async def search_documents_with_vector(
+        self,
+        vector: List[float],
+        narrow_field: str = None,
+        detailed_field: str = None,
+        top_k: int = 10,
+        num_candidates: int = 100,
+    ) -> List[Document]:
+        """
+        Searches for the documents nearest to the given vector and returns them in full.
+        """
+        if self.vector_index is not None:
+            hits = await self.search_title_with_vector(
+                vector, narrow_field, detailed_field, top_k, num_candidates
+            )
+            documents = await self.get_documents(uids=[x.uid for x in hits])
+            return [documents[x.uid] for x in hits if x.uid in documents]
+
+        response = await self.opensearch.search(
+            index=_INDEX,
+            body=Search._build_knn_query(
+                vector=vector,
+                narrow_field=narrow_field,
+                detailed_field=detailed_field,
+                top_k=top_k,
+                num_candidates=num_candidates,
+            ),
+            _source_excludes=_DOCUMENT_SOURCE_EXCLUDES,
+        )
+        return [Document(**x["_source"]) for x in response["hits"]["hits"]]
+
+    @timed
+    async def get_document_with_id(self, uid: str) -> Document:
+        """
+        Retrieves the document with the given ID.
+        """
+        if self.doc_store is not None and uid in self.doc_store:
+            return self.doc_store.get_documents([uid])[0][uid]
+        document = self.document_cache.get(uid)
+        if document is not None:
+            return document
+        response = await self.opensearch.get(
+            index=_INDEX,
+            id=uid,
+            _source_excludes=_DOCUMENT_SOURCE_EXCLUDES,
+        )
+        document = Document(**response["_source"])
+        self.document_cache.set(uid, document)
+        return document
+
+    @timed
+    async def get_documents(self, uids: List[str]) -> Dict[str, Document]:
+        """
+        Retrieves several documents in at most one `mget` round trip.
+
+        See `Search.get_documents`.
+        """
+        if not uids:
+            return {}
+
+        documents, missing = Search._read_doc_store(self.doc_store, uids)
+        missing = Search._read_document_cache(self.document_cache, documents, missing)
+        if missing:
+            response = await self.opensearch.mget(
+                index=_INDEX,
+                body={"ids": missing},
+                _source_excludes=_DOCUMENT_SOURCE_EXCLUDES,
+            )
+            documents.update(Search._cache_documents(self.document_cache, Search._parse_documents(response)))
+        return Search._order_documents(documents, uids)
+
+    async def get_document_only_embedding(self, uid: str) -> UIDwithEmbedding:
+        """
+        Retrieves the document embedding with the given ID.
+        """
+        vector = (await self.get_embedding_vectors(uids=[uid]))[uid]
+        return UIDwithEmbedding(uid=uid, embedding=vector.tolist())
+
+    async def get_documents_only_embedding(
+        self, uids: List[str]
+    ) -> List[UIDwithEmbedding]:
+        """
+        Retrieves the embeddings of several documents in at most one `mget` round trip.
+
+        See `Search.get_documents_only_embedding`.
+        """
+        vectors = await self.get_embedding_vectors(uids=uids)
+        return [UIDwithEmbedding(uid=uid, embedding=vectors[uid].tolist()) for uid in uids]
+
+    @timed
+    async def get_embedding_vectors(self, uids: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Retrieves document embeddings as float32 arrays, reading through the embedding cache.
+
+        See `Search.get_embedding_vectors`.
+        """
+        vectors, missing = Search._get_cached_vectors(self.embedding_cache, uids)
+        missing = Search._read_vector_index(self.vector_index, vectors, missing)
+        if missing:
+            response = await self.opensearch.mget(
+                index=_INDEX,
+                body={"ids": missing},
+                _source_includes=["embedding"],
+            )
+            vectors.update(Search._cache_embeddings(self.embedding_cache, response))
+        return vectors
+
+    @timed
+    async def get_document_similarity_network(
+        self,
+        uid: str,
+        layer: int = 2,
+        n_results: int = 5,
+        narrow_field: str = None,
+        detailed_field: str = None,
+        num_candidates: int = None,
+        symmetric: bool = False,
+        deadline_ms: float = None,
+        analytics: bool = False,
+    ) -> Tuple[List[Node], List[Edge], Dict[str, Document], bool]:
+        """
+        Retrieves the document similarity network.
+
+        Same output as `Search.get_document_similarity_network`. Each layer's
+        documents are hydrated concurrently with the fetch of its embeddings,
+        so hydration adds no round trip of its own to the critical path.
+        Results are shared with `Search` through the network cache.
+        """
+        key = Search._network_key(
+            uid, layer, n_results, narrow_field, detailed_field, num_candidates, symmetric
+        )
+        build = functools.partial(
+            self._build_document_similarity_network,
+            uid=uid,
+            layer=layer,
+            n_results=n_results,
+            narrow_field=narrow_field,
+            detailed_field=detailed_field,
+            num_candidates=num_candidates,
+            symmetric=symmetric,
+        )
+        if deadline_ms is None:
+            network = await self.network_cache.aget_or_compute(key, build)
+        else:
+            network = self.network_cache.get(key)
+            if network is None:
+                network = await build(deadline_ms=deadline_ms)
+                if not network[3]:
+                    self.network_cache.set(key, network)
+        if analytics:
+            # PageRank and community detection are CPU-bound; they run off the event loop.
+            return await asyncio.to_thread(Search._analyze_network, self.network_cache, key, network, symmetric)
+        return network
+
+    async def _build_document_similarity_network(
+        self,
+        uid: str,
+        layer: int,
+        n_results: int,
+        narrow_field: str = None,
+        detailed_field: str = None,
+        num_candidates: int = None,
+        symmetric: bool = False,
+        deadline_ms: float = None,
+    ) -> Tuple[List[Node], List[Edge], Dict[str, Document], bool]:
+        node_list: List[Node] = []
+        edge_list: List[Edge] = []
+        documents: Dict[str, Document] = {}
+        truncated = False
+        async for chunk in self.iter_document_similarity_network(
+            uid=uid,
+            layer=layer,
+            n_results=n_results,
+            narrow_field=narrow_field,
+            detailed_field=detailed_field,
+            num_candidates=num_candidates,
+            symmetric=symmetric,
+            deadline_ms=deadline_ms,
+        ):
+            node_list += chunk.nodes
+            edge_list += chunk.edges
+            documents.update(chunk.documents)
+            truncated |= chunk.truncated
+        return node_list, edge_list, documents, truncated
+
+    async def iter_document_similarity_network(
+        self,
+        uid: str,
+        layer: int = 2,
+        n_results: int = 5,
+        narrow_field: str = None,
+        detailed_field: str = None,
+        num_candidates: int = None,
+        symmetric: bool = False,
+        deadline_ms: float = None,
+    ) -> AsyncIterator[NetworkChunk]:
+        """
+        Expands the document similarity network one layer at a time.
+
+        Each chunk holds one layer: its new nodes, their documents and the
+        edges leading to them from the previous layer. Concatenating the
+        chunks gives `get_document_similarity_network`'s result; unlike that
+        method, this one does not go through the network cache.
+
+        With `deadline_ms`, the layer being expanded when the budget runs out
+        is dropped, its kNN search cancelled, and the last chunk is flagged
+        as truncated.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if deadline_ms is None else loop.time() + deadline_ms / 1000
+        graph = SimilarityGraph(symmetric=symmetric)
+        graph.add_node(uid, layer=0)
+        frontier = [uid]
+        # Node and edge ids already sent; each chunk covers what was added since.
+        nodes_sent = edges_sent = 0
+
+        for i in range(layer + 2):
+            if not frontier:
+                if graph.num_edges > edges_sent:
+                    yield NetworkChunk(layer=i, edges=graph.edge_models(edges_sent))
+                break
+            # Past the deadline, the frontier is sent as the last layer.
+            expired = i <= layer and deadline is not None and loop.time() >= deadline
+            neighbours = None
+            if i <= layer and not expired:
+                neighbours = Search._read_knn_graph(
+                    self.knn_graph, frontier, n_results, narrow_field, detailed_field
+                )
+            if i > layer or expired or neighbours is not None:
+                documents = await self.get_documents(uids=frontier)
+            else:
+                vectors, documents = await asyncio.gather(
+                    self.get_embedding_vectors(uids=frontier),
+                    self.get_documents(uids=frontier),
+                )
+            yield NetworkChunk(
+                layer=i,
+                nodes=graph.node_models(nodes_sent),
+                edges=graph.edge_models(edges_sent),
+                documents=documents,
+                truncated=expired,
+            )
+            if i > layer or expired:
+                break
+            nodes_sent, edges_sent = len(graph), graph.num_edges
+
+            if neighbours is not None:
+                frontier = graph.expand_pairs(frontier, neighbours, layer=i + 1)
+                continue
+            try:
+                async with asyncio.timeout_at(deadline) if deadline is not None else contextlib.nullcontext():
+                    results: List[List[UIDwithScore]] = await self.search_titles_with_vectors(
+                        vectors=[vectors[x].tolist() for x in frontier],
+                        narrow_field=narrow_field,
+                        detailed_field=detailed_field,
+                        top_k=n_results,
+                        num_candidates=num_candidates or n_results,
+                    )
+            except TimeoutError:
+                yield NetworkChunk(layer=i + 1, truncated=True)
+                break
+            frontier = graph.expand(frontier, results, layer=i + 1)
+
+    def iter_document_similarity_networks(
+        self,
+        uids: Sequence[str],
+        layer: int = 2,
+        n_results: int = 5,
+        narrow_field: str = None,
+        detailed_field: str = None,
+        num_candidates: int = None,
+        symmetric: bool = False,
+        batch_size: int = 64,
+        analytics: bool = False,
+    ) -> AsyncIterator[Tuple[str, Tuple[List[Node], List[Edge], Dict[str, Document], bool]]]:
+        """
+        Builds the similarity network of each of several seeds, sharing the work between them.
+
+        See `Search.iter_document_similarity_networks`. The bulk requests of
+        a step are sent concurrently.
+        """
+        return self._run_plan(
+            Search._plan_networks(
+                self.network_cache,
+                self.knn_graph,
+                uids,
+                layer,
+                n_results,
+                narrow_field,
+                detailed_field,
+                num_candidates,
+                symmetric,
+                batch_size,
+                analytics,
+            )
+        )
+
+    @timed
+    async def get_merged_similarity_network(
+        self,
+        uids: Sequence[str],
+        layer: int = 2,
+        n_results: int = 5,
+        narrow_field: str = None,
+        detailed_field: str = None,
+        num_candidates: int = None,
+        symmetric: bool = False,
+        analytics: bool = False,
+    ) -> Tuple[List[Node], List[Edge], Dict[str, Document], bool]:
+        """
+        Builds one similarity network from several seeds.
+
+        See `Search.get_merged_similarity_network`.
+        """
+        seeds = list(dict.fromkeys(uids))
+
+        async def build() -> Tuple[List[Node], List[Edge], Dict[str, Document], bool]:
+            plan = Search._plan_merged_network(
+                self.knn_graph, seeds, layer, n_results, narrow_field, detailed_field, num_candidates, symmetric
+            )
+            (network,) = [x async for x in self._run_plan(plan)]
+            return network
+
+        key = Search._network_key(
+            seeds, layer, n_results, narrow_field, detailed_field, num_candidates, symmetric
+        )
+        network = await self.network_cache.aget_or_compute(key, build)
+        if analytics:
+            return await asyncio.to_thread(Search._analyze_network, self.network_cache, key, network, symmetric)
+        return network
+
+    async def _run_plan(self, plan: _Plan) -> AsyncIterator[Any]:
+        # Performs the steps of `plan`, the bulk requests of a step concurrently, yielding what it emits.
+        reply = None
+        try:
+            while True:
+                try:
+                    kind, argument = plan.send(reply)
+                except StopIteration:
+                    return
+                reply = None
+                if kind == "emit":
+                    yield argument
+                elif kind == "vectors":
+                    reply = {}
+                    for part in await asyncio.gather(
+                        *(self.get_embedding_vectors(uids=chunk) for chunk in _bulk_chunks(argument))
+                    ):
+                        reply.update(part)
+                elif kind == "knn":
+                    params = dict(argument)
+                    parts = await asyncio.gather(
+                        *(
+                            self.search_titles_with_vectors(vectors=chunk, **params)
+                            for chunk in _bulk_chunks(params.pop("vectors"))
+                        )
+                    )
+                    reply = [result for part in parts for result in part]
+                elif kind == "documents":
+                    reply = await self._get_documents_in_bulk(argument)
+                elif kind == "analyze":
+                    reply = await asyncio.to_thread(Search._analyze_network, self.network_cache, *argument)
+                elif kind == "search":
+                    reply = await self.opensearch.search(body=argument)
+                else:
+                    raise ValueError(f"Unknown plan step {kind!r}")
+        finally:
+            plan.close()
+
+    async def _get_documents_in_bulk(self, uids: List[str]) -> Dict[str, Document]:
+        parts = await asyncio.gather(*(self.get_documents(uids=chunk) for chunk in _bulk_chunks(uids)))
+        documents: Dict[str, Document] = {}
+        for part in parts:
+            documents.update(part)
+        return documents
+
+    async def export_documents(
+        self,
+        narrow_field: str = None,
+        detailed_field: str = None,
+        year: int = None,
+        fields: List[str] = None,
+        embeddings: bool = False,
+        batch_size: int = 1000,
+        slices: int = 1,
+        keep_alive: str = _EXPORT_KEEP_ALIVE,
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Streams every matching document, a page at a time, from a point in time.
+
+        See `Search.export_documents`; slices are paged by concurrent tasks
+        instead of threads.
+        """
+        body = Search._build_export_body(narrow_field, detailed_field, year, fields, embeddings, batch_size)
+        pit_id = (await self.opensearch.create_pit(index=_INDEX, keep_alive=keep_alive))["pit_id"]
+        try:
+            if slices > 1:
+                pages = self._export_slices(body, pit_id, keep_alive, slices)
+            else:
+                pages = self._run_plan(Search._plan_export_slice(body, pit_id, keep_alive))
+            async with contextlib.aclosing(pages):
+                async for page in pages:
+                    yield page
+        finally:
+            await self._delete_pit(pit_id)
+
+    async def _export_slices(
+        self, body: Dict[str, Any], pit_id: str, keep_alive: str, slices: int
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        pages: asyncio.Queue = asyncio.Queue(maxsize=slices)
+
+        async def run(slice_id: int) -> None:
+            try:
+                plan = Search._plan_export_slice(body, pit_id, keep_alive, slice_id, slices)
+                async for page in self._run_plan(plan):
+                    await pages.put(page)
+            except Exception as e:
+                await pages.put(e)
+                return
+            await pages.put(None)
+
+        tasks = [asyncio.create_task(run(i)) for i in range(slices)]
+        try:
+            running = slices
+            while running:
+                item = await pages.get()
+                if item is None:
+                    running -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _delete_pit(self, pit_id: str) -> None:
+        try:
+            await self.opensearch.delete_pit(body={"pit_id": [pit_id]})
+        except TransportError:
+            # It expires after `keep_alive` anyway.
+            logger.warning("Could not delete point in time %s", pit_id, exc_info=True)
+
+    async def get_total_documents(self) -> Dict[str, int]:
+        """
+        Retrieves the total number of documents in the index.
+        """
+        response = await self.opensearch.count(index=_INDEX)
+        return {"count": response["count"]}
+
+    async def get_top_field_count(
+        self,
+        year: int,
+        bucket_size: int = 10,
+    ) -> Dict[str, List[Dict[str, Union[str, int]]]]:
+        """
+        Retrieves the top field counts for various fields in the search index.
+
+        See `Search.get_top_field_count`.
+        """
+        return (await self.get_top_field_counts(years=[year], bucket_size=bucket_size))[year]
+
+    async def get_top_field_counts(
+        self,
+        years: List[int],
+        bucket_size: int = 10,
+    ) -> Dict[int, Dict[str, List[Dict[str, Union[str, int]]]]]:
+        """
+        Retrieves the top field counts of several years in a single search request.
+
+        See `Search.get_top_field_counts`.
+        """
+        if not years:
+            return {}
+
+        response = await self.opensearch.search(
+            index=_INDEX,
+            body=Search._build_top_field_query(years=years, bucket_size=bucket_size),
+        )
+        return Search._parse_top_field_counts(response, years)
+
+    async def get_institution_department_stats(
+        self, year: int
+    ) -> List[Dict[str, Union[str, int]]]:
+        """
+        Retrieves the statistics of institutions and departments based on the specified year.
+        """
+        response = await self.opensearch.search(
+            index=_INDEX,
+            body=Search._build_institution_department_query(year=year),
+        )
+        return Search._parse_institution_department(response["aggregations"])
+
+    @timed
+    async def search_title(self, search_string: str) -> List[Document]:
+        """
+        Searches for documents with a matching title.
+        """
+        response = await self.opensearch.search(
+            index=_INDEX,
+            body=Search._build_title_query(search_string),
+            _source_excludes=_DOCUMENT_SOURCE_EXCLUDES,
+        )
+        return [Document(**x["_source"]) for x in response["hits"]["hits"]]
+
+    @timed
+    async def search_title_hybrid(
+        self,
+        search_string: str,
+        vector: Optional[List[float]] = None,
+        size: int = 10,
+        search_after: Optional[str] = None,
+        rank_window_size: int = 100,
+        rank_constant: int = 60,
+        num_candidates: int = 100,
+    ) -> TitleSearchPage:
+        """
+        Searches titles lexically and by vector, fusing both rankings with reciprocal rank fusion.
+
+        Same output as `Search.search_title_hybrid`.
+        """
+        response = await self.opensearch.msearch(
+            body=Search._build_hybrid_msearch_body(
+                search_string, vector, rank_window_size, num_candidates
+            )
+        )
+        return Search._page_hybrid(
+            Search._parse_hybrid_msearch(response, rank_constant), size, search_after
+        )
+
+
+@functools.lru_cache(maxsize=None)
+def get_async_search() -> AsyncSearch:
+    """
+    Returns the process-wide `AsyncSearch`, built on the first call.
+    """
+    return AsyncSearch()
@@ -0,0 +1,675 @@
+import asyncio
+import contextlib
+import fcntl
+import functools
+import hashlib
+import json
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    In-process LRU cache of document embeddings keyed by uid.
+
+    Vectors are stored as float32 arrays and evicted least-recently-used
+    first once their total size exceeds `max_bytes`. A budget of 0 disables
+    the cache.
+
+    With a `shared` backend, e.g. a `SharedMemoryBackend` that every worker
+    process maps, misses are looked up there and stored vectors are written
+    there too, so a vector fetched by one worker is a hit in all of them.
+    """
+
+    def __init__(self, max_bytes: int, shared: Optional["CacheBackend"] = None) -> None:
+        """
+        Initializes the EmbeddingCache class.
+
+        Args:
+            max_bytes (int): The memory budget for the stored vectors, in bytes.
+            shared (CacheBackend, optional): A second tier shared between processes. Defaults to None.
+        """
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self._vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, uid: str) -> Optional[np.ndarray]:
+        """
+        Returns the cached vector for `uid`, or None on a miss.
+        """
+        with self._lock:
+            vector = self._vectors.get(uid)
+            if vector is not None:
+                self._vectors.move_to_end(uid)
+                self.hits += 1
+                return vector
+        value = self.shared.get(uid) if self.shared is not None else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.shared_hits += 1
+        vector = np.frombuffer(value, dtype=np.float32)
+        self._insert(uid, vector)
+        return vector
+
+    def get_many(self, uids: Iterable[str]) -> Dict[str, np.ndarray]:
+        """
+        Returns the cached vectors among `uids`; misses are left out.
+        """
+        return {
+            uid: vector
+            for uid, vector in ((uid, self.get(uid)) for uid in uids)
+            if vector is not None
+        }
+
+    def put(self, uid: str, vector: Iterable[float]) -> np.ndarray:
+        """
+        Stores `vector` for `uid` as float32 and evicts until within budget.
+
+        Returns:
+            np.ndarray: The stored float32 vector.
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        if self.shared is not None:
+            # No expiry: embeddings only change with a reindex, after which
+            # DELETE /document/similarity/cache clears this tier with `clear`.
+            self.shared.set(uid, vector.tobytes(), ttl=float("inf"))
+        self._insert(uid, vector)
+        return vector
+
+    def _insert(self, uid: str, vector: np.ndarray) -> None:
+        if self.max_bytes <= 0 or vector.nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._vectors.pop(uid, None)
+            if previous is not None:
+                self._bytes -= previous.nbytes
+            self._vectors[uid] = vector
+            self._bytes += vector.nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._vectors.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """
+        Drops every cached vector, in the shared tier too. Counters are kept.
+        """
+        with self._lock:
+            self._vectors.clear()
+            self._bytes = 0
+        if self.shared is not None:
+            self.shared.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the hit/miss/eviction counters and the current footprint.
+        """
+        with self._lock:
+            stats = {
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._vectors),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+        if self.shared is not None:
+            stats["shared_entries"] = len(self.shared)
+        return stats
+
+
+class CacheBackend:
+    """
+    Storage interface for `ResultCache`. Values are stored with an absolute
+    expiry time and `get` returns None once they have expired.
+    """
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    In-process backend that keeps at most `max_entries` values, evicting the
+    least recently used first.
+    """
+
+    def __init__(self, max_entries: int = 1024) -> None:
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DiskCacheBackend(CacheBackend):
+    """
+    On-disk backend that survives restarts. Each value is pickled to its own
+    file, written to a temporary name and renamed into place so readers never
+    see a partial file. Once more than `max_entries` files exist, the oldest
+    are removed.
+    """
+
+    _SUFFIX = ".pkl"
+
+    def __init__(self, directory: str, max_entries: int = 1024) -> None:
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest + self._SUFFIX)
+
+    def _files(self) -> List[str]:
+        return [
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.endswith(self._SUFFIX)
+        ]
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                stored_key, expires_at, value = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        if stored_key != key:
+            return None
+        if expires_at < time.time():
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            return None
+        return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((key, time.time() + ttl, value), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+            raise
+        self._evict()
+
+    def _evict(self) -> None:
+        files = self._files()
+        if len(files) <= self.max_entries:
+            return
+        files.sort(key=lambda path: os.stat(path).st_mtime)
+        for path in files[: len(files) - self.max_entries]:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+    def clear(self) -> None:
+        for path in self._files():
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+    def __len__(self) -> int:
+        return len(self._files())
+
+
+class SharedMemoryBackend(CacheBackend):
+    """
+    Backend shared by every process on the host, without a server: a table
+    of `slots` fixed-size slots in a memory-mapped file, normally on a tmpfs
+    such as /dev/shm.
+
+    A key hashes to one slot and replaces whatever was stored there, so the
+    table never grows and eviction is free. Each slot holds a sequence
+    number, a length and the pickled (key, expiry, value); values that do
+    not fit in `slot_size` are not stored.
+
+    Writers serialize on a `flock` of the file and make the sequence number
+    odd while they write. Readers never wait: a slot whose sequence number
+    was odd, or changed while it was copied, reads as a miss, so a torn
+    value is never returned.
+
+    The file name carries the table's geometry, so processes configured
+    with other sizes use another file, and a file is only ever grown, never
+    truncated under a process that has it mapped. Values are pickled, so
+    the file is private to its owner: one with looser permissions or owned
+    by another user is refused.
+    """
+
+    _HEADER = struct.Struct("<QI")
+
+    def __init__(self, path: str, slots: int = 16384, slot_size: int = 4096) -> None:
+        """
+        Initializes the SharedMemoryBackend class, creating the file if needed.
+
+        Args:
+            path (str): The table file, suffixed with the geometry; processes opening the same path and geometry share the table.
+            slots (int, optional): The number of slots. Defaults to 16384.
+            slot_size (int, optional): The size of a slot in bytes, header included. Defaults to 4096.
+        """
+        root, ext = os.path.splitext(path)
+        self.path = f"{root}.{slots}x{slot_size}{ext}"
+        self.slots = slots
+        self.slot_size = slot_size
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), mode=0o700, exist_ok=True)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            self._check_private()
+            size = slots * slot_size
+            # flock excludes other processes; threads of this one share the descriptor.
+            self._lock = threading.Lock()
+            with self._locked():
+                if os.fstat(self._fd).st_size < size:
+                    # Allocated up front: a full tmpfs fails here rather than
+                    # with SIGBUS on a later write. Allocating only extends the
+                    # file, so a racing process that mapped it is unaffected.
+                    os.posix_fallocate(self._fd, 0, size)
+            self._map = mmap.mmap(self._fd, size)
+        except BaseException:
+            os.close(self._fd)
+            raise
+
+    def _check_private(self) -> None:
+        stat = os.fstat(self._fd)
+        if stat.st_uid != os.getuid():
+            raise PermissionError(f"{self.path} is owned by another user")
+        if stat.st_mode & 0o077:
+            raise PermissionError(f"{self.path} is readable or writable by other users")
+
+    def _offset(self, key: str) -> int:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "little") % self.slots * self.slot_size
+
+    def get(self, key: str) -> Optional[Any]:
+        offset = self._offset(key)
+        sequence, length = self._HEADER.unpack_from(self._map, offset)
+        if length == 0 or sequence & 1:
+            return None
+        start = offset + self._HEADER.size
+        payload = self._map[start : start + length]
+        if self._HEADER.unpack_from(self._map, offset)[0] != sequence:
+            return None
+        try:
+            stored_key, expires_at, value = pickle.loads(payload)
+        except Exception:
+            return None
+        if stored_key != key or expires_at < time.time():
+            return None
+        return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        payload = pickle.dumps((key, time.time() + ttl, value), pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.slot_size - self._HEADER.size:
+            return
+        offset = self._offset(key)
+        start = offset + self._HEADER.size
+        with self._locked():
+            sequence = self._HEADER.unpack_from(self._map, offset)[0]
+            self._HEADER.pack_into(self._map, offset, sequence + 1, 0)
+            self._map[start : start + len(payload)] = payload
+            self._HEADER.pack_into(self._map, offset, sequence + 2, len(payload))
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def clear(self) -> None:
+        with self._locked():
+            for offset in range(0, self.slots * self.slot_size, self.slot_size):
+                sequence, length = self._HEADER.unpack_from(self._map, offset)
+                if length:
+                    self._HEADER.pack_into(self._map, offset, sequence + 2, 0)
+
+    def __len__(self) -> int:
+        # The length field of every slot, read as one strided view.
+        lengths = np.ndarray(
+            shape=(self.slots,), dtype="<u4", buffer=self._map, offset=8, strides=(self.slot_size,)
+        )
+        return int(np.count_nonzero(lengths))
+
+
+class _Call:
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class ResultCache:
+    """
+    TTL cache for pure, expensive results with request coalescing.
+
+    Concurrent misses on the same key are single-flighted: one caller
+    computes the value and the others wait for it, whether they come from
+    threads (`get_or_compute`) or coroutines (`aget_or_compute`). Coroutines
+    share a task, so a caller that is cancelled stops waiting without
+    cancelling the computation for the others.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: float) -> None:
+        """
+        Initializes the ResultCache class.
+
+        Args:
+            backend (CacheBackend): Where the values are stored.
+            ttl (float): How long a value stays valid, in seconds. 0 disables caching.
+        """
+        self.backend = backend
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._tasks: Dict[str, "asyncio.Task[Any]"] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        return json.dumps(parts, ensure_ascii=False, separators=(",", ":"))
+
+    def _lookup(self, key: str) -> Optional[Any]:
+        if self.ttl <= 0:
+            return None
+        value = self.backend.get(key)
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+        return value
+
+    def _store(self, key: str, value: Any) -> None:
+        if self.ttl > 0:
+            self.backend.set(key, value, self.ttl)
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Returns the cached value for `key`, or None on a miss.
+        """
+        value = self._lookup(key)
+        if value is None and self.ttl > 0:
+            with self._lock:
+                self.misses += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        Stores `value` for `key`, for values computed outside `get_or_compute`.
+        """
+        self._store(key, value)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        """
+        Returns the cached value for `key`, computing it with `compute` on a miss.
+        """
+        value = self._lookup(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = compute()
+            self._store(key, call.value)
+            return call.value
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    async def aget_or_compute(
+        self, key: str, compute: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        Returns the cached value for `key`, awaiting `compute()` on a miss.
+        """
+        value = self._lookup(key)
+        if value is not None:
+            return value
+
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(self._acompute(key, compute))
+            task.add_done_callback(functools.partial(self._forget_task, key))
+            with self._lock:
+                self.misses += 1
+        else:
+            with self._lock:
+                self.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def _acompute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        value = await compute()
+        self._store(key, value)
+        return value
+
+    def _forget_task(self, key: str, task: "asyncio.Task[Any]") -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # Retrieves the exception even when every caller was cancelled before it.
+        if not task.cancelled():
+            task.exception()
+
+    def invalidate(self) -> None:
+        """
+        Drops every cached value, e.g. after the index has been rebuilt.
+        """
+        self.backend.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the hit/miss/coalesced counters and the number of stored entries.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "entries": len(self.backend),
+        }
+
+
+def _shared_cache_dir() -> Optional[str]:
+    # Set in multi-worker deployments, e.g. to /dev/shm/ndltd; unset keeps every cache in-process.
+    return os.getenv("SHARED_CACHE_DIR") or None
+
+
+def init_result_cache(
+    prefix: str,
+    ttl: float,
+    directory: str,
+    shared_backend: str = "disk",
+    slots: int = 16384,
+    slot_size: int = 4096,
+) -> ResultCache:
+    """
+    Builds a result cache from the `<prefix>_CACHE_*` environment variables.
+
+    When SHARED_CACHE_DIR is set, the cache defaults to `shared_backend` in
+    a subdirectory of it, so that all workers on the host share it.
+
+    Args:
+        prefix (str): The environment variable prefix, e.g. "NETWORK".
+        ttl (float): The default time to live, in seconds.
+        directory (str): The default directory of the disk backend.
+        shared_backend (str, optional): The default backend when SHARED_CACHE_DIR is set, "disk" or "shm". Defaults to "disk".
+        slots (int, optional): The default number of slots of the shm backend. Defaults to 16384.
+        slot_size (int, optional): The default slot size of the shm backend, in bytes. Defaults to 4096.
+    """
+    SHARED_CACHE_DIR = _shared_cache_dir()
+    if SHARED_CACHE_DIR is not None:
+        directory = os.path.join(SHARED_CACHE_DIR, prefix.lower())
+    CACHE_BACKEND = os.getenv(
+        f"{prefix}_CACHE_BACKEND", shared_backend if SHARED_CACHE_DIR is not None else "memory"
+    )
+    CACHE_TTL = float(os.getenv(f"{prefix}_CACHE_TTL", str(ttl)))
+    CACHE_MAX_ENTRIES = int(os.getenv(f"{prefix}_CACHE_MAX_ENTRIES", "1024"))
+    CACHE_DIR = os.getenv(f"{prefix}_CACHE_DIR", directory)
+    CACHE_SLOTS = int(os.getenv(f"{prefix}_CACHE_SLOTS", str(slots)))
+    CACHE_SLOT_SIZE = int(os.getenv(f"{prefix}_CACHE_SLOT_SIZE", str(slot_size)))
+
+    if CACHE_BACKEND == "memory":
+        backend = MemoryCacheBackend(max_entries=CACHE_MAX_ENTRIES)
+    elif CACHE_BACKEND == "disk":
+        backend = DiskCacheBackend(directory=CACHE_DIR, max_entries=CACHE_MAX_ENTRIES)
+    elif CACHE_BACKEND == "shm":
+        backend = SharedMemoryBackend(
+            path=os.path.join(CACHE_DIR, "cache.shm"), slots=CACHE_SLOTS, slot_size=CACHE_SLOT_SIZE
+        )
+    else:
+        raise ValueError(f"Currently only support memory, disk, shm, but got {CACHE_BACKEND}")
+    return ResultCache(backend=backend, ttl=CACHE_TTL)
+
+
+def init_embedding_cache() -> EmbeddingCache:
+    """
+    Builds the embedding cache from the environment, with a shared-memory
+    tier under SHARED_CACHE_DIR when that is set.
+    """
+    EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    SHARED_CACHE_DIR = _shared_cache_dir()
+    shared = None
+    if SHARED_CACHE_DIR is not None:
+        # 768 float32s and their key fit in 4 KiB.
+        EMBEDDING_SHARED_SLOTS = int(
+            os.getenv("EMBEDDING_SHARED_SLOTS", str(max(EMBEDDING_CACHE_MAX_BYTES // 4096, 1)))
+        )
+        shared = SharedMemoryBackend(
+            path=os.path.join(SHARED_CACHE_DIR, "embedding", "cache.shm"),
+            slots=EMBEDDING_SHARED_SLOTS,
+            slot_size=4096,
+        )
+    return EmbeddingCache(max_bytes=EMBEDDING_CACHE_MAX_BYTES, shared=shared)
+
+
+def init_network_cache() -> ResultCache:
+    """
+    Builds the similarity-network result cache from the environment.
+    """
+    return init_result_cache("NETWORK", ttl=3600, directory=".cache/network")
+
+
+def init_summary_cache() -> ResultCache:
+    """
+    Builds the generated-summary result cache from the environment.
+    """
+    return init_result_cache("SUMMARY", ttl=7 * 24 * 3600, directory=".cache/summary")
+
+
+def init_document_cache() -> ResultCache:
+    """
+    Builds the per-document metadata cache from the environment.
+    """
+    # Most documents, abstract included, pickle to under 16 KiB; 8192 slots take 128 MiB.
+    return init_result_cache(
+        "DOCUMENT",
+        ttl=3600,
+        directory=".cache/document",
+        shared_backend="shm",
+        slots=8192,
+        slot_size=16384,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_embedding_cache() -> EmbeddingCache:
+    """
+    Returns the process-wide embedding cache, built on the first call.
+    """
+    return init_embedding_cache()
+
+
+@functools.lru_cache(maxsize=None)
+def get_network_cache() -> ResultCache:
+    """
+    Returns the process-wide similarity-network cache, built on the first call.
+    """
+    return init_network_cache()
+
+
+@functools.lru_cache(maxsize=None)
+def get_summary_cache() -> ResultCache:
+    """
+    Returns the process-wide summary cache, built on the first call.
+    """
+    return init_summary_cache()
+
+
+@functools.lru_cache(maxsize=None)
+def get_document_cache() -> ResultCache:
+    """
+    Returns the process-wide document cache, built on the first call.
+    """
+    return init_document_cache()
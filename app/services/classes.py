@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Dict
+from pydantic import BaseModel, Field
+from typing import Any, List, Dict, Literal
 
 class UIDwithScore(BaseModel):
     uid: str
@@ -40,8 +40,82 @@ class Node(BaseModel):
     layer: int
 
 
+class AnalyzedNode(Node):
+    """
+    A node of a network requested with `analytics`; see
+    `app.services.graph_analytics.analyze`.
+    """
+    weighted_degree: float
+    pagerank: float
+    component: int
+    community: int
+
+
 class NetworkData(BaseModel):
     nodes: List[Node]
     edges: List[Edge]
     documents: Dict[str, Document]
+    truncated: bool = False
+
+
+class AnalyzedNetworkData(NetworkData):
+    nodes: List[AnalyzedNode]
+
+
+class CompactNetworkData(BaseModel):
+    """
+    `NetworkData` as parallel arrays. Node i is `uids[i]` at `layers[i]`;
+    edge j links `uids[sources[j]]` to `uids[targets[j]]` with `scores[j]`;
+    `documents[field][i]` is that field of node i's document, or None.
+    With `analytics`, `analytics[field][i]` is that analytics field of node i.
+    """
+    uids: List[str]
+    layers: List[int]
+    sources: List[int]
+    targets: List[int]
+    scores: List[float]
+    documents: Dict[str, List[Any]]
+    analytics: Dict[str, List[Any]] | None = None
+    truncated: bool = False
+
+
+class NetworkChunk(BaseModel):
+    layer: int | None = None
+    nodes: List[Node] = []
+    edges: List[Edge] = []
+    documents: Dict[str, Document] = {}
+    truncated: bool = False
+
+
+class NetworkBatchRequest(BaseModel):
+    uids: List[str] = Field(min_length=1, max_length=10000)
+    layer: int = Field(2, ge=0, le=5)
+    n_results: int = Field(5, ge=1, le=100)
+    narrow_field: str | None = None
+    detailed_field: str | None = None
+    num_candidates: int | None = Field(None, ge=1, le=10000)
+    symmetric: bool = False
+    analytics: bool = False
+    merge: bool = False
+    format: Literal["full", "compact"] = "full"
+
+
+class SeedNetwork(BaseModel):
+    """
+    One line of a batch response: a seed and its network.
+    """
+    uid: str
+    network: AnalyzedNetworkData | NetworkData | CompactNetworkData
+
+
+class DocumentBrief(BaseModel):
+    uid: str
+    title: str
+    graduated_academic_year: int | None = None
+    institution: str | None = None
+    score: float
+
 
+class TitleSearchPage(BaseModel):
+    hits: List[DocumentBrief]
+    search_after: str | None = None
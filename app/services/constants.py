@@ -1,18 +1,36 @@
-from langchain_google_genai import HarmBlockThreshold, HarmCategory
-
 _VERSION = "0.0.0"
 
 _SENTENCE_TRANSFORMER_MODEL = "paraphrase-multilingual-mpnet-base-v2"
 
 _INDEX = "ndltd"
 
+_DOCUMENT_SOURCE_EXCLUDES = ["embedding", "advisor", "title_ws", "abstract_ws"]
+
 _API_PREFIX = "/api/v1"
 
+# The shortest timeout given to a round trip made under a deadline, in seconds.
+_MIN_REQUEST_TIMEOUT = 0.05
+
+# Document fields sent with the compact network format; the rest, notably
+# the abstract, are fetched on demand.
+_GRAPH_DOCUMENT_FIELDS = (
+    "title",
+    "author",
+    "degree",
+    "institution",
+    "department",
+    "narrow_field",
+    "detailed_field",
+    "graduated_academic_year",
+)
+
+# HarmCategory -> HarmBlockThreshold member names, resolved when the Gemini
+# SDK is imported on first use.
 _GEMINI_SAFETY_SETTINGS_NONE = {
-    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+    "HARM_CATEGORY_DANGEROUS_CONTENT": "BLOCK_NONE",
+    "HARM_CATEGORY_SEXUALLY_EXPLICIT": "BLOCK_NONE",
+    "HARM_CATEGORY_HATE_SPEECH": "BLOCK_NONE",
+    "HARM_CATEGORY_HARASSMENT": "BLOCK_NONE",
 }
 
 _GEMINI_GENERATION_CONFIG = {
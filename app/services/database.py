@@ -1,22 +1,219 @@
+import asyncio
 import os
+import random
+import time
+from typing import Any, Collection, Mapping, Optional
+
 from dotenv import load_dotenv
+from urllib3 import Timeout
+
+from opensearchpy import (
+    AIOHttpConnection,
+    AsyncOpenSearch,
+    ConnectionError,
+    ConnectionTimeout,
+    OpenSearch,
+    TransportError,
+    Urllib3HttpConnection,
+)
 
-from opensearchpy import OpenSearch
+from app.services.metrics import record_round_trip
 
 load_dotenv()
 
-def init_opensearch():
+
+class RetryPolicy:
+    """
+    When and how long to wait before retrying a failed OpenSearch request.
+
+    Connection errors and the `retry_on_status` responses are retried, and
+    timeouts too when `retry_on_timeout` is set, up to `max_retries` times.
+    The wait before retry n is drawn uniformly from
+    [0, min(max_backoff, backoff * 2**n)] so that clients that failed together
+    do not retry together.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 2,
+        retry_on_timeout: bool = True,
+        retry_on_status: Collection[int] = (429, 502, 503, 504),
+        backoff: float = 0.1,
+        max_backoff: float = 2.0,
+    ) -> None:
+        self.max_retries = max_retries
+        self.retry_on_timeout = retry_on_timeout
+        self.retry_on_status = retry_on_status
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def delay(self, error: TransportError, attempt: int) -> Optional[float]:
+        """
+        Returns the seconds to wait before retrying after `error`, or None to give up.
+        """
+        if attempt >= self.max_retries:
+            return None
+        if isinstance(error, ConnectionTimeout):
+            retry = self.retry_on_timeout
+        elif isinstance(error, ConnectionError):
+            retry = True
+        else:
+            retry = error.status_code in self.retry_on_status
+        if not retry:
+            return None
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+
+def _remaining(deadline: Optional[float], delay: float) -> Optional[float]:
+    # The time left for another attempt once `delay` has been waited, or None for no limit.
+    if deadline is None:
+        return None
+    return deadline - time.monotonic() - delay
+
+
+class RetryingHttpConnection(Urllib3HttpConnection):
+    """
+    Urllib3 connection that retries with `retry_policy` and backoff.
+
+    A per-call timeout (`request_timeout`) bounds all attempts together
+    rather than each one. Every attempt is recorded in the metrics.
+    """
+
+    def __init__(self, *args: Any, retry_policy: RetryPolicy = None, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.retry_policy = retry_policy or RetryPolicy()
+
+    def perform_request(
+        self,
+        method: str,
+        url: str,
+        params: Optional[Mapping[str, Any]] = None,
+        body: Optional[bytes] = None,
+        timeout: Optional[float] = None,
+        ignore: Collection[int] = (),
+        headers: Optional[Mapping[str, str]] = None,
+    ) -> Any:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = super().perform_request(
+                    method, url, params, body, timeout=timeout, ignore=ignore, headers=headers
+                )
+                record_round_trip(url, time.perf_counter() - start, response[2])
+                return response
+            except TransportError as e:
+                record_round_trip(url, time.perf_counter() - start, None)
+                delay = self.retry_policy.delay(e, attempt)
+                if delay is None:
+                    raise
+                timeout = _remaining(deadline, delay)
+                if timeout is not None and timeout <= 0:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+
+
+class AsyncRetryingHttpConnection(AIOHttpConnection):
+    """
+    Aiohttp counterpart of `RetryingHttpConnection`.
+    """
+
+    def __init__(self, *args: Any, retry_policy: RetryPolicy = None, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.retry_policy = retry_policy or RetryPolicy()
+
+    async def perform_request(
+        self,
+        method: str,
+        url: str,
+        params: Optional[Mapping[str, Any]] = None,
+        body: Optional[bytes] = None,
+        timeout: Optional[float] = None,
+        ignore: Collection[int] = (),
+        headers: Optional[Mapping[str, str]] = None,
+    ) -> Any:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = await super().perform_request(
+                    method, url, params, body, timeout=timeout, ignore=ignore, headers=headers
+                )
+                record_round_trip(url, time.perf_counter() - start, response[2])
+                return response
+            except TransportError as e:
+                record_round_trip(url, time.perf_counter() - start, None)
+                delay = self.retry_policy.delay(e, attempt)
+                if delay is None:
+                    raise
+                timeout = _remaining(deadline, delay)
+                if timeout is not None and timeout <= 0:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+
+
+def _opensearch_kwargs() -> dict:
     OS_API_URL = os.getenv("OS_API_URL")
     OS_API_ID = os.getenv("OS_API_USER")
     OS_API_KEY = os.getenv("OS_API_PWD")
+    OS_HTTP_COMPRESS = os.getenv("OS_HTTP_COMPRESS", "true").lower() == "true"
+    OS_MAX_RETRIES = int(os.getenv("OS_MAX_RETRIES", "2"))
+    OS_RETRY_ON_TIMEOUT = os.getenv("OS_RETRY_ON_TIMEOUT", "true").lower() == "true"
+    OS_RETRY_BACKOFF = float(os.getenv("OS_RETRY_BACKOFF", "0.1"))
 
-    os_client = OpenSearch(
+    return dict(
         hosts=OS_API_URL,
         http_auth=(OS_API_ID, OS_API_KEY),
-        http_compress=True,
+        http_compress=OS_HTTP_COMPRESS,
         verify_certs=False,
-        ssl_show_warn=False
+        ssl_show_warn=False,
+        # Retries happen in the connection, with backoff; the transport's own
+        # retry loop would retry immediately.
+        max_retries=0,
+        retry_policy=RetryPolicy(
+            max_retries=OS_MAX_RETRIES,
+            retry_on_timeout=OS_RETRY_ON_TIMEOUT,
+            backoff=OS_RETRY_BACKOFF,
+        ),
+    )
+
+def _timeouts() -> tuple:
+    OS_CONNECT_TIMEOUT = float(os.getenv("OS_CONNECT_TIMEOUT", "5"))
+    OS_READ_TIMEOUT = float(os.getenv("OS_READ_TIMEOUT", "30"))
+    return OS_CONNECT_TIMEOUT, OS_READ_TIMEOUT
+
+def init_opensearch():
+    """
+    Builds the synchronous client. Nothing is sent until the first request.
+    """
+    OS_POOL_MAXSIZE = int(os.getenv("OS_POOL_MAXSIZE", "10"))
+    connect_timeout, read_timeout = _timeouts()
+
+    os_client = OpenSearch(
+        connection_class=RetryingHttpConnection,
+        pool_maxsize=OS_POOL_MAXSIZE,
+        timeout=Timeout(connect=connect_timeout, read=read_timeout),
+        **_opensearch_kwargs(),
     )
     return os_client
 
-os_client = init_opensearch()
\ No newline at end of file
+def init_async_opensearch():
+    """
+    Builds the asyncio client. Its aiohttp connection pool is created on the
+    first request and shared by every coroutine using this client.
+    """
+    OS_ASYNC_POOL_MAXSIZE = int(os.getenv("OS_ASYNC_POOL_MAXSIZE", "100"))
+    # aiohttp takes one timeout for the whole request.
+    connect_timeout, read_timeout = _timeouts()
+
+    os_client = AsyncOpenSearch(
+        connection_class=AsyncRetryingHttpConnection,
+        maxsize=OS_ASYNC_POOL_MAXSIZE,
+        timeout=connect_timeout + read_timeout,
+        **_opensearch_kwargs(),
+    )
+    return os_client
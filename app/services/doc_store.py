@@ -0,0 +1,193 @@
+import argparse
+import functools
+import json
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import numpy as np
+import zstandard
+
+from app.services.classes import Document
+from app.services.constants import _DOCUMENT_SOURCE_EXCLUDES
+
+if TYPE_CHECKING:
+    from app.services.search import Search
+
+_STORE_FORMAT = 1
+
+_CODEC = "zstd"
+
+
+class DocumentStore:
+    """
+    Read-only local copy of every document's metadata.
+
+    Records are grouped `block_size` at a time into zstd-compressed blocks
+    appended to one memory-mapped file; `block_offsets` locates each block
+    and a record's row gives its block and slot. A lookup decompresses one block, kept in a
+    small LRU, and parses only the requested record into a `Document`.
+    """
+
+    def __init__(self, directory: str, cache_blocks: int = 1024) -> None:
+        """
+        Initializes the DocumentStore class from a directory written by `build`.
+
+        Args:
+            directory (str): The store directory.
+            cache_blocks (int, optional): The number of decompressed blocks kept in memory. Defaults to 1024.
+        """
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["format"] != _STORE_FORMAT:
+            raise ValueError(f"Unsupported document store format {meta['format']}")
+
+        self.directory = directory
+        self.codec: str = meta["codec"]
+        self.block_size: int = meta["block_size"]
+        self.uids: List[str] = meta["uids"]
+        self.position: Dict[str, int] = {uid: i for i, uid in enumerate(self.uids)}
+        if self.codec != _CODEC:
+            raise ValueError(f"Unsupported document store codec {self.codec!r}")
+        # A decompressor is not safe for concurrent use, so it has its own lock.
+        self._decompressor = zstandard.ZstdDecompressor()
+        self._decompressor_lock = threading.Lock()
+
+        self.block_offsets: np.ndarray = np.load(os.path.join(directory, "block_offsets.npy"))
+        with open(os.path.join(directory, "documents.bin"), "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.cache_blocks = cache_blocks
+        self._blocks: "OrderedDict[int, List[bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.uids)
+
+    def __contains__(self, uid: str) -> bool:
+        return uid in self.position
+
+    def _block(self, block: int) -> List[bytes]:
+        with self._lock:
+            records = self._blocks.get(block)
+            if records is not None:
+                self._blocks.move_to_end(block)
+                return records
+        start, end = int(self.block_offsets[block]), int(self.block_offsets[block + 1])
+        # Records are single-line JSON, one per line.
+        with self._decompressor_lock:
+            data = self._decompressor.decompress(self._data[start:end])
+        records = data.split(b"\n")
+        with self._lock:
+            self._blocks[block] = records
+            while len(self._blocks) > self.cache_blocks:
+                self._blocks.popitem(last=False)
+        return records
+
+    def get_documents(self, uids: List[str]) -> Tuple[Dict[str, Document], List[str]]:
+        """
+        Looks up several documents.
+
+        Returns:
+            Tuple[Dict[str, Document], List[str]]: The documents found, keyed by ID, and the IDs not in the store.
+        """
+        documents: Dict[str, Document] = {}
+        missing: List[str] = []
+        for uid in uids:
+            row = self.position.get(uid)
+            if row is None:
+                missing.append(uid)
+                continue
+            record = self._block(row // self.block_size)[row % self.block_size]
+            documents[uid] = Document(**json.loads(record))
+        return documents, missing
+
+    @classmethod
+    def build(
+        cls, search: "Search", directory: str, block_size: int = 16, batch_size: int = 1000
+    ) -> "DocumentStore":
+        """
+        Exports every document's metadata from OpenSearch into a new store directory.
+
+        Args:
+            search (Search): The search service to export with.
+            directory (str): The output directory.
+            block_size (int, optional): The number of records compressed together. Defaults to 16.
+            batch_size (int, optional): The number of documents fetched per scroll page. Defaults to 1000.
+
+        Returns:
+            DocumentStore: The loaded store.
+        """
+        os.makedirs(directory, exist_ok=True)
+        compressor = zstandard.ZstdCompressor(level=9)
+
+        uids: List[str] = []
+        offsets = [0]
+        pending: List[bytes] = []
+        with open(os.path.join(directory, "documents.bin"), "wb") as f:
+
+            def flush() -> None:
+                f.write(compressor.compress(b"\n".join(pending)))
+                offsets.append(f.tell())
+                pending.clear()
+
+            for uid, source in search.scan_documents(
+                source_excludes=_DOCUMENT_SOURCE_EXCLUDES, batch_size=batch_size
+            ):
+                uids.append(uid)
+                pending.append(
+                    json.dumps(source, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                )
+                if len(pending) == block_size:
+                    flush()
+            if pending:
+                flush()
+
+        np.save(os.path.join(directory, "block_offsets.npy"), np.asarray(offsets, dtype=np.int64))
+        # meta.json is written last and marks the store as complete.
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(
+                {"format": _STORE_FORMAT, "codec": _CODEC, "block_size": block_size, "uids": uids},
+                f,
+                ensure_ascii=False,
+            )
+        return cls(directory)
+
+
+def init_doc_store() -> Optional[DocumentStore]:
+    """
+    Loads the local document store when DOC_STORE_DIR is set.
+    """
+    DOC_STORE_DIR = os.getenv("DOC_STORE_DIR")
+    if not DOC_STORE_DIR:
+        return None
+    return DocumentStore(
+        directory=DOC_STORE_DIR,
+        cache_blocks=int(os.getenv("DOC_STORE_CACHE_BLOCKS", "1024")),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_doc_store() -> Optional[DocumentStore]:
+    """
+    Returns the process-wide document store, or None without DOC_STORE_DIR, built on the first call.
+    """
+    return init_doc_store()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the ndltd document metadata into a local store.")
+    parser.add_argument("--output", default=os.getenv("DOC_STORE_DIR", "doc_store"))
+    parser.add_argument("--block-size", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    from app.services import os_search
+
+    store = DocumentStore.build(
+        os_search, args.output, block_size=args.block_size, batch_size=args.batch_size
+    )
+    size = os.path.getsize(os.path.join(args.output, "documents.bin"))
+    print(f"Wrote {len(store)} documents ({size} bytes, {store.codec}) to {args.output}")
@@ -0,0 +1,189 @@
+import asyncio
+import functools
+import logging
+import os
+import threading
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.cache import EmbeddingCache
+from app.services.constants import _SENTENCE_TRANSFORMER_MODEL
+
+logger = logging.getLogger(__name__)
+
+# What loading or running the model raises: a missing sentence-transformers,
+# a model that cannot be downloaded or read (hub errors are OSErrors), or torch.
+_ENCODER_ERRORS = (ImportError, OSError, RuntimeError)
+
+
+class TextEncoder:
+    """
+    Local sentence-transformer encoder for free-text queries.
+
+    The model is loaded on first use (or by `warmup` at startup), so the
+    app imports and serves other routes without `sentence-transformers`.
+    Concurrent `aencode` calls are micro-batched: the first query waits up
+    to `max_wait_ms` for others, and up to `max_batch_size` distinct texts
+    are encoded in one forward pass off the event loop. Query vectors are
+    kept in an LRU keyed by text.
+    """
+
+    def __init__(
+        self,
+        model_name: str = _SENTENCE_TRANSFORMER_MODEL,
+        device: Optional[str] = None,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        cache: Optional[EmbeddingCache] = None,
+    ) -> None:
+        """
+        Initializes the TextEncoder class.
+
+        Args:
+            model_name (str, optional): The sentence-transformers model. Defaults to the model the index was built with.
+            device (str, optional): The torch device, e.g. "cpu" or "cuda". Defaults to the library's choice.
+            max_batch_size (int, optional): The most texts encoded in one forward pass. Defaults to 32.
+            max_wait_ms (float, optional): How long a query waits for others to batch with. Defaults to 5.
+            cache (EmbeddingCache, optional): The LRU for query vectors. Defaults to no caching.
+        """
+        self.model_name = model_name
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.cache = cache if cache is not None else EmbeddingCache(max_bytes=0)
+        self._model: Any = None
+        self._model_lock = threading.Lock()
+        self._queue: Optional["asyncio.Queue[Tuple[str, asyncio.Future]]"] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.batches = 0
+        self.encoded = 0
+
+    @property
+    def model(self) -> Any:
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+
+                    self._model = SentenceTransformer(self.model_name, device=self.device)
+        return self._model
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Encodes `texts` in one forward pass, bypassing the batcher and the cache.
+
+        Returns:
+            np.ndarray: A float32 matrix with one row per text.
+        """
+        vectors = self.model.encode(
+            texts, batch_size=self.max_batch_size, convert_to_numpy=True, show_progress_bar=False
+        )
+        self.batches += 1
+        self.encoded += len(texts)
+        return np.asarray(vectors, dtype=np.float32)
+
+    def warmup(self) -> None:
+        """
+        Loads the model and runs one forward pass so the first query is not slow.
+        """
+        self.encode(["warmup"])
+
+    async def awarmup(self) -> None:
+        """
+        Runs `warmup` off the event loop, logging instead of raising on failure.
+        """
+        try:
+            await asyncio.to_thread(self.warmup)
+            logger.info("Loaded sentence-transformers model %s", self.model_name)
+        except Exception:
+            logger.exception("Failed to load sentence-transformers model %s", self.model_name)
+
+    async def aencode(self, text: str) -> np.ndarray:
+        """
+        Encodes one query, batched with whatever other queries arrive meanwhile.
+
+        Returns:
+            np.ndarray: The float32 query vector.
+        """
+        vector = self.cache.get(text)
+        if vector is not None:
+            return vector
+        future = asyncio.get_running_loop().create_future()
+        self._get_queue().put_nowait((text, future))
+        return await future
+
+    def _get_queue(self) -> "asyncio.Queue[Tuple[str, asyncio.Future]]":
+        # Like the search client, the batcher belongs to one event loop.
+        loop = asyncio.get_running_loop()
+        if self._queue is None or self._loop is not loop:
+            self._queue = asyncio.Queue()
+            self._loop = loop
+            self._worker = loop.create_task(self._run_batches(self._queue))
+        elif self._worker is None or self._worker.done():
+            self._worker = loop.create_task(self._run_batches(self._queue))
+        return self._queue
+
+    async def _run_batches(self, queue: "asyncio.Queue[Tuple[str, asyncio.Future]]") -> None:
+        while True:
+            batch: List[Tuple[str, asyncio.Future]] = []
+            try:
+                batch.append(await queue.get())
+                if queue.qsize() < self.max_batch_size - 1:
+                    await asyncio.sleep(self.max_wait_ms / 1000)
+                while len(batch) < self.max_batch_size and not queue.empty():
+                    batch.append(queue.get_nowait())
+
+                texts = list(dict.fromkeys(text for text, _ in batch))
+                vectors = await asyncio.to_thread(self.encode, texts)
+                by_text = {text: self.cache.put(text, vector) for text, vector in zip(texts, vectors)}
+                for text, future in batch:
+                    if not future.done():
+                        future.set_result(by_text[text])
+            except asyncio.CancelledError:
+                for _, future in batch:
+                    future.cancel()
+                raise
+            except Exception as e:
+                # Fail the whole batch and keep serving; no query is left waiting.
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    async def close(self) -> None:
+        """
+        Stops the batcher. Queries still waiting are cancelled.
+        """
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        if self._queue is not None:
+            while not self._queue.empty():
+                self._queue.get_nowait()[1].cancel()
+            self._queue = None
+            self._loop = None
+
+
+def init_encoder() -> TextEncoder:
+    """
+    Builds the query encoder from the environment.
+    """
+    return TextEncoder(
+        model_name=os.getenv("ENCODER_MODEL", _SENTENCE_TRANSFORMER_MODEL),
+        device=os.getenv("ENCODER_DEVICE") or None,
+        max_batch_size=int(os.getenv("ENCODER_MAX_BATCH_SIZE", "32")),
+        max_wait_ms=float(os.getenv("ENCODER_MAX_WAIT_MS", "5")),
+        cache=EmbeddingCache(
+            max_bytes=int(os.getenv("ENCODER_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+        ),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoder() -> TextEncoder:
+    """
+    Returns the process-wide query encoder, built on the first call.
+    """
+    return init_encoder()
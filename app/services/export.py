@@ -0,0 +1,67 @@
+import struct
+from typing import Any, BinaryIO, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+# rows, dimensions, length of the uid section in bytes
+_BLOCK_HEADER = struct.Struct("<III")
+
+EMBEDDING_BLOCK_MEDIA_TYPE = "application/x-ndltd-f32-blocks"
+
+
+def encode_embedding_block(page: List[Dict[str, Any]]) -> bytes:
+    """
+    Packs the embeddings of an export page into one binary block.
+
+    A block is a little-endian `<III` header (rows, dimensions, uid bytes),
+    the rows x dimensions float32 matrix in row-major order, then the uids
+    of the rows as UTF-8 joined by newlines. Documents without an embedding
+    are left out.
+
+    Args:
+        page (List[Dict[str, Any]]): Sources with `uid` and `embedding`, as yielded by `Search.export_documents`.
+
+    Returns:
+        bytes: The block; empty when no document of the page has an embedding.
+    """
+    rows = [x for x in page if x.get("embedding")]
+    if not rows:
+        return b""
+    matrix = np.asarray([x["embedding"] for x in rows], dtype="<f4")
+    uids = "\n".join(x["uid"] for x in rows).encode("utf-8")
+    return _BLOCK_HEADER.pack(matrix.shape[0], matrix.shape[1], len(uids)) + matrix.tobytes() + uids
+
+
+def iter_embedding_blocks(stream: BinaryIO) -> Iterator[Tuple[List[str], np.ndarray]]:
+    """
+    Reads the blocks written by `encode_embedding_block` one at a time.
+
+    Args:
+        stream (BinaryIO): A binary file or response body positioned at a block header.
+
+    Yields:
+        Tuple[List[str], np.ndarray]: The uids of a block and their (rows, dimensions) float32 matrix.
+    """
+    while True:
+        header = _read_exactly(stream, _BLOCK_HEADER.size)
+        if not header:
+            return
+        rows, dim, uid_bytes = _BLOCK_HEADER.unpack(header)
+        matrix = np.frombuffer(_read_exactly(stream, 4 * rows * dim), dtype="<f4").reshape(rows, dim)
+        uids = _read_exactly(stream, uid_bytes).decode("utf-8").split("\n")
+        yield uids, matrix
+
+
+def _read_exactly(stream: BinaryIO, size: int) -> bytes:
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    data = b"".join(chunks)
+    if data and len(data) != size:
+        raise ValueError("Truncated embedding block")
+    return data
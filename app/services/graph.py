@@ -0,0 +1,254 @@
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.services.classes import AnalyzedNode, CompactNetworkData, Document, Edge, Node, UIDwithScore
+from app.services.constants import _GRAPH_DOCUMENT_FIELDS
+from app.services.graph_analytics import ANALYTICS_FIELDS
+
+
+class SimilarityGraph:
+    """
+    Compact similarity network built by layer-wise kNN expansion.
+
+    Uids are interned to dense integer ids on first sight, so membership is a
+    dict lookup and nodes and edges live in flat arrays rather than as one
+    pydantic object per hop. `Node`/`Edge` models are only built by
+    `node_models`/`edge_models` when the graph is returned to a caller.
+
+    With `symmetric=True`, an edge B→A is dropped when A→B is already stored,
+    since kNN scores are symmetric and both directions carry the same score.
+    """
+
+    def __init__(self, symmetric: bool = False) -> None:
+        """
+        Initializes the SimilarityGraph class.
+
+        Args:
+            symmetric (bool, optional): Whether to collapse reciprocal edges into one. Defaults to False.
+        """
+        self.symmetric = symmetric
+        self.uids: List[str] = []
+        self.layers = array("i")
+        self.sources = array("i")
+        self.targets = array("i")
+        self.scores = array("d")
+        self._ids: Dict[str, int] = {}
+        self._pairs = set()
+
+    def __len__(self) -> int:
+        return len(self.uids)
+
+    def __contains__(self, uid: str) -> bool:
+        return uid in self._ids
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.sources)
+
+    def add_node(self, uid: str, layer: int) -> int:
+        """
+        Adds `uid` at `layer` unless it is already in the graph.
+
+        Returns:
+            int: The node's id.
+        """
+        node_id = self._ids.get(uid)
+        if node_id is None:
+            node_id = self._ids[uid] = len(self.uids)
+            self.uids.append(uid)
+            self.layers.append(layer)
+        return node_id
+
+    def add_edge(self, source: int, target: int, score: float) -> bool:
+        """
+        Adds the edge `source`→`target` between two node ids.
+
+        Returns:
+            bool: Whether the edge was stored, i.e. not collapsed into its reverse.
+        """
+        if self.symmetric:
+            pair = (min(source, target) << 32) | max(source, target)
+            if pair in self._pairs:
+                return False
+            self._pairs.add(pair)
+        self.sources.append(source)
+        self.targets.append(target)
+        self.scores.append(score)
+        return True
+
+    def expand(
+        self, frontier: List[str], results: List[List[UIDwithScore]], layer: int
+    ) -> List[str]:
+        """
+        Links every frontier node to its kNN results and adds the unseen ones at `layer`.
+
+        Args:
+            frontier (List[str]): The uids that were searched, already in the graph.
+            results (List[List[UIDwithScore]]): The kNN results of each frontier uid.
+            layer (int): The layer of newly discovered nodes.
+
+        Returns:
+            List[str]: The newly discovered uids, in discovery order.
+        """
+        return self.expand_pairs(
+            frontier, [[(item.uid, item.score) for item in result] for result in results], layer
+        )
+
+    def expand_pairs(
+        self, frontier: List[str], results: List[List[Tuple[str, float]]], layer: int
+    ) -> List[str]:
+        """
+        Same as `expand`, with each result given as a (uid, score) pair.
+        """
+        new_uids = []
+        for uid, result in zip(frontier, results):
+            source = self._ids[uid]
+            for target_uid, score in result:
+                target = self._ids.get(target_uid)
+                if target is None:
+                    target = self.add_node(target_uid, layer)
+                    new_uids.append(target_uid)
+                self.add_edge(source, target, score)
+        return new_uids
+
+    def node_models(self, start: int = 0, stop: Optional[int] = None) -> List[Node]:
+        """
+        Returns the nodes with ids in [start, stop) as `Node` models.
+        """
+        return [
+            Node(uid=uid, layer=layer)
+            for uid, layer in zip(self.uids[start:stop], self.layers[start:stop])
+        ]
+
+    def edge_models(self, start: int = 0, stop: Optional[int] = None) -> List[Edge]:
+        """
+        Returns the edges stored in [start, stop) as `Edge` models.
+        """
+        uids = self.uids
+        return [
+            Edge(source=uids[source], target=uids[target], score=score)
+            for source, target, score in zip(
+                self.sources[start:stop], self.targets[start:stop], self.scores[start:stop]
+            )
+        ]
+
+    def to_models(self) -> Tuple[List[Node], List[Edge]]:
+        """
+        Returns every node and edge as API models.
+        """
+        return self.node_models(), self.edge_models()
+
+
+class SimilarityForest:
+    """
+    Similarity graphs of several seeds, expanded together one layer at a time.
+
+    Each layer, the frontiers of all graphs are reduced to the distinct uids
+    whose neighbours are not known yet (`pending`), so a uid reached from
+    many seeds is searched once. Neighbours are kept in `neighbours`, which
+    can be shared with later forests built with the same search parameters.
+
+    With `merge=True` the seeds share one graph: the union of their networks,
+    each node at its layer from the nearest seed.
+    """
+
+    def __init__(
+        self,
+        seeds: Sequence[str],
+        symmetric: bool = False,
+        merge: bool = False,
+        neighbours: Optional[Dict[str, List[Tuple[str, float]]]] = None,
+    ) -> None:
+        """
+        Initializes the SimilarityForest class.
+
+        Args:
+            seeds (Sequence[str]): The uids to start from; repeated ones are built once.
+            symmetric (bool, optional): Whether to collapse reciprocal edges into one. Defaults to False.
+            merge (bool, optional): Whether to build one graph for all seeds. Defaults to False.
+            neighbours (Dict[str, List[Tuple[str, float]]], optional): Neighbours already known. Defaults to None.
+        """
+        self.seeds = list(dict.fromkeys(seeds))
+        self.neighbours = {} if neighbours is None else neighbours
+        if merge:
+            graph = SimilarityGraph(symmetric=symmetric)
+            for seed in self.seeds:
+                graph.add_node(seed, layer=0)
+            self.graphs = [graph]
+            self.frontiers = [list(self.seeds)]
+        else:
+            self.graphs = []
+            for seed in self.seeds:
+                graph = SimilarityGraph(symmetric=symmetric)
+                graph.add_node(seed, layer=0)
+                self.graphs.append(graph)
+            self.frontiers = [[seed] for seed in self.seeds]
+
+    @property
+    def expanding(self) -> bool:
+        return any(self.frontiers)
+
+    def pending(self) -> List[str]:
+        """
+        Returns the distinct frontier uids whose neighbours are still unknown.
+        """
+        return list(
+            dict.fromkeys(
+                uid for frontier in self.frontiers for uid in frontier if uid not in self.neighbours
+            )
+        )
+
+    def expand(self, neighbours: Dict[str, List[Tuple[str, float]]], layer: int) -> None:
+        """
+        Expands every graph's frontier, given the neighbours of the `pending` uids.
+
+        Args:
+            neighbours (Dict[str, List[Tuple[str, float]]]): The (uid, score) neighbours of each pending uid.
+            layer (int): The layer of newly discovered nodes.
+        """
+        self.neighbours.update(neighbours)
+        self.frontiers = [
+            graph.expand_pairs(frontier, [self.neighbours[uid] for uid in frontier], layer)
+            for graph, frontier in zip(self.graphs, self.frontiers)
+        ]
+
+    def uids(self) -> List[str]:
+        """
+        Returns the distinct uids of all graphs.
+        """
+        return list(dict.fromkeys(uid for graph in self.graphs for uid in graph.uids))
+
+
+def compact_network(
+    nodes: List[Node],
+    edges: List[Edge],
+    documents: Dict[str, Document],
+    truncated: bool = False,
+    fields: Sequence[str] = _GRAPH_DOCUMENT_FIELDS,
+) -> CompactNetworkData:
+    """
+    Converts a network to parallel arrays, each uid sent once and each
+    document reduced to `fields`. The analytics of `AnalyzedNode`s become arrays too.
+
+    The result is built without validation, from models that already were.
+    """
+    uids = [node.uid for node in nodes]
+    ids = {uid: i for i, uid in enumerate(uids)}
+    node_documents = [documents.get(uid) for uid in uids]
+    return CompactNetworkData.model_construct(
+        uids=uids,
+        layers=[node.layer for node in nodes],
+        sources=[ids[edge.source] for edge in edges],
+        targets=[ids[edge.target] for edge in edges],
+        scores=[edge.score for edge in edges],
+        documents={
+            field: [getattr(document, field, None) for document in node_documents]
+            for field in fields
+        },
+        analytics=(
+            {field: [getattr(node, field) for node in nodes] for field in ANALYTICS_FIELDS}
+            if nodes and isinstance(nodes[0], AnalyzedNode)
+            else None
+        ),
+        truncated=truncated,
+    )
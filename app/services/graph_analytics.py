@@ -0,0 +1,328 @@
+import argparse
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.classes import AnalyzedNode, Document, Edge, Node
+
+logger = logging.getLogger(__name__)
+
+# The fields `analyze_network` adds to each node, those of `AnalyzedNode`.
+ANALYTICS_FIELDS = ("weighted_degree", "pagerank", "component", "community")
+
+
+def analyze(
+    sources: np.ndarray,
+    targets: np.ndarray,
+    scores: np.ndarray,
+    num_nodes: int,
+    symmetric: bool = False,
+    damping: float = 0.85,
+    max_iter: int = 100,
+    tol: float = 1e-6,
+    seed: int = 0,
+) -> Dict[str, np.ndarray]:
+    """
+    Computes per-node analytics of a weighted similarity graph given as edge arrays.
+
+    Every step is a handful of vectorized passes over the edge arrays
+    (`np.bincount` sparse products, `np.minimum.at` scatters), so the same
+    code serves a 30-node network and the whole-corpus kNN graph. Self-loops
+    are ignored.
+
+    - `weighted_degree`: the sum of the scores of a node's edges, in and out.
+    - `pagerank`: weighted PageRank with edges pointing from a document to its
+      neighbours, so documents that are the neighbour of many rank high.
+      Dangling mass is spread evenly.
+    - `component`: the connected component, ignoring edge direction,
+      numbered from 0 by decreasing size.
+    - `community`: weighted label propagation communities, numbered the same way.
+
+    Args:
+        sources (np.ndarray): The source node of each edge.
+        targets (np.ndarray): The target node of each edge.
+        scores (np.ndarray): The similarity score of each edge, the edge weight.
+        num_nodes (int): The number of nodes; ids are in [0, num_nodes).
+        symmetric (bool, optional): Whether each edge stands for both directions. Defaults to False.
+        damping (float, optional): The PageRank damping factor. Defaults to 0.85.
+        max_iter (int, optional): The maximum number of PageRank and label propagation iterations. Defaults to 100.
+        tol (float, optional): The L1 change below which PageRank has converged. Defaults to 1e-6.
+        seed (int, optional): The seed of the label propagation update order. Defaults to 0.
+
+    Returns:
+        Dict[str, np.ndarray]: One array of `num_nodes` values per name in `ANALYTICS_FIELDS`.
+    """
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    weights = np.asarray(scores, dtype=np.float64)
+    keep = sources != targets
+    sources, targets, weights = sources[keep], targets[keep], weights[keep]
+
+    # Both directions of every edge, for the measures that ignore direction.
+    both_sources = np.concatenate([sources, targets])
+    both_targets = np.concatenate([targets, sources])
+    both_weights = np.concatenate([weights, weights])
+
+    if symmetric:
+        rank_edges = both_sources, both_targets, both_weights
+    else:
+        rank_edges = sources, targets, weights
+
+    return {
+        "weighted_degree": np.bincount(both_sources, both_weights, minlength=num_nodes),
+        "pagerank": pagerank(*rank_edges, num_nodes, damping=damping, max_iter=max_iter, tol=tol),
+        "component": connected_components(sources, targets, num_nodes),
+        "community": label_propagation(
+            both_sources, both_targets, both_weights, num_nodes, max_iter=max_iter, seed=seed
+        ),
+    }
+
+
+def pagerank(
+    sources: np.ndarray,
+    targets: np.ndarray,
+    weights: np.ndarray,
+    num_nodes: int,
+    damping: float = 0.85,
+    max_iter: int = 100,
+    tol: float = 1e-6,
+) -> np.ndarray:
+    """
+    Weighted PageRank by power iteration, one `np.bincount` product per step.
+
+    Returns:
+        np.ndarray: The rank of each node, summing to 1.
+    """
+    if num_nodes == 0:
+        return np.zeros(0)
+    out_weight = np.bincount(sources, weights, minlength=num_nodes)
+    dangling = out_weight == 0
+    # The share of a node's rank carried by each of its out-edges.
+    edge_share = weights / np.where(dangling, 1.0, out_weight)[sources]
+    rank = np.full(num_nodes, 1.0 / num_nodes)
+    for _ in range(max_iter):
+        spread = np.bincount(targets, edge_share * rank[sources], minlength=num_nodes)
+        new_rank = (1 - damping) / num_nodes + damping * (spread + rank[dangling].sum() / num_nodes)
+        change = np.abs(new_rank - rank).sum()
+        rank = new_rank
+        if change < tol:
+            break
+    return rank
+
+
+def connected_components(sources: np.ndarray, targets: np.ndarray, num_nodes: int) -> np.ndarray:
+    """
+    Connected components, ignoring edge direction, by min-label propagation
+    with pointer jumping.
+
+    Returns:
+        np.ndarray: The component of each node, numbered from 0 by decreasing size.
+    """
+    labels = np.arange(num_nodes)
+    while True:
+        lowest = np.minimum(labels[sources], labels[targets])
+        new_labels = labels.copy()
+        np.minimum.at(new_labels, sources, lowest)
+        np.minimum.at(new_labels, targets, lowest)
+        # Labels only decrease and always name a node of the same component,
+        # so jumping to the label of a node's label is safe and spreads labels faster.
+        new_labels = new_labels[new_labels]
+        if np.array_equal(new_labels, labels):
+            return _rank_labels(labels)
+        labels = new_labels
+
+
+def label_propagation(
+    sources: np.ndarray,
+    targets: np.ndarray,
+    weights: np.ndarray,
+    num_nodes: int,
+    max_iter: int = 100,
+    seed: int = 0,
+) -> np.ndarray:
+    """
+    Communities by weighted label propagation: each node takes the label with
+    the highest total edge weight among its neighbours, keeping its own on a tie.
+
+    Edges must be given in both directions. Each pass computes the best
+    label of every node at once, then moves a random half of the nodes whose
+    label is not already a best one; updating all of them together can make
+    neighbours swap labels forever. Later passes only revisit nodes next to
+    a move or still unsettled. It stops when no node would change.
+
+    Returns:
+        np.ndarray: The community of each node, numbered from 0 by decreasing size.
+    """
+    rng = np.random.default_rng(seed)
+    labels = np.arange(num_nodes)
+    active = np.ones(num_nodes, dtype=bool)
+    for _ in range(max_iter):
+        edges = active[sources]
+        if not edges.any():
+            break
+        nodes, best = _best_labels(sources[edges], labels[targets[edges]], weights[edges], labels, num_nodes)
+        changing = best != labels[nodes]
+        if not changing.any():
+            break
+        move = changing & (rng.random(len(nodes)) < 0.5)
+        labels[nodes[move]] = best[move]
+
+        moved = np.zeros(num_nodes, dtype=bool)
+        moved[nodes[move]] = True
+        active = np.zeros(num_nodes, dtype=bool)
+        active[nodes[changing & ~move]] = True
+        active[sources[moved[targets]]] = True
+    return _rank_labels(labels)
+
+
+def _best_labels(
+    nodes: np.ndarray, neighbour_labels: np.ndarray, weights: np.ndarray, labels: np.ndarray, num_nodes: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    # The total weight of each (node, neighbour label) pair, sorted by node then label.
+    pairs, inverse = np.unique(nodes * num_nodes + neighbour_labels, return_inverse=True)
+    totals = np.bincount(inverse.ravel(), weights)
+    pair_nodes, pair_labels = np.divmod(pairs, num_nodes)
+    starts = np.flatnonzero(np.r_[True, pair_nodes[1:] != pair_nodes[:-1]])
+    group = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(pairs)]))
+    heaviest = totals == np.maximum.reduceat(totals, starts)[group]
+    # Per node: the current label if it is among the heaviest, else the lowest heaviest one.
+    keep_current = np.logical_or.reduceat(heaviest & (pair_labels == labels[pair_nodes]), starts)
+    lowest = np.minimum.reduceat(np.where(heaviest, np.arange(len(pairs)), len(pairs)), starts)
+    best_nodes = pair_nodes[starts]
+    return best_nodes, np.where(keep_current, labels[best_nodes], pair_labels[lowest])
+
+
+def _rank_labels(labels: np.ndarray) -> np.ndarray:
+    # Renumbers labels from 0 by decreasing group size, ties by first occurrence.
+    unique, first, inverse, counts = np.unique(
+        labels, return_index=True, return_inverse=True, return_counts=True
+    )
+    order = np.lexsort((first, -counts))
+    rank = np.empty(len(unique), dtype=np.int64)
+    rank[order] = np.arange(len(unique))
+    return rank[inverse.ravel()]
+
+
+def analyze_network(
+    node_list: List[Node],
+    edge_list: List[Edge],
+    documents: Dict[str, Document],
+    truncated: bool,
+    symmetric: bool = False,
+) -> Tuple[List[Node], List[Edge], Dict[str, Document], bool]:
+    """
+    Returns a similarity network with the `ANALYTICS_FIELDS` of each node filled in.
+
+    Args:
+        node_list (List[Node]): The nodes of the network.
+        edge_list (List[Edge]): The edges of the network.
+        documents (Dict[str, Document]): The documents of the network, returned as they are.
+        truncated (bool): Whether the network was truncated, returned as it is.
+        symmetric (bool, optional): Whether the network was built with `symmetric`. Defaults to False.
+
+    Returns:
+        Tuple[List[Node], List[Edge], Dict[str, Document], bool]: The network, with `AnalyzedNode` models.
+    """
+    ids = {node.uid: i for i, node in enumerate(node_list)}
+    results = analyze(
+        np.fromiter((ids[edge.source] for edge in edge_list), dtype=np.int64, count=len(edge_list)),
+        np.fromiter((ids[edge.target] for edge in edge_list), dtype=np.int64, count=len(edge_list)),
+        np.fromiter((edge.score for edge in edge_list), dtype=np.float64, count=len(edge_list)),
+        len(node_list),
+        symmetric=symmetric,
+    )
+    weighted_degree = np.round(results["weighted_degree"], 3).tolist()
+    ranks = np.round(results["pagerank"], 6).tolist()
+    component = results["component"].tolist()
+    community = results["community"].tolist()
+    nodes = [
+        AnalyzedNode(
+            uid=node.uid,
+            layer=node.layer,
+            weighted_degree=weighted_degree[i],
+            pagerank=ranks[i],
+            component=component[i],
+            community=community[i],
+        )
+        for i, node in enumerate(node_list)
+    ]
+    return nodes, edge_list, documents, truncated
+
+
+def analyze_knn_graph(
+    directory: str,
+    output: str,
+    k: Optional[int] = None,
+    damping: float = 0.85,
+    max_iter: int = 100,
+) -> Dict[str, np.ndarray]:
+    """
+    Runs `analyze` over a precomputed whole-corpus kNN graph and saves the results.
+
+    Each document links to its `k` nearest neighbours. The results are
+    written to `output` as one `<field>.npy` array per name in
+    `ANALYTICS_FIELDS`, in the row order of the graph's uids, with
+    `meta.json` last.
+
+    Args:
+        directory (str): The directory of a `KnnGraph`.
+        output (str): The output directory.
+        k (int, optional): The number of neighbours linked per document. Defaults to the graph's `k`.
+        damping (float, optional): The PageRank damping factor. Defaults to 0.85.
+        max_iter (int, optional): The maximum number of iterations. Defaults to 100.
+
+    Returns:
+        Dict[str, np.ndarray]: The results of `analyze`.
+    """
+    from app.services.knn_graph import KnnGraph
+
+    graph = KnnGraph(directory)
+    k = graph.k if k is None else min(k, graph.k)
+    counts = np.diff(graph.indptr)
+    rows = np.repeat(np.arange(len(graph), dtype=np.int64), counts)
+    # The position of each entry in its row's best-first list.
+    positions = np.arange(len(rows)) - np.repeat(graph.indptr[:-1], counts)
+    keep = np.flatnonzero(positions < k)
+    logger.info("Analyzing %d documents and %d edges", len(graph), len(keep))
+    results = analyze(
+        rows[keep],
+        graph.indices[keep],
+        graph.scores[keep],
+        len(graph),
+        damping=damping,
+        max_iter=max_iter,
+    )
+
+    os.makedirs(output, exist_ok=True)
+    for field in ANALYTICS_FIELDS:
+        np.save(os.path.join(output, f"{field}.npy"), results[field])
+    with open(os.path.join(output, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(
+            {"knn_graph": os.path.abspath(directory), "k": k, "damping": damping, "uids": graph.uids},
+            f,
+            ensure_ascii=False,
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute the analytics of every document over the precomputed kNN graph.")
+    parser.add_argument("--knn-graph", default=os.getenv("KNN_GRAPH_DIR", "knn_graph"))
+    parser.add_argument("--output", default=None, help="defaults to <knn-graph>/analytics")
+    parser.add_argument("--k", type=int, default=None, help="defaults to the graph's k")
+    parser.add_argument("--damping", type=float, default=0.85)
+    parser.add_argument("--max-iter", type=int, default=100)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    output = args.output or os.path.join(args.knn_graph, "analytics")
+    results = analyze_knn_graph(
+        args.knn_graph, output, k=args.k, damping=args.damping, max_iter=args.max_iter
+    )
+    print(
+        f"Wrote the analytics of {len(results['pagerank'])} documents to {output}: "
+        f"{results['component'].max() + 1} components, {results['community'].max() + 1} communities"
+    )
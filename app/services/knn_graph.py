@@ -0,0 +1,277 @@
+import argparse
+import contextlib
+import functools
+import json
+import logging
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.vector_index import VectorIndex
+
+if TYPE_CHECKING:
+    from app.services.search import Search
+
+logger = logging.getLogger(__name__)
+
+_BLOCK_SUFFIX = ".npz"
+
+
+class KnnGraph:
+    """
+    Precomputed top-k neighbours of every document in the index.
+
+    Stored as CSR arrays: the neighbours of row i are
+    `indices[indptr[i]:indptr[i + 1]]`, best first, with their OpenSearch
+    scores in `scores`. The arrays are memory-mapped, so answering a frontier
+    is a few slices with no query to OpenSearch. Any `top_k` up to the `k` the
+    graph was built with can be served, since the top `top_k` of an exact
+    top-`k` list are the exact top `top_k`.
+    """
+
+    def __init__(self, directory: str) -> None:
+        """
+        Initializes the KnnGraph class from a directory written by `build`.
+
+        Args:
+            directory (str): The graph directory.
+        """
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+
+        self.directory = directory
+        self.k: int = meta["k"]
+        self.space: str = meta["space"]
+        self.uids: List[str] = meta["uids"]
+        self.position: Dict[str, int] = {uid: i for i, uid in enumerate(self.uids)}
+
+        # Plain ndarray views of the maps: slicing an np.memmap costs several
+        # times more per call, and a frontier takes one slice per node.
+        self.indptr: np.ndarray = np.load(os.path.join(directory, "indptr.npy"))
+        self.indices: np.ndarray = np.load(
+            os.path.join(directory, "indices.npy"), mmap_mode="r"
+        ).view(np.ndarray)
+        self.scores: np.ndarray = np.load(
+            os.path.join(directory, "scores.npy"), mmap_mode="r"
+        ).view(np.ndarray)
+
+    def __len__(self) -> int:
+        return len(self.uids)
+
+    def __contains__(self, uid: str) -> bool:
+        return uid in self.position
+
+    def neighbours(
+        self, uids: List[str], top_k: int, round_decimal: int = 3
+    ) -> Optional[List[List[Tuple[str, float]]]]:
+        """
+        Returns the `top_k` nearest (uid, score) pairs of each uid.
+
+        Returns:
+            List[List[Tuple[str, float]]]: The neighbours in the order of `uids`, or None if
+            the graph cannot answer, i.e. a uid is missing or `top_k` exceeds `k`.
+        """
+        if top_k > self.k:
+            return None
+        rows = [self.position.get(uid) for uid in uids]
+        if None in rows:
+            return None
+        result = []
+        for row in rows:
+            start = int(self.indptr[row])
+            end = min(start + top_k, int(self.indptr[row + 1]))
+            result.append(
+                [
+                    (self.uids[i], round(score, round_decimal))
+                    for i, score in zip(
+                        self.indices[start:end].tolist(), self.scores[start:end].tolist()
+                    )
+                ]
+            )
+        return result
+
+    @classmethod
+    def build(
+        cls,
+        search: "Search",
+        directory: str,
+        k: int = 50,
+        space: str = "l2",
+        block_size: int = 1024,
+        workers: Optional[int] = None,
+        batch_size: int = 1000,
+    ) -> "KnnGraph":
+        """
+        Computes the exact top-`k` neighbours of every document into a new graph directory.
+
+        The graph is built in the sibling directory `directory + ".partial"`
+        and moved into place when complete, so `directory` only ever holds a
+        whole graph. The embeddings are first exported with a scroll into a
+        `VectorIndex` under `vectors`. Rows are then scored in blocks of
+        `block_size` queries against the whole matrix by a pool of `workers`
+        processes, each block checkpointed to `blocks`. Rerunning after an
+        interruption skips the export and the finished blocks; rerunning over
+        a finished graph rebuilds it and replaces the old one.
+
+        Args:
+            search (Search): The search service to export the embeddings with.
+            directory (str): The output directory.
+            k (int, optional): The number of neighbours kept per document. Defaults to 50.
+            space (str, optional): The space of the index's kNN field. Defaults to "l2".
+            block_size (int, optional): The number of documents scored per task. Defaults to 1024.
+            workers (int, optional): The number of worker processes. Defaults to the CPU count.
+            batch_size (int, optional): The number of documents fetched per scroll page. Defaults to 1000.
+
+        Returns:
+            KnnGraph: The loaded graph.
+
+        Raises:
+            FileExistsError: If `directory` is neither empty nor a kNN graph.
+        """
+        directory = os.path.abspath(directory)
+        if os.path.isdir(directory) and os.listdir(directory) and not _is_graph(directory):
+            raise FileExistsError(f"{directory} is not empty and does not hold a kNN graph")
+        work_dir = directory + ".partial"
+        vectors_dir = os.path.join(work_dir, "vectors")
+        blocks_dir = os.path.join(work_dir, "blocks")
+        os.makedirs(blocks_dir, exist_ok=True)
+
+        if os.path.exists(os.path.join(vectors_dir, "meta.json")):
+            index = VectorIndex(vectors_dir)
+        else:
+            index = VectorIndex.build(search, vectors_dir, space=space, batch_size=batch_size)
+        n = len(index)
+        k = min(k, n)
+
+        pending = [
+            start
+            for start in range(0, n, block_size)
+            if not os.path.exists(_block_path(blocks_dir, start))
+        ]
+        logger.info("Scoring %d of %d blocks", len(pending), -(-n // block_size))
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(vectors_dir,)
+        ) as pool:
+            futures = [
+                pool.submit(_score_block, blocks_dir, start, min(start + block_size, n), k)
+                for start in pending
+            ]
+            for done, future in enumerate(as_completed(futures), start=1):
+                future.result()
+                logger.info("Scored block %d/%d", done, len(futures))
+
+        indices = np.lib.format.open_memmap(
+            os.path.join(work_dir, "indices.npy"), mode="w+", dtype=np.int32, shape=(n * k,)
+        )
+        scores = np.lib.format.open_memmap(
+            os.path.join(work_dir, "scores.npy"), mode="w+", dtype=np.float32, shape=(n * k,)
+        )
+        for start in range(0, n, block_size):
+            with np.load(_block_path(blocks_dir, start)) as block:
+                end = start + len(block["indices"])
+                indices[start * k : end * k] = block["indices"].ravel()
+                scores[start * k : end * k] = block["scores"].ravel()
+        indices.flush()
+        scores.flush()
+        np.save(os.path.join(work_dir, "indptr.npy"), np.arange(0, n * k + 1, k, dtype=np.int64))
+
+        # meta.json is written last and marks the graph as complete.
+        with open(os.path.join(work_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"k": k, "space": index.space, "uids": index.uids}, f, ensure_ascii=False)
+        shutil.rmtree(blocks_dir)
+        _move_into_place(work_dir, directory)
+        return cls(directory)
+
+
+_WORKER_INDEX: Optional[VectorIndex] = None
+
+
+def _init_worker(vectors_dir: str) -> None:
+    global _WORKER_INDEX
+    # Small scoring blocks keep each worker's queries x rows score matrix in cache.
+    _WORKER_INDEX = VectorIndex(vectors_dir, block_size=8192)
+
+
+def _is_graph(directory: str) -> bool:
+    return os.path.exists(os.path.join(directory, "meta.json"))
+
+
+def _move_into_place(work_dir: str, directory: str) -> None:
+    # os.replace can move a directory onto a missing or empty one, but not
+    # onto the previous graph: that is first moved aside, then removed.
+    if not _is_graph(directory):
+        os.replace(work_dir, directory)
+        return
+    old_dir = tempfile.mkdtemp(prefix=os.path.basename(directory) + ".old-", dir=os.path.dirname(directory))
+    os.replace(directory, old_dir)
+    os.replace(work_dir, directory)
+    shutil.rmtree(old_dir)
+
+
+def _block_path(blocks_dir: str, start: int) -> str:
+    return os.path.join(blocks_dir, f"{start:012d}{_BLOCK_SUFFIX}")
+
+
+def _score_block(blocks_dir: str, start: int, end: int, k: int) -> int:
+    index = _WORKER_INDEX
+    hits = index._search_exact(np.asarray(index.embeddings[start:end]), k)
+    indices = np.asarray([[row for row, _ in x] for x in hits], dtype=np.int32)
+    scores = np.asarray([[score for _, score in x] for x in hits], dtype=np.float32)
+
+    fd, tmp_path = tempfile.mkstemp(dir=blocks_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, indices=indices, scores=scores)
+        os.replace(tmp_path, _block_path(blocks_dir, start))
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+    return start
+
+
+def init_knn_graph() -> Optional[KnnGraph]:
+    """
+    Loads the precomputed kNN graph when KNN_GRAPH_DIR is set.
+    """
+    KNN_GRAPH_DIR = os.getenv("KNN_GRAPH_DIR")
+    if not KNN_GRAPH_DIR:
+        return None
+    return KnnGraph(directory=KNN_GRAPH_DIR)
+
+
+@functools.lru_cache(maxsize=None)
+def get_knn_graph() -> Optional[KnnGraph]:
+    """
+    Returns the process-wide kNN graph, or None without KNN_GRAPH_DIR, built on the first call.
+    """
+    return init_knn_graph()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the top-k neighbours of every ndltd document.")
+    parser.add_argument("--output", default=os.getenv("KNN_GRAPH_DIR", "knn_graph"))
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--space", choices=("l2", "cosinesimil"), default="l2")
+    parser.add_argument("--block-size", type=int, default=1024)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    from app.services import os_search
+
+    graph = KnnGraph.build(
+        os_search,
+        args.output,
+        k=args.k,
+        space=args.space,
+        block_size=args.block_size,
+        workers=args.workers,
+        batch_size=args.batch_size,
+    )
+    print(f"Wrote the top {graph.k} neighbours of {len(graph)} documents to {args.output}")
@@ -0,0 +1,427 @@
+import asyncio
+import functools
+import glob
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+_LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0)
+_COUNT_BUCKETS = (0, 1, 2, 3, 4, 6, 8, 12, 16, 24, 32, 64, 128)
+
+# A collector returns (name, type, help, [(labels, value), ...]) families read at scrape time.
+Family = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """
+    Monotonic counter, one value per label combination.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def snapshot(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(a: float, b: float) -> float:
+        return a + b
+
+    def render(self, values: Optional[Dict[Tuple[str, ...], float]] = None) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        if values is None:
+            values = self.snapshot()
+        for labels, value in values.items():
+            lines.append(
+                f"{self.name}{_format_labels(dict(zip(self.labelnames, labels)))} {_format_value(value)}"
+            )
+        return lines
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram, one set of buckets per label combination.
+
+    `observe` is a bisect and three additions under a lock, cheap enough to
+    call on every request.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = _DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # Per label combination: non-cumulative bucket counts (+Inf last), sum.
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def snapshot(self) -> Dict[Tuple[str, ...], Tuple[List[int], float]]:
+        with self._lock:
+            return {labels: (list(counts), total[0]) for labels, (counts, total) in self._series.items()}
+
+    @staticmethod
+    def merge(
+        a: Tuple[List[int], float], b: Tuple[List[int], float]
+    ) -> Tuple[List[int], float]:
+        return [x + y for x, y in zip(a[0], b[0])], a[1] + b[1]
+
+    def render(self, series: Optional[Dict[Tuple[str, ...], Tuple[List[int], float]]] = None) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        if series is None:
+            series = self.snapshot()
+        for labels, (counts, total) in series.items():
+            label_dict = dict(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                bucket_labels = _format_labels({**label_dict, "le": _format_value(bound)})
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(label_dict)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(label_dict)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    The metrics of this process, rendered in the Prometheus text format.
+
+    Counters and histograms are updated as things happen; collectors are
+    called at scrape time for values other objects already keep, such as
+    cache hit counters.
+
+    With `directory`, shared by the workers of one server, each process
+    also writes a snapshot of its metrics there, every `run_flush_loop`
+    interval and on every scrape, and `render` merges the snapshots of all
+    of them: counters and histograms are summed, dead workers included so
+    that totals never go down, and gauges of live workers are labelled by
+    `pid`.
+    """
+
+    def __init__(self, directory: Optional[str] = None) -> None:
+        self.directory = directory
+        self._metrics: List[Any] = []
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = _DEFAULT_BUCKETS,
+    ) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[Family]]) -> None:
+        self._collectors.append(collector)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Returns the current values of this process as JSON-compatible data.
+        """
+        return {
+            "metrics": {
+                metric.name: [[list(labels), value] for labels, value in metric.snapshot().items()]
+                for metric in self._metrics
+            },
+            "families": [family for collector in self._collectors for family in collector()],
+        }
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"worker-{pid}.json")
+
+    def flush(self) -> None:
+        """
+        Writes this process's snapshot to `directory`, if any.
+        """
+        if self.directory is None:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, self._path(os.getpid()))
+
+    async def run_flush_loop(self, interval: float) -> None:
+        """
+        Flushes every `interval` seconds until cancelled, and once more then.
+        """
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    await asyncio.to_thread(self.flush)
+                except OSError:
+                    logger.warning("Could not write the metrics of worker %d", os.getpid(), exc_info=True)
+        finally:
+            self.flush()
+
+    def _snapshots(self) -> List[Tuple[int, Dict[str, Any]]]:
+        # The snapshot of every worker that flushed, this one read fresh.
+        if self.directory is None:
+            return [(os.getpid(), self.snapshot())]
+        self.flush()
+        snapshots = []
+        for path in glob.glob(os.path.join(self.directory, "worker-*.json")):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    snapshots.append((int(os.path.basename(path)[7:-5]), json.load(f)))
+            except (OSError, ValueError):
+                # A worker's first write racing this read; it is counted next scrape.
+                continue
+        return snapshots
+
+    def render(self) -> str:
+        snapshots = self._snapshots()
+        merged = self.directory is not None
+        lines: List[str] = []
+        for metric in self._metrics:
+            values: Dict[Tuple[str, ...], Any] = {}
+            for _, snapshot in snapshots:
+                for labels, value in snapshot["metrics"].get(metric.name, []):
+                    labels = tuple(labels)
+                    values[labels] = metric.merge(values[labels], value) if labels in values else value
+            lines += metric.render(values)
+
+        families: Dict[str, Tuple[str, str, Dict[Tuple[Tuple[str, str], ...], float]]] = {}
+        for pid, snapshot in snapshots:
+            live = pid == os.getpid() or _alive(pid)
+            for name, kind, documentation, samples in snapshot["families"]:
+                if kind != "counter" and merged and not live:
+                    continue
+                _, _, values = families.setdefault(name, (kind, documentation, {}))
+                for labels, value in samples:
+                    if kind != "counter" and merged:
+                        labels = {**labels, "pid": str(pid)}
+                    key = tuple(labels.items())
+                    values[key] = values.get(key, 0.0) + value
+        for name, (kind, documentation, values) in families.items():
+            lines += [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+            lines += [f"{name}{_format_labels(dict(labels))} {_format_value(value)}" for labels, value in values.items()]
+        return "\n".join(lines) + "\n"
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def init_registry() -> MetricsRegistry:
+    """
+    Builds the registry, merging the workers' metrics through METRICS_DIR when set.
+    """
+    METRICS_DIR = os.getenv("METRICS_DIR") or None
+    return MetricsRegistry(directory=METRICS_DIR)
+
+
+registry = init_registry()
+
+search_seconds = registry.histogram(
+    "ndltd_search_seconds", "Latency of Search and AsyncSearch methods.", ("method",)
+)
+opensearch_requests = registry.counter(
+    "ndltd_opensearch_requests_total", "OpenSearch round trips, retries included.", ("endpoint", "outcome")
+)
+opensearch_seconds = registry.histogram(
+    "ndltd_opensearch_seconds", "Client wall time of OpenSearch round trips.", ("endpoint",)
+)
+opensearch_took_seconds = registry.histogram(
+    "ndltd_opensearch_took_seconds", "Server-side `took` of OpenSearch searches.", ("endpoint",)
+)
+opensearch_response_bytes = registry.histogram(
+    "ndltd_opensearch_response_bytes", "Size of OpenSearch response bodies.", ("endpoint",), _BYTES_BUCKETS
+)
+opensearch_round_trips_per_request = registry.histogram(
+    "ndltd_opensearch_round_trips_per_request",
+    "OpenSearch round trips made by each API request, retries included.",
+    ("route",),
+    _COUNT_BUCKETS,
+)
+http_request_seconds = registry.histogram(
+    "ndltd_http_request_seconds", "Latency of API requests until the last body byte.", ("route", "method", "status")
+)
+http_response_bytes = registry.histogram(
+    "ndltd_http_response_bytes", "Size of API response bodies.", ("route",), _BYTES_BUCKETS
+)
+route_phase_seconds = registry.histogram(
+    "ndltd_route_phase_seconds",
+    "Time spent in the endpoint function and in validating and serializing its result.",
+    ("route", "phase"),
+)
+llm_seconds = registry.histogram(
+    "ndltd_llm_seconds", "Latency of LLM calls.", ("service", "model"), _LLM_BUCKETS
+)
+llm_first_token_seconds = registry.histogram(
+    "ndltd_llm_first_token_seconds", "Time to the first streamed LLM token.", ("service", "model"), _LLM_BUCKETS
+)
+llm_stream_chunks = registry.counter(
+    "ndltd_llm_stream_chunks_total", "Chunks of streamed LLM responses.", ("service", "model")
+)
+llm_tokens = registry.counter(
+    "ndltd_llm_tokens_total", "LLM tokens, as reported by the provider.", ("service", "model", "kind")
+)
+
+
+class RequestTimings:
+    """
+    Per-request totals of named spans, sent back as a Server-Timing header.
+    """
+
+    __slots__ = ("route", "spans")
+
+    def __init__(self) -> None:
+        self.route: Optional[str] = None
+        # name -> [seconds, count]
+        self.spans: Dict[str, List[float]] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        span = self.spans.get(name)
+        if span is None:
+            self.spans[name] = [seconds, 1]
+        else:
+            span[0] += seconds
+            span[1] += 1
+
+    def server_timing(self) -> str:
+        return ", ".join(
+            f"{name};dur={1000 * seconds:.2f}" + (f';desc="x{int(count)}"' if count > 1 else "")
+            for name, (seconds, count) in self.spans.items()
+        )
+
+
+request_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def record_span(name: str, seconds: float) -> None:
+    """
+    Adds a span to the current request's timings, if any.
+    """
+    timings = request_timings.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+def timed(fn: Callable) -> Callable:
+    """
+    Records the latency of a sync or async method in `ndltd_search_seconds`
+    and the current request's timings, labelled by its qualified name.
+    """
+    name = fn.__qualname__
+
+    def observe(start: float) -> None:
+        elapsed = time.perf_counter() - start
+        search_seconds.observe(elapsed, name)
+        record_span(name, elapsed)
+
+    if asyncio.iscoroutinefunction(fn):
+
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                observe(start)
+
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            observe(start)
+
+    return wrapper
+
+
+# Search and msearch responses start with `{"took":N,`.
+_TOOK = re.compile(r'\{\s*"took"\s*:\s*(\d+)')
+
+
+def _endpoint(url: str) -> str:
+    # The API of a request path, e.g. "/ndltd/_msearch" -> "_msearch", without the index or ids.
+    for part in reversed(url.split("?", 1)[0].split("/")):
+        if part.startswith("_"):
+            return part
+    return "other"
+
+
+def record_round_trip(url: str, seconds: float, raw: Optional[str]) -> None:
+    """
+    Records one OpenSearch round trip; `raw` is the response body, or None if it failed.
+    """
+    endpoint = _endpoint(url)
+    opensearch_requests.inc(endpoint, "ok" if raw is not None else "error")
+    opensearch_seconds.observe(seconds, endpoint)
+    record_span("opensearch", seconds)
+    if raw is None:
+        return
+    opensearch_response_bytes.observe(len(raw), endpoint)
+    match = _TOOK.match(raw)
+    if match is not None:
+        took = int(match.group(1)) / 1000
+        opensearch_took_seconds.observe(took, endpoint)
+        record_span("opensearch_took", took)
@@ -1,29 +1,164 @@
-from typing import List, Optional, Tuple, Union
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
 
-from langchain_anthropic import ChatAnthropic
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models import BaseChatModel
+from langchain_core.outputs import LLMResult
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnableSerializable
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_openai import ChatOpenAI
 
+from app.services.cache import ResultCache, get_summary_cache
 from app.services.classes import Document
 from app.services.constants import (_COMPARE_PROMPT, _GEMINI_GENERATION_CONFIG,
                                     _GEMINI_SAFETY_SETTINGS_NONE)
-from app.services import os_search
+from app.services.metrics import (llm_first_token_seconds, llm_seconds,
+                                  llm_stream_chunks, llm_tokens, record_span)
+from app.services.async_search import AsyncSearch, get_async_search
+from app.services.search import Search, get_search
+
+# Changes whenever the prompt does, so cached summaries of an older prompt are not served.
+_PROMPT_VERSION = hashlib.sha256(_COMPARE_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+
+def _google_llm(model_name: str, api_key: str) -> BaseChatModel:
+    from langchain_google_genai import ChatGoogleGenerativeAI, HarmBlockThreshold, HarmCategory
+
+    return ChatGoogleGenerativeAI(
+        google_api_key=api_key,
+        model=model_name,
+        safety_settings={
+            HarmCategory[category]: HarmBlockThreshold[threshold]
+            for category, threshold in _GEMINI_SAFETY_SETTINGS_NONE.items()
+        },
+        generation_config=_GEMINI_GENERATION_CONFIG
+    )
+
+
+def _claude_llm(model_name: str, api_key: str) -> BaseChatModel:
+    from langchain_anthropic import ChatAnthropic
+
+    return ChatAnthropic(
+        anthropic_api_key=api_key,
+        model_name=model_name
+    )
+
+
+def _openai_llm(model_name: str, api_key: str) -> BaseChatModel:
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(
+        openai_api_key=api_key,
+        model_name=model_name
+    )
+
+
+# Each provider's SDK is imported when the first chain for it is built.
+_LLM_FACTORIES: Dict[str, Callable[[str, str], BaseChatModel]] = {
+    "google": _google_llm,
+    "claude": _claude_llm,
+    "openai": _openai_llm,
+}
+
+
+class LLMMetrics(BaseCallbackHandler):
+    """
+    Records the latency, time to first streamed token and token usage of
+    one LLM call. Token counts are only recorded when the provider reports
+    them, which OpenAI and Anthropic do for non-streamed calls.
+    """
+
+    run_inline = True
+
+    def __init__(self, llm_service: str, model_name: str) -> None:
+        self.labels = (llm_service, model_name)
+        self.start: Optional[float] = None
+        self.first_token: Optional[float] = None
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: Any, **kwargs: Any) -> None:
+        self.start = time.perf_counter()
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any) -> None:
+        self.start = time.perf_counter()
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        if self.first_token is None and self.start is not None:
+            self.first_token = time.perf_counter()
+            llm_first_token_seconds.observe(self.first_token - self.start, *self.labels)
+        llm_stream_chunks.inc(*self.labels)
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        if self.start is not None:
+            elapsed = time.perf_counter() - self.start
+            llm_seconds.observe(elapsed, *self.labels)
+            record_span("llm", elapsed)
+        output = response.llm_output or {}
+        # OpenAI reports `token_usage`, Anthropic `usage`.
+        usage = output.get("token_usage") or output.get("usage") or {}
+        for kind, keys in (("input", ("prompt_tokens", "input_tokens")), ("output", ("completion_tokens", "output_tokens"))):
+            count = next((usage[key] for key in keys if usage.get(key) is not None), None)
+            if count is not None:
+                llm_tokens.inc(*self.labels, kind, amount=count)
+
+
+class LLMPool:
+    """
+    Reuses summary chains, and with them the LLM clients and their HTTP
+    connections, across requests. Chains are keyed by service, model and a
+    hash of the API key, and the least recently used is dropped once more
+    than `max_size` are held.
+    """
+
+    def __init__(self, max_size: int = 32) -> None:
+        self.max_size = max_size
+        self._chains: "OrderedDict[Tuple[str, str, str], RunnableSerializable]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_chain(self, llm_service: str, model_name: str, api_key: str) -> RunnableSerializable:
+        key = (llm_service, model_name, hashlib.sha256((api_key or "").encode("utf-8")).hexdigest())
+        with self._lock:
+            chain = self._chains.get(key)
+            if chain is not None:
+                self._chains.move_to_end(key)
+                return chain
+        chain = (
+            ChatPromptTemplate.from_template(_COMPARE_PROMPT)
+            | _LLM_FACTORIES[llm_service](model_name, api_key)
+            | StrOutputParser()
+        )
+        with self._lock:
+            self._chains[key] = chain
+            while len(self._chains) > self.max_size:
+                self._chains.popitem(last=False)
+        return chain
+
+    def clear(self) -> None:
+        with self._lock:
+            self._chains.clear()
+
+
+llm_pool = LLMPool()
+
 
 class RagSummary:
     def __init__(
-            self, 
-            llm_service:str, 
-            model_name:str, 
-            api_key:str, 
-            target_uid:str, 
-            n_results:int = 6
+            self,
+            llm_service:str,
+            model_name:str,
+            api_key:str,
+            target_uid:str,
+            n_results:int = 6,
+            search: Optional[Search] = None,
+            async_search: Optional[AsyncSearch] = None,
     ) -> None:
         assert llm_service in ["google", "claude", "openai"], f"Currently only support google, claude, openai, but got {llm_service}"
 
-        self.search = os_search
+        self.search = search if search is not None else get_search()
+        self.async_search = async_search if async_search is not None else get_async_search()
+        self.summary_cache: ResultCache = get_summary_cache()
 
         self.llm_service = llm_service
         self.model_name = model_name
@@ -31,56 +166,110 @@ class RagSummary:
         self.n_results = n_results
         self.api_key = api_key
 
-        self.model = self._init_llm()
+    @property
+    def chain(self) -> RunnableSerializable:
+        return llm_pool.get_chain(self.llm_service, self.model_name, self.api_key)
 
-    def _init_llm(self) -> Optional[Union[ChatGoogleGenerativeAI, ChatAnthropic, ChatOpenAI]]:
-        if self.llm_service == "google": 
-            model = ChatGoogleGenerativeAI(
-                google_api_key=self.api_key,
-                model=self.model_name,
-                safety_settings=_GEMINI_SAFETY_SETTINGS_NONE,
-                generation_config=_GEMINI_GENERATION_CONFIG
-            )
-        elif self.llm_service == "claude":
-            model = ChatAnthropic(
-                anthropic_api_key = self.api_key,
-                model_name=self.model_name
-            )
-        elif self.llm_service == "openai":
-            model = ChatOpenAI(
-                openai_api_key=self.api_key,
-                model_name=self.model_name
-            )
-        else: 
-            raise ValueError(f"Currently only support google, claude, openai, but got {self.llm_service}")
-        return model
+    def _split_articles(self, documents: List[Document]) -> Tuple[Document, List[Document]]:
+        main_article = next((x for x in documents if x.uid == self.target_uid), None)
+        related_articles = [x for x in documents if x.uid != self.target_uid]
+        return main_article, related_articles
 
     def _get_articles(self) -> Tuple[Document, List[Document]]:
-        _, _, documents = self.search.get_document_similarity_network(
-            uid=self.target_uid, layer=0, n_results=self.n_results
+        vector = self.search.get_embedding_vectors(uids=[self.target_uid])[self.target_uid]
+        # The related documents come back with the kNN hits; the target is
+        # its own nearest neighbour, so it normally does too.
+        main_article, related_articles = self._split_articles(
+            self.search.search_documents_with_vector(
+                vector=vector.tolist(), top_k=self.n_results, num_candidates=self.n_results
+            )
         )
-        
-        main_article: Document = documents[self.target_uid]
-        related_articles: List[Document] = [x for x in documents.values() if x.uid != self.target_uid]
+        if main_article is None:
+            main_article = self.search.get_document_with_id(self.target_uid)
+        return main_article, related_articles
 
+    async def _aget_articles(self) -> Tuple[Document, List[Document]]:
+        vectors = await self.async_search.get_embedding_vectors(uids=[self.target_uid])
+        main_article, related_articles = self._split_articles(
+            await self.async_search.search_documents_with_vector(
+                vector=vectors[self.target_uid].tolist(),
+                top_k=self.n_results,
+                num_candidates=self.n_results,
+            )
+        )
+        if main_article is None:
+            main_article = await self.async_search.get_document_with_id(self.target_uid)
         return main_article, related_articles
-    
-    def run(self) -> dict:
-        main_article, related_articles = self._get_articles()
-        prompt = ChatPromptTemplate.from_template(_COMPARE_PROMPT)
-        parser = StrOutputParser()
-        chain:RunnableSerializable = ( prompt | self.model | parser )
 
+    @staticmethod
+    def _build_inputs(main_article: Document, related_articles: List[Document]) -> dict:
         main_article = f"# {main_article.title}\n\n摘要：\n{main_article.abstract}"
         related_articles = "\n".join(
             [
-                f"# {x.title}\n\n摘要：\n{x.abstract}" 
+                f"# {x.title}\n\n摘要：\n{x.abstract}"
                 for x in related_articles
             ]
         )
-        answer = chain.invoke({"main_article": main_article, "related_articles": related_articles})
+        return {"main_article": main_article, "related_articles": related_articles}
+
+    def _summary_key(self, related_articles: List[Document]) -> str:
+        # Content-addressed: the same articles summarized by the same model
+        # with the same prompt always map to the same entry.
+        return ResultCache.make_key(
+            "summary",
+            self.target_uid,
+            [x.uid for x in related_articles],
+            self.llm_service,
+            self.model_name,
+            _PROMPT_VERSION,
+        )
+
+    def _config(self) -> dict:
+        return {"callbacks": [LLMMetrics(self.llm_service, self.model_name)]}
+
+    def _response(self, answer: str) -> dict:
         return {
             "status": "ok",
             "target_uid": self.target_uid,
             "summary": answer
         }
+
+    def run(self) -> dict:
+        main_article, related_articles = self._get_articles()
+        answer = self.summary_cache.get_or_compute(
+            self._summary_key(related_articles),
+            lambda: self.chain.invoke(
+                self._build_inputs(main_article, related_articles), config=self._config()
+            ),
+        )
+        return self._response(answer)
+
+    async def arun(self) -> dict:
+        main_article, related_articles = await self._aget_articles()
+        answer = await self.summary_cache.aget_or_compute(
+            self._summary_key(related_articles),
+            lambda: self.chain.ainvoke(
+                self._build_inputs(main_article, related_articles), config=self._config()
+            ),
+        )
+        return self._response(answer)
+
+    async def astream(self) -> AsyncIterator[str]:
+        """
+        Yields the summary as the model writes it. A cached summary is yielded
+        whole; a newly generated one is cached once it is complete.
+        """
+        main_article, related_articles = await self._aget_articles()
+        key = self._summary_key(related_articles)
+        answer = self.summary_cache.get(key)
+        if answer is not None:
+            yield answer
+            return
+
+        chunks = []
+        async for chunk in self.chain.astream(
+            self._build_inputs(main_article, related_articles), config=self._config()
+        ):
+            chunks.append(chunk)
+            yield chunk
+        self.summary_cache.set(key, "".join(chunks))
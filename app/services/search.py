@@ -1,20 +1,118 @@
-from typing import Dict, List, Tuple, Union
+import functools
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Generator, Iterator, List, Optional, Sequence, Tuple, Union
 
-from app.services.classes import Document, Edge, Node, UIDwithEmbedding, UIDwithScore
-from app.services.constants import _INDEX
-from app.services.database import os_client
+import numpy as np
+from opensearchpy import OpenSearch, helpers
+from opensearchpy.exceptions import ConnectionTimeout, NotFoundError, TransportError
+
+from app.services.cache import (
+    EmbeddingCache,
+    ResultCache,
+    get_document_cache,
+    get_embedding_cache,
+    get_network_cache,
+)
+from app.services.classes import (
+    Document,
+    DocumentBrief,
+    Edge,
+    Node,
+    TitleSearchPage,
+    UIDwithEmbedding,
+    UIDwithScore,
+)
+from app.services.constants import _DOCUMENT_SOURCE_EXCLUDES, _INDEX, _MIN_REQUEST_TIMEOUT
+from app.services.database import init_opensearch
+from app.services.doc_store import DocumentStore, get_doc_store
+from app.services.graph import SimilarityForest, SimilarityGraph
+from app.services.graph_analytics import analyze_network
+from app.services.knn_graph import KnnGraph, get_knn_graph
+from app.services.metrics import timed
+from app.services.vector_index import VectorIndex, get_vector_index
+
+logger = logging.getLogger(__name__)
+
+_TOP_FIELDS = (
+    "degree",
+    "institution",
+    "department",
+    "detailed_field",
+    "narrow_field",
+    "graduated_academic_year",
+    "types_of_paper",
+)
+
+_BRIEF_SOURCE_INCLUDES = ["title", "graduated_academic_year", "institution"]
+
+_HYBRID_TEXT_FIELDS = ["title", "title_ws", "abstract_ws"]
+
+# Ids per `mget` and kNN queries per `msearch` when building many networks at once.
+_BULK_REQUEST_SIZE = 256
+
+# Uids whose neighbours a batch request keeps for later seeds, least recently used dropped first.
+_BATCH_NEIGHBOURS = 20000
+
+# The control flow of the bulk paths is written once, as a plan: a generator
+# that yields a (kind, argument) step for each round trip it needs and is sent
+# back the result. `Search` and `AsyncSearch` run plans with their own client.
+# Kinds: "vectors" (uids -> embeddings), "knn" (search_titles_with_vectors
+# kwargs -> results), "documents" (uids -> documents), "analyze" (key,
+# network, symmetric -> analyzed network), "search" (body -> response) and
+# "emit" (a value for the caller -> None).
+_Plan = Generator[Tuple[str, Any], Any, None]
+
+
+def _bulk_chunks(items: List[Any]) -> List[List[Any]]:
+    return [items[start : start + _BULK_REQUEST_SIZE] for start in range(0, len(items), _BULK_REQUEST_SIZE)]
+
+def _request_timeout(deadline: Optional[float]) -> Optional[float]:
+    # What is left until `deadline` (time.monotonic()), but no less than the floor; None for no deadline.
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), _MIN_REQUEST_TIMEOUT)
+
+# Exports page in uid order: unique per document, so `search_after` neither skips nor repeats one.
+_EXPORT_SORT = [{"uid": "asc"}]
+
+_EXPORT_KEEP_ALIVE = "2m"
 
 class Search:
     """
     Class for performing search operations using Opensearch.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, client: Optional[OpenSearch] = None) -> None:
         """
         Initializes the Search class.
+
+        Args:
+            client (OpenSearch, optional): The client to use. Defaults to one built from the environment on first use.
         """
-        self.opensearch = os_client
+        self._opensearch = client
+        self.embedding_cache: EmbeddingCache = get_embedding_cache()
+        self.network_cache: ResultCache = get_network_cache()
+        self.document_cache: ResultCache = get_document_cache()
+        self.vector_index: Optional[VectorIndex] = get_vector_index()
+        self.knn_graph: Optional[KnnGraph] = get_knn_graph()
+        self.doc_store: Optional[DocumentStore] = get_doc_store()
+
+    @property
+    def opensearch(self) -> OpenSearch:
+        # Built on first use so that importing the app never waits on the cluster.
+        if self._opensearch is None:
+            self._opensearch = init_opensearch()
+        return self._opensearch
 
+    @opensearch.setter
+    def opensearch(self, client: OpenSearch) -> None:
+        self._opensearch = client
+
+    @timed
     def search_title_with_vector(
         self,
         vector: List[float],
@@ -38,38 +136,117 @@ class Search:
         Returns:
             List[UIDwithScore]: The list of documents with their scores.
         """
-        if round_decimal < 1 or round_decimal > 7:
-            raise ValueError("round_decimal must be between 1 and 7")
+        self._check_round_decimal(round_decimal)
+        if self.vector_index is not None:
+            return self.vector_index.search(
+                np.asarray([vector], dtype=np.float32),
+                top_k=top_k,
+                narrow_field=narrow_field,
+                detailed_field=detailed_field,
+                round_decimal=round_decimal,
+            )[0]
 
-        match_list = []
-        query = {}
+        response = self.opensearch.search(
+            index=_INDEX,
+            body=self._build_knn_query(
+                vector=vector,
+                narrow_field=narrow_field,
+                detailed_field=detailed_field,
+                top_k=top_k,
+                num_candidates=num_candidates,
+            ),
+            _source_includes=["title"],
+        )
 
-        query["size"] = num_candidates
+        return self._parse_knn_hits(response, round_decimal)
 
-        knn_query = {
-            "embedding": {
-                "vector": vector,
-                "k": top_k,
-            }
+    @timed
+    def search_titles_with_vectors(
+        self,
+        vectors: List[List[float]],
+        narrow_field: str = None,
+        detailed_field: str = None,
+        top_k: int = 10,
+        num_candidates: int = 100,
+        round_decimal: int = 3,
+        request_timeout: float = None,
+    ) -> List[List[UIDwithScore]]:
+        """
+        Runs one kNN search per vector in a single `msearch` round trip.
+
+        Args:
+            vectors (List[List[float]]): The vector representations of the queries.
+            narrow_field (str, optional): The narrow field to search in. Defaults to None.
+            detailed_field (str, optional): The detailed field to search in. Defaults to None.
+            top_k (int, optional): The number of top results to retrieve per vector. Defaults to 10.
+            num_candidates (int, optional): The number of candidates to consider during the search. Defaults to 100.
+            round_decimal (int, optional): The number of decimal places to round the scores. Defaults to 3.
+            request_timeout (float, optional): The timeout of the round trip in seconds. Defaults to the client's.
+
+        Returns:
+            List[List[UIDwithScore]]: The documents with their scores, in the same order as `vectors`.
+        """
+        self._check_round_decimal(round_decimal)
+        if not vectors:
+            return []
+        if self.vector_index is not None:
+            return self.vector_index.search(
+                np.asarray(vectors, dtype=np.float32),
+                top_k=top_k,
+                narrow_field=narrow_field,
+                detailed_field=detailed_field,
+                round_decimal=round_decimal,
+            )
+
+        response = self.opensearch.msearch(
+            body=self._build_knn_msearch_body(
+                vectors=vectors,
+                narrow_field=narrow_field,
+                detailed_field=detailed_field,
+                top_k=top_k,
+                num_candidates=num_candidates,
+            ),
+            request_timeout=request_timeout,
+        )
+        return self._parse_knn_msearch(response, round_decimal)
+
+    @staticmethod
+    def _check_round_decimal(round_decimal: int) -> None:
+        if round_decimal < 1 or round_decimal > 7:
+            raise ValueError("round_decimal must be between 1 and 7")
+
+    @staticmethod
+    def _build_knn_query(
+        vector: List[float],
+        narrow_field: str = None,
+        detailed_field: str = None,
+        top_k: int = 10,
+        num_candidates: int = 100,
+    ) -> Dict[str, Any]:
+        # The kNN plugin has no separate candidate pool: `k` is how many
+        # neighbours each shard collects, and `size` trims the merged list.
+        knn_query: Dict[str, Any] = {
+            "vector": vector,
+            "k": max(top_k, num_candidates),
         }
 
+        # Filters go inside the kNN clause so they are applied while the
+        # neighbours are searched, not to the `k` results afterwards.
+        term_list = []
         if narrow_field:
-            match_list.append({"narrow_field": narrow_field})
+            term_list.append({"term": {"narrow_field": narrow_field}})
         if detailed_field:
-            match_list.append({"detailed_field": detailed_field})
+            term_list.append({"term": {"detailed_field": detailed_field}})
+        if term_list:
+            knn_query["filter"] = {"bool": {"filter": term_list}}
 
-        if match_list:
-            query["bool"] = {"must": [{"match": x} for x in match_list]}
-
-        query["query"] = {"knn": knn_query}
-        query["size"] = top_k
-
-        response = self.opensearch.search(
-            index=_INDEX,
-            body=query if query else None,
-            _source_includes=["title"],
-        )
+        return {
+            "size": top_k,
+            "query": {"knn": {"embedding": knn_query}},
+        }
 
+    @staticmethod
+    def _parse_knn_hits(response: Dict[str, Any], round_decimal: int) -> List[UIDwithScore]:
         return [
             UIDwithScore(
                 uid=hit["_id"],
@@ -79,6 +256,74 @@ class Search:
             for hit in response["hits"]["hits"]
         ]
 
+    @classmethod
+    def _build_knn_msearch_body(
+        cls, vectors: List[List[float]], **kwargs: Any
+    ) -> List[Dict[str, Any]]:
+        body: List[Dict[str, Any]] = []
+        for vector in vectors:
+            query = cls._build_knn_query(vector=vector, **kwargs)
+            query["_source"] = ["title"]
+            body.append({"index": _INDEX})
+            body.append(query)
+        return body
+
+    @classmethod
+    def _parse_knn_msearch(
+        cls, response: Dict[str, Any], round_decimal: int
+    ) -> List[List[UIDwithScore]]:
+        results = []
+        for item in response["responses"]:
+            if "error" in item:
+                raise TransportError(item.get("status", 500), item["error"])
+            results.append(cls._parse_knn_hits(item, round_decimal))
+        return results
+
+    @timed
+    def search_documents_with_vector(
+        self,
+        vector: List[float],
+        narrow_field: str = None,
+        detailed_field: str = None,
+        top_k: int = 10,
+        num_candidates: int = 100,
+    ) -> List[Document]:
+        """
+        Searches for the documents nearest to the given vector and returns them in full.
+
+        The documents come back with the kNN hits, so no `mget` follows.
+
+        Args:
+            vector (List[float]): The vector representation of the query.
+            narrow_field (str, optional): The narrow field to search in. Defaults to None.
+            detailed_field (str, optional): The detailed field to search in. Defaults to None.
+            top_k (int, optional): The number of top results to retrieve. Defaults to 10.
+            num_candidates (int, optional): The number of candidates to consider during the search. Defaults to 100.
+
+        Returns:
+            List[Document]: The documents, nearest first.
+        """
+        if self.vector_index is not None:
+            hits = self.search_title_with_vector(
+                vector, narrow_field, detailed_field, top_k, num_candidates
+            )
+            documents = self.get_documents(uids=[x.uid for x in hits])
+            return [documents[x.uid] for x in hits if x.uid in documents]
+
+        response = self.opensearch.search(
+            index=_INDEX,
+            body=self._build_knn_query(
+                vector=vector,
+                narrow_field=narrow_field,
+                detailed_field=detailed_field,
+                top_k=top_k,
+                num_candidates=num_candidates,
+            ),
+            _source_excludes=_DOCUMENT_SOURCE_EXCLUDES,
+        )
+        return [Document(**x["_source"]) for x in response["hits"]["hits"]]
+
+    @timed
     def get_document_with_id(self, uid: str) -> Document:
         """
         Retrieves the document with the given ID.
@@ -89,12 +334,96 @@ class Search:
         Returns:
             Document: The document object.
         """
+        if self.doc_store is not None and uid in self.doc_store:
+            return self.doc_store.get_documents([uid])[0][uid]
+        document = self.document_cache.get(uid)
+        if document is not None:
+            return document
         response = self.opensearch.get(
             index=_INDEX,
             id=uid,
-            _source_excludes=["embedding", "advisor", "title_ws", "abstract_ws"],
+            _source_excludes=_DOCUMENT_SOURCE_EXCLUDES,
         )
-        return Document(**response["_source"])
+        document = Document(**response["_source"])
+        self.document_cache.set(uid, document)
+        return document
+
+    @timed
+    def get_documents(self, uids: List[str], request_timeout: float = None) -> Dict[str, Document]:
+        """
+        Retrieves several documents in at most one `mget` round trip.
+
+        Documents in the local document store, when one is configured, or in
+        the document cache are read from there; only the rest are fetched.
+        Missing IDs are logged and left out of the result instead of raising.
+
+        Args:
+            uids (List[str]): The IDs of the documents.
+            request_timeout (float, optional): The timeout of the round trip in seconds. Defaults to the client's.
+
+        Returns:
+            Dict[str, Document]: The documents that were found, keyed by ID, in the order of `uids`.
+        """
+        if not uids:
+            return {}
+
+        documents, missing = self._read_doc_store(self.doc_store, uids)
+        missing = self._read_document_cache(self.document_cache, documents, missing)
+        if missing:
+            response = self.opensearch.mget(
+                index=_INDEX,
+                body={"ids": missing},
+                _source_excludes=_DOCUMENT_SOURCE_EXCLUDES,
+                request_timeout=request_timeout,
+            )
+            documents.update(self._cache_documents(self.document_cache, self._parse_documents(response)))
+        return self._order_documents(documents, uids)
+
+    @staticmethod
+    def _read_doc_store(
+        store: Optional[DocumentStore], uids: List[str]
+    ) -> Tuple[Dict[str, Document], List[str]]:
+        if store is None:
+            return {}, uids
+        return store.get_documents(uids)
+
+    @staticmethod
+    def _read_document_cache(
+        cache: ResultCache, documents: Dict[str, Document], missing: List[str]
+    ) -> List[str]:
+        if not missing:
+            return missing
+        still_missing = []
+        for uid in missing:
+            document = cache.get(uid)
+            if document is None:
+                still_missing.append(uid)
+            else:
+                documents[uid] = document
+        return still_missing
+
+    @staticmethod
+    def _cache_documents(cache: ResultCache, documents: Dict[str, Document]) -> Dict[str, Document]:
+        for uid, document in documents.items():
+            cache.set(uid, document)
+        return documents
+
+    @staticmethod
+    def _order_documents(documents: Dict[str, Document], uids: List[str]) -> Dict[str, Document]:
+        return {uid: documents[uid] for uid in uids if uid in documents}
+
+    @staticmethod
+    def _parse_documents(response: Dict[str, Any]) -> Dict[str, Document]:
+        documents: Dict[str, Document] = {}
+        missing: List[str] = []
+        for doc in response["docs"]:
+            if doc.get("found"):
+                documents[doc["_id"]] = Document(**doc["_source"])
+            else:
+                missing.append(doc["_id"])
+        if missing:
+            logger.warning("Documents not found in %s: %s", _INDEX, missing)
+        return documents
 
     def get_document_only_embedding(self, uid: str) -> UIDwithEmbedding:
         """
@@ -106,58 +435,503 @@ class Search:
         Returns:
             UIDwithEmbedding: The document ID and its embedding.
         """
-        response = self.opensearch.get(
-            index=_INDEX,
-            id=uid,
-            _source_includes=["embedding"],
-        )
-        return UIDwithEmbedding(uid=uid, embedding=response["_source"]["embedding"])
+        vector = self.get_embedding_vectors(uids=[uid])[uid]
+        return UIDwithEmbedding(uid=uid, embedding=vector.tolist())
+
+    def get_documents_only_embedding(self, uids: List[str]) -> List[UIDwithEmbedding]:
+        """
+        Retrieves the embeddings of several documents in at most one `mget` round trip.
+
+        Args:
+            uids (List[str]): The IDs of the documents.
+
+        Returns:
+            List[UIDwithEmbedding]: The document IDs and their embeddings, in the same order as `uids`.
 
+        Raises:
+            NotFoundError: If any of the documents does not exist.
+        """
+        vectors = self.get_embedding_vectors(uids=uids)
+        return [UIDwithEmbedding(uid=uid, embedding=vectors[uid].tolist()) for uid in uids]
+
+    @timed
+    def get_embedding_vectors(self, uids: List[str], request_timeout: float = None) -> Dict[str, np.ndarray]:
+        """
+        Retrieves document embeddings as float32 arrays, reading through the embedding cache.
+
+        Cached vectors are served from memory; the rest are fetched in a single `mget`.
+
+        Args:
+            uids (List[str]): The IDs of the documents.
+            request_timeout (float, optional): The timeout of the round trip in seconds. Defaults to the client's.
+
+        Returns:
+            Dict[str, np.ndarray]: The embeddings keyed by document ID.
+
+        Raises:
+            NotFoundError: If any of the documents does not exist.
+        """
+        vectors, missing = self._get_cached_vectors(self.embedding_cache, uids)
+        missing = self._read_vector_index(self.vector_index, vectors, missing)
+        if missing:
+            response = self.opensearch.mget(
+                index=_INDEX,
+                body={"ids": missing},
+                _source_includes=["embedding"],
+                request_timeout=request_timeout,
+            )
+            vectors.update(self._cache_embeddings(self.embedding_cache, response))
+        return vectors
+
+    @staticmethod
+    def _get_cached_vectors(
+        cache: EmbeddingCache, uids: List[str]
+    ) -> Tuple[Dict[str, np.ndarray], List[str]]:
+        unique_uids = list(dict.fromkeys(uids))
+        vectors = cache.get_many(unique_uids)
+        missing = [uid for uid in unique_uids if uid not in vectors]
+        return vectors, missing
+
+    @staticmethod
+    def _read_vector_index(
+        index: Optional[VectorIndex], vectors: Dict[str, np.ndarray], missing: List[str]
+    ) -> List[str]:
+        if index is None or not missing:
+            return missing
+        vectors.update(index.get_vectors(missing))
+        return [uid for uid in missing if uid not in vectors]
+
+    @staticmethod
+    def _read_knn_graph(
+        graph: Optional[KnnGraph],
+        uids: List[str],
+        top_k: int,
+        narrow_field: str = None,
+        detailed_field: str = None,
+    ) -> Optional[List[List[Tuple[str, float]]]]:
+        # The precomputed neighbours are unfiltered, so filtered searches still go to kNN.
+        if graph is None or narrow_field or detailed_field:
+            return None
+        return graph.neighbours(uids, top_k)
+
+    @staticmethod
+    def _cache_embeddings(
+        cache: EmbeddingCache, response: Dict[str, Any]
+    ) -> Dict[str, np.ndarray]:
+        vectors = {}
+        for doc in response["docs"]:
+            if not doc.get("found"):
+                raise NotFoundError(404, "not_found", doc)
+            vectors[doc["_id"]] = cache.put(
+                doc["_id"], doc["_source"]["embedding"]
+            )
+        return vectors
+
+    @timed
     def get_document_similarity_network(
-        self, uid: str, layer: int = 2, n_results: int = 5
-    ) -> Tuple[List[Node], List[Edge], Dict[str, Document]]:
+        self,
+        uid: str,
+        layer: int = 2,
+        n_results: int = 5,
+        narrow_field: str = None,
+        detailed_field: str = None,
+        num_candidates: int = None,
+        symmetric: bool = False,
+        deadline_ms: float = None,
+        analytics: bool = False,
+    ) -> Tuple[List[Node], List[Edge], Dict[str, Document], bool]:
         """
         Retrieves the document similarity network.
 
+        With `deadline_ms`, no further layer is expanded once the budget is
+        spent and the network found so far is returned, flagged as truncated.
+        Each round trip is given what is left of the budget, at least
+        `_MIN_REQUEST_TIMEOUT`; a layer whose searches time out is dropped,
+        and documents that cannot be fetched in time are left out.
+        Truncated networks are not cached.
+
+        With `analytics`, each node also gets its weighted degree, PageRank,
+        connected component and community within the network, computed by
+        `graph_analytics.analyze_network` and cached next to the network.
+
         Args:
             uid (str): The ID of the starting document.
             layer (int, optional): The number of layers to expand the network. Defaults to 2.
             n_results (int, optional): The number of results to retrieve for each layer. Defaults to 5.
+            narrow_field (str, optional): Only link to documents of this narrow field. Defaults to None.
+            detailed_field (str, optional): Only link to documents of this detailed field. Defaults to None.
+            num_candidates (int, optional): The number of candidates to consider per kNN search. Defaults to `n_results`.
+            symmetric (bool, optional): Whether to keep only one of A→B and B→A. Defaults to False.
+            deadline_ms (float, optional): The time budget in milliseconds. Defaults to None, i.e. no limit.
+            analytics (bool, optional): Whether to compute the analytics fields of the nodes. Defaults to False.
 
         Returns:
-            Tuple[List[Node], List[Edge], Dict[str, Document]]: The list of nodes, list of edges, and dictionary of documents.
+            Tuple[List[Node], List[Edge], Dict[str, Document], bool]: The list of nodes, list of edges, dictionary of documents, and whether the network was truncated.
         """
-        edge_list: List[Edge] = []
-        node_list: List[Node] = []
-        node_list.append(Node(uid=uid, layer=0))
+        key = self._network_key(
+            uid, layer, n_results, narrow_field, detailed_field, num_candidates, symmetric
+        )
+        build = functools.partial(
+            self._build_document_similarity_network,
+            uid=uid,
+            layer=layer,
+            n_results=n_results,
+            narrow_field=narrow_field,
+            detailed_field=detailed_field,
+            num_candidates=num_candidates,
+            symmetric=symmetric,
+        )
+        if deadline_ms is None:
+            network = self.network_cache.get_or_compute(key, build)
+        else:
+            network = self.network_cache.get(key)
+            if network is None:
+                network = build(deadline_ms=deadline_ms)
+                if not network[3]:
+                    self.network_cache.set(key, network)
+        if analytics:
+            return self._analyze_network(self.network_cache, key, network, symmetric)
+        return network
+
+    def _build_document_similarity_network(
+        self,
+        uid: str,
+        layer: int,
+        n_results: int,
+        narrow_field: str = None,
+        detailed_field: str = None,
+        num_candidates: int = None,
+        symmetric: bool = False,
+        deadline_ms: float = None,
+    ) -> Tuple[List[Node], List[Edge], Dict[str, Document], bool]:
+        deadline = None if deadline_ms is None else time.monotonic() + deadline_ms / 1000
+        graph = SimilarityGraph(symmetric=symmetric)
+        graph.add_node(uid, layer=0)
+        frontier = [uid]
+        truncated = False
 
+        # Expand one whole layer per iteration: one `mget` for the frontier's
+        # embeddings and one `msearch` for its kNN queries.
         for i in range(layer + 1):
-            pending_nodes = [node.uid for node in node_list if node.layer == i]
-            for node in pending_nodes:
-                embedding: UIDwithEmbedding = self.get_document_only_embedding(uid=node)
-                result: List[UIDwithScore] = self.search_title_with_vector(
-                    vector=embedding.embedding,
+            if not frontier:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                truncated = True
+                break
+            neighbours = self._read_knn_graph(
+                self.knn_graph, frontier, n_results, narrow_field, detailed_field
+            )
+            if neighbours is not None:
+                frontier = graph.expand_pairs(frontier, neighbours, layer=i + 1)
+                continue
+            try:
+                vectors = self.get_embedding_vectors(
+                    uids=frontier, request_timeout=_request_timeout(deadline)
+                )
+                results: List[List[UIDwithScore]] = self.search_titles_with_vectors(
+                    vectors=[vectors[x].tolist() for x in frontier],
+                    narrow_field=narrow_field,
+                    detailed_field=detailed_field,
                     top_k=n_results,
-                    num_candidates=n_results,
+                    num_candidates=num_candidates or n_results,
+                    request_timeout=_request_timeout(deadline),
                 )
+            except ConnectionTimeout:
+                truncated = True
+                break
+            frontier = graph.expand(frontier, results, layer=i + 1)
 
-                edge_list += [
-                    Edge(source=node, target=item.uid, score=item.score)
-                    for item in result
-                ]
-                node_list += [
-                    Node(uid=item.uid, layer=i + 1)
-                    for item in result
-                    if item.uid not in [x.uid for x in node_list]
-                ]
+        try:
+            documents = self.get_documents(uids=graph.uids, request_timeout=_request_timeout(deadline))
+        except ConnectionTimeout:
+            # Out of budget: only the documents held locally are returned.
+            documents, missing = self._read_doc_store(self.doc_store, graph.uids)
+            self._read_document_cache(self.document_cache, documents, missing)
+            documents = self._order_documents(documents, graph.uids)
+            truncated = True
+        node_list, edge_list = graph.to_models()
 
-        documents: Dict[str, Document] = {}
+        return node_list, edge_list, documents, truncated
+
+    @staticmethod
+    def _network_key(
+        uid: Union[str, List[str]],
+        layer: int,
+        n_results: int,
+        narrow_field: str = None,
+        detailed_field: str = None,
+        num_candidates: int = None,
+        symmetric: bool = False,
+    ) -> str:
+        # A list of uids is the key of their merged network.
+        kind = "similarity" if isinstance(uid, str) else "similarity_merged"
+        return ResultCache.make_key(
+            kind, uid, layer, n_results, narrow_field, detailed_field, num_candidates, symmetric
+        )
+
+    @staticmethod
+    def _retain_neighbours(
+        neighbours: "OrderedDict[str, List[Tuple[str, float]]]", forest: SimilarityForest
+    ) -> None:
+        # Marks the uids the forest used as recent, then drops the least
+        # recent ones, so a long batch request holds a bounded number.
+        for uid in forest.uids():
+            if uid in neighbours:
+                neighbours.move_to_end(uid)
+        while len(neighbours) > _BATCH_NEIGHBOURS:
+            neighbours.popitem(last=False)
+
+    def iter_document_similarity_networks(
+        self,
+        uids: Sequence[str],
+        layer: int = 2,
+        n_results: int = 5,
+        narrow_field: str = None,
+        detailed_field: str = None,
+        num_candidates: int = None,
+        symmetric: bool = False,
+        batch_size: int = 64,
+        analytics: bool = False,
+    ) -> Iterator[Tuple[str, Tuple[List[Node], List[Edge], Dict[str, Document], bool]]]:
+        """
+        Builds the similarity network of each of several seeds, sharing the work between them.
+
+        Seeds are expanded together, `batch_size` at a time: per layer, every
+        distinct frontier uid is searched once, in bulk `mget`s and `msearch`es,
+        and uids already searched for an earlier seed are not searched again.
+        Each network equals `get_document_similarity_network`'s for its seed
+        and goes through the same cache entry.
 
-        for node in list(set([x.uid for x in node_list])):
-            document = self.get_document_with_id(uid=node)
-            documents[node] = document
+        Args:
+            uids (Sequence[str]): The IDs of the starting documents; repeated ones are built once.
+            layer (int, optional): The number of layers to expand each network. Defaults to 2.
+            n_results (int, optional): The number of results to retrieve for each layer. Defaults to 5.
+            narrow_field (str, optional): Only link to documents of this narrow field. Defaults to None.
+            detailed_field (str, optional): Only link to documents of this detailed field. Defaults to None.
+            num_candidates (int, optional): The number of candidates to consider per kNN search. Defaults to `n_results`.
+            symmetric (bool, optional): Whether to keep only one of A→B and B→A. Defaults to False.
+            batch_size (int, optional): The number of seeds expanded together. Defaults to 64.
+            analytics (bool, optional): Whether to compute the analytics fields of the nodes. Defaults to False.
 
-        return node_list, edge_list, documents
+        Yields:
+            Tuple[str, Tuple[List[Node], List[Edge], Dict[str, Document], bool]]: Each seed with its network, in the order of `uids`.
+        """
+        return self._run_plan(
+            self._plan_networks(
+                self.network_cache,
+                self.knn_graph,
+                uids,
+                layer,
+                n_results,
+                narrow_field,
+                detailed_field,
+                num_candidates,
+                symmetric,
+                batch_size,
+                analytics,
+            )
+        )
+
+    @timed
+    def get_merged_similarity_network(
+        self,
+        uids: Sequence[str],
+        layer: int = 2,
+        n_results: int = 5,
+        narrow_field: str = None,
+        detailed_field: str = None,
+        num_candidates: int = None,
+        symmetric: bool = False,
+        analytics: bool = False,
+    ) -> Tuple[List[Node], List[Edge], Dict[str, Document], bool]:
+        """
+        Builds one similarity network from several seeds.
+
+        The network is the union of the seeds' networks, each node at its
+        layer from the nearest seed; all seeds are at layer 0. Every uid is
+        searched once, in bulk `mget`s and `msearch`es.
+
+        Args:
+            uids (Sequence[str]): The IDs of the starting documents.
+            layer (int, optional): The number of layers to expand the network. Defaults to 2.
+            n_results (int, optional): The number of results to retrieve for each layer. Defaults to 5.
+            narrow_field (str, optional): Only link to documents of this narrow field. Defaults to None.
+            detailed_field (str, optional): Only link to documents of this detailed field. Defaults to None.
+            num_candidates (int, optional): The number of candidates to consider per kNN search. Defaults to `n_results`.
+            symmetric (bool, optional): Whether to keep only one of A→B and B→A. Defaults to False.
+            analytics (bool, optional): Whether to compute the analytics fields of the nodes. Defaults to False.
+
+        Returns:
+            Tuple[List[Node], List[Edge], Dict[str, Document], bool]: The list of nodes, list of edges, dictionary of documents, and whether the network was truncated.
+        """
+        seeds = list(dict.fromkeys(uids))
+
+        def build() -> Tuple[List[Node], List[Edge], Dict[str, Document], bool]:
+            (network,) = self._run_plan(
+                self._plan_merged_network(
+                    self.knn_graph, seeds, layer, n_results, narrow_field, detailed_field, num_candidates, symmetric
+                )
+            )
+            return network
+
+        key = self._network_key(
+            seeds, layer, n_results, narrow_field, detailed_field, num_candidates, symmetric
+        )
+        network = self.network_cache.get_or_compute(key, build)
+        if analytics:
+            return self._analyze_network(self.network_cache, key, network, symmetric)
+        return network
+
+    @staticmethod
+    def _analyze_network(
+        cache: ResultCache,
+        key: str,
+        network: Tuple[List[Node], List[Edge], Dict[str, Document], bool],
+        symmetric: bool,
+    ) -> Tuple[List[Node], List[Edge], Dict[str, Document], bool]:
+        # Analyzed networks get their own entry, so the plain one under `key`
+        # stays shared with callers that skip analytics.
+        key = ResultCache.make_key("analytics", key)
+        analyzed = cache.get(key)
+        if analyzed is None:
+            analyzed = analyze_network(*network, symmetric=symmetric)
+            if not analyzed[3]:
+                cache.set(key, analyzed)
+        return analyzed
+
+    @staticmethod
+    def _plan_networks(
+        cache: ResultCache,
+        knn_graph: Optional[KnnGraph],
+        uids: Sequence[str],
+        layer: int,
+        n_results: int,
+        narrow_field: Optional[str],
+        detailed_field: Optional[str],
+        num_candidates: Optional[int],
+        symmetric: bool,
+        batch_size: int,
+        analytics: bool,
+    ) -> _Plan:
+        # Emits (seed, network) per seed; see `iter_document_similarity_networks`.
+        neighbours: "OrderedDict[str, List[Tuple[str, float]]]" = OrderedDict()
+        seeds = list(dict.fromkeys(uids))
+        for start in range(0, len(seeds), batch_size):
+            batch = seeds[start : start + batch_size]
+            keys = {
+                seed: Search._network_key(
+                    seed, layer, n_results, narrow_field, detailed_field, num_candidates, symmetric
+                )
+                for seed in batch
+            }
+            networks = {seed: cache.get(keys[seed]) for seed in batch}
+            forest = SimilarityForest(
+                [seed for seed in batch if networks[seed] is None],
+                symmetric=symmetric,
+                neighbours=neighbours,
+            )
+            yield from Search._plan_forest(
+                forest, knn_graph, layer, n_results, narrow_field, detailed_field, num_candidates
+            )
+            Search._retain_neighbours(neighbours, forest)
+            documents = yield "documents", forest.uids()
+            for seed, graph in zip(forest.seeds, forest.graphs):
+                node_list, edge_list = graph.to_models()
+                networks[seed] = (node_list, edge_list, Search._order_documents(documents, graph.uids), False)
+                cache.set(keys[seed], networks[seed])
+            for seed in batch:
+                if analytics:
+                    networks[seed] = yield "analyze", (keys[seed], networks[seed], symmetric)
+                yield "emit", (seed, networks[seed])
+
+    @staticmethod
+    def _plan_merged_network(
+        knn_graph: Optional[KnnGraph],
+        seeds: List[str],
+        layer: int,
+        n_results: int,
+        narrow_field: Optional[str],
+        detailed_field: Optional[str],
+        num_candidates: Optional[int],
+        symmetric: bool,
+    ) -> _Plan:
+        # Emits the merged network of `seeds`; see `get_merged_similarity_network`.
+        forest = SimilarityForest(seeds, symmetric=symmetric, merge=True)
+        yield from Search._plan_forest(
+            forest, knn_graph, layer, n_results, narrow_field, detailed_field, num_candidates
+        )
+        (graph,) = forest.graphs
+        node_list, edge_list = graph.to_models()
+        documents = yield "documents", graph.uids
+        yield "emit", (node_list, edge_list, Search._order_documents(documents, graph.uids), False)
+
+    @staticmethod
+    def _plan_forest(
+        forest: SimilarityForest,
+        knn_graph: Optional[KnnGraph],
+        layer: int,
+        n_results: int,
+        narrow_field: Optional[str],
+        detailed_field: Optional[str],
+        num_candidates: Optional[int],
+    ) -> _Plan:
+        for i in range(layer + 1):
+            if not forest.expanding:
+                break
+            pending = forest.pending()
+            neighbours = Search._read_knn_graph(knn_graph, pending, n_results, narrow_field, detailed_field)
+            if neighbours is None:
+                # One round of `mget`s, then one of `msearch`es, for the whole layer.
+                vectors = yield "vectors", pending
+                results: List[List[UIDwithScore]] = yield "knn", dict(
+                    vectors=[vectors[x].tolist() for x in pending],
+                    narrow_field=narrow_field,
+                    detailed_field=detailed_field,
+                    top_k=n_results,
+                    num_candidates=num_candidates or n_results,
+                )
+                neighbours = [[(item.uid, item.score) for item in result] for result in results]
+            forest.expand(dict(zip(pending, neighbours)), layer=i + 1)
+
+    def _run_plan(self, plan: _Plan) -> Iterator[Any]:
+        # Performs the steps of `plan` one bulk request at a time, yielding what it emits.
+        reply = None
+        try:
+            while True:
+                try:
+                    kind, argument = plan.send(reply)
+                except StopIteration:
+                    return
+                reply = None
+                if kind == "emit":
+                    yield argument
+                elif kind == "vectors":
+                    reply = {}
+                    for chunk in _bulk_chunks(argument):
+                        reply.update(self.get_embedding_vectors(uids=chunk))
+                elif kind == "knn":
+                    params = dict(argument)
+                    reply = [
+                        result
+                        for chunk in _bulk_chunks(params.pop("vectors"))
+                        for result in self.search_titles_with_vectors(vectors=chunk, **params)
+                    ]
+                elif kind == "documents":
+                    reply = self._get_documents_in_bulk(argument)
+                elif kind == "analyze":
+                    reply = self._analyze_network(self.network_cache, *argument)
+                elif kind == "search":
+                    reply = self.opensearch.search(body=argument)
+                else:
+                    raise ValueError(f"Unknown plan step {kind!r}")
+        finally:
+            plan.close()
+
+    def _get_documents_in_bulk(self, uids: List[str]) -> Dict[str, Document]:
+        documents: Dict[str, Document] = {}
+        for chunk in _bulk_chunks(uids):
+            documents.update(self.get_documents(uids=chunk))
+        return documents
 
     def get_total_documents(self) -> Dict[str, int]:
         """
@@ -169,42 +943,310 @@ class Search:
         response = self.opensearch.count(index=_INDEX)
         return {"count": response["count"]}
 
+    def get_index_marker(self) -> Dict[str, Any]:
+        """
+        Retrieves a marker that changes whenever the index is reloaded.
+
+        Returns:
+            Dict[str, Any]: The document count and the `version` stored in the index mapping's `_meta`, if any.
+        """
+        count = self.opensearch.count(index=_INDEX)["count"]
+        mapping = self.opensearch.indices.get_mapping(index=_INDEX)
+        meta = next(iter(mapping.values()), {}).get("mappings", {}).get("_meta", {})
+        return {"count": count, "version": meta.get("version")}
+
+    def scan_documents(
+        self,
+        source_includes: List[str] = None,
+        query: Dict[str, Any] = None,
+        batch_size: int = 1000,
+        source_excludes: List[str] = None,
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Streams every matching document with a scroll.
+
+        Args:
+            source_includes (List[str], optional): The `_source` fields to return. Defaults to every field.
+            query (Dict[str, Any], optional): The query to match. Defaults to every document.
+            batch_size (int, optional): The number of documents fetched per round trip. Defaults to 1000.
+            source_excludes (List[str], optional): The `_source` fields to leave out. Defaults to None.
+
+        Yields:
+            Tuple[str, Dict[str, Any]]: The document ID and its filtered `_source`.
+        """
+        for hit in helpers.scan(
+            self.opensearch,
+            index=_INDEX,
+            query={
+                "query": query or {"match_all": {}},
+                "_source": {"includes": source_includes or [], "excludes": source_excludes or []},
+            },
+            size=batch_size,
+        ):
+            yield hit["_id"], hit["_source"]
+
+    def export_documents(
+        self,
+        narrow_field: str = None,
+        detailed_field: str = None,
+        year: int = None,
+        fields: List[str] = None,
+        embeddings: bool = False,
+        batch_size: int = 1000,
+        slices: int = 1,
+        keep_alive: str = _EXPORT_KEEP_ALIVE,
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Streams every matching document, a page at a time, from a point in time.
+
+        Pages are read with `search_after` in uid order, so the export is
+        consistent however long it runs and memory does not grow with its
+        size. With `slices` > 1, that many slices of the point in time are
+        paged in parallel threads and their pages are interleaved; at most
+        `slices` pages wait for the consumer. Stopping early closes the
+        point in time.
+
+        Args:
+            narrow_field (str, optional): Only export documents of this narrow field. Defaults to None.
+            detailed_field (str, optional): Only export documents of this detailed field. Defaults to None.
+            year (int, optional): Only export documents of this graduated academic year. Defaults to None.
+            fields (List[str], optional): The `_source` fields to export besides `uid`. Defaults to every document field.
+            embeddings (bool, optional): Whether to include the `embedding` field. Defaults to False.
+            batch_size (int, optional): The number of documents per page and round trip. Defaults to 1000.
+            slices (int, optional): The number of slices paged in parallel. Defaults to 1.
+            keep_alive (str, optional): How long the point in time is kept between two pages. Defaults to "2m".
+
+        Yields:
+            List[Dict[str, Any]]: The `_source` of the documents of a page.
+        """
+        body = self._build_export_body(narrow_field, detailed_field, year, fields, embeddings, batch_size)
+        pit_id = self.opensearch.create_pit(index=_INDEX, keep_alive=keep_alive)["pit_id"]
+        try:
+            if slices > 1:
+                yield from self._export_slices(body, pit_id, keep_alive, slices)
+            else:
+                yield from self._run_plan(self._plan_export_slice(body, pit_id, keep_alive))
+        finally:
+            self._delete_pit(pit_id)
+
+    @staticmethod
+    def _build_export_body(
+        narrow_field: Optional[str],
+        detailed_field: Optional[str],
+        year: Optional[int],
+        fields: Optional[List[str]],
+        embeddings: bool,
+        batch_size: int,
+    ) -> Dict[str, Any]:
+        term_list = []
+        if narrow_field:
+            term_list.append({"term": {"narrow_field": narrow_field}})
+        if detailed_field:
+            term_list.append({"term": {"detailed_field": detailed_field}})
+        if year is not None:
+            term_list.append({"term": {"graduated_academic_year": year}})
+
+        if fields:
+            includes = ["uid", *fields, *(["embedding"] if embeddings else [])]
+            source: Dict[str, Any] = {"includes": list(dict.fromkeys(includes))}
+            if not embeddings:
+                source["excludes"] = ["embedding"]
+        else:
+            source = {
+                "excludes": [x for x in _DOCUMENT_SOURCE_EXCLUDES if not (embeddings and x == "embedding")]
+            }
+
+        return {
+            "size": batch_size,
+            "query": {"bool": {"filter": term_list}},
+            "sort": _EXPORT_SORT,
+            "_source": source,
+        }
+
+    @staticmethod
+    def _slice_body(
+        body: Dict[str, Any], pit_id: str, keep_alive: str, slice_id: int = 0, slices: int = 1
+    ) -> Dict[str, Any]:
+        # Searches on a point in time name no index.
+        body = {**body, "pit": {"id": pit_id, "keep_alive": keep_alive}}
+        if slices > 1:
+            body["slice"] = {"id": slice_id, "max": slices}
+        return body
+
+    @staticmethod
+    def _next_page(body: Dict[str, Any], response: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        # Returns the page of `response` and moves `body` past it, or None after the last page.
+        hits = response["hits"]["hits"]
+        if not hits:
+            return None
+        # The cluster may hand back a new id for the same point in time.
+        body["pit"]["id"] = response.get("pit_id", body["pit"]["id"])
+        body["search_after"] = hits[-1]["sort"]
+        return [hit["_source"] for hit in hits]
+
+    @staticmethod
+    def _plan_export_slice(
+        body: Dict[str, Any], pit_id: str, keep_alive: str, slice_id: int = 0, slices: int = 1
+    ) -> _Plan:
+        # Emits the pages of one slice of the point in time.
+        body = Search._slice_body(body, pit_id, keep_alive, slice_id, slices)
+        while True:
+            page = Search._next_page(body, (yield "search", body))
+            if page is None:
+                return
+            yield "emit", page
+            if len(page) < body["size"]:
+                return
+
+    def _export_slices(
+        self, body: Dict[str, Any], pit_id: str, keep_alive: str, slices: int
+    ) -> Iterator[List[Dict[str, Any]]]:
+        pages: queue.Queue = queue.Queue(maxsize=slices)
+        stop = threading.Event()
+
+        def put(item: Any) -> bool:
+            # Gives up once the consumer has stopped, instead of blocking on a full queue.
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def run(slice_id: int) -> None:
+            try:
+                plan = self._plan_export_slice(body, pit_id, keep_alive, slice_id, slices)
+                for page in self._run_plan(plan):
+                    if not put(page):
+                        return
+            except Exception as e:
+                put(e)
+                return
+            put(None)
+
+        threads = [threading.Thread(target=run, args=(i,), daemon=True) for i in range(slices)]
+        for thread in threads:
+            thread.start()
+        try:
+            running = slices
+            while running:
+                item = pages.get()
+                if item is None:
+                    running -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def _delete_pit(self, pit_id: str) -> None:
+        try:
+            self.opensearch.delete_pit(body={"pit_id": [pit_id]})
+        except TransportError:
+            # It expires after `keep_alive` anyway.
+            logger.warning("Could not delete point in time %s", pit_id, exc_info=True)
+
+    def get_graduated_academic_years(self) -> List[int]:
+        """
+        Retrieves every graduated academic year present in the index.
+
+        Returns:
+            List[int]: The years in ascending order.
+        """
+        response = self.opensearch.search(
+            index=_INDEX,
+            body={
+                "size": 0,
+                "aggs": {
+                    "years": {
+                        "terms": {"field": "graduated_academic_year", "size": 1000}
+                    }
+                },
+            },
+        )
+        return sorted(x["key"] for x in response["aggregations"]["years"]["buckets"])
+
     def get_top_field_count(
         self, 
         year: int,
+        bucket_size: int = 10,
     ) -> Dict[str, List[Dict[str, Union[str, int]]]]:
         """
-        Retrieves the top ten field counts for various fields in the search index.
+        Retrieves the top field counts for various fields in the search index.
+
+        All fields are aggregated in a single search request.
+
+        Args:
+            year (int): The graduated academic year to count.
+            bucket_size (int, optional): The number of top values to return per field. Defaults to 10.
 
         Returns:
-            A dictionary containing the top ten field counts for each field.
+            A dictionary containing the top field counts for each field.
             The keys of the dictionary represent the fields, and the values are lists of dictionaries.
             Each dictionary in the list represents a field value and its count.
         """
-        result = dict.fromkeys(
-            [
-                "degree",
-                "institution",
-                "department",
-                "detailed_field",
-                "narrow_field",
-                "graduated_academic_year",
-                "types_of_paper",
-            ]
+        return self.get_top_field_counts(years=[year], bucket_size=bucket_size)[year]
+
+    def get_top_field_counts(
+        self,
+        years: List[int],
+        bucket_size: int = 10,
+    ) -> Dict[int, Dict[str, List[Dict[str, Union[str, int]]]]]:
+        """
+        Retrieves the top field counts of several years in a single search request.
+
+        Args:
+            years (List[int]): The graduated academic years to count.
+            bucket_size (int, optional): The number of top values to return per field. Defaults to 10.
+
+        Returns:
+            Dict[int, Dict[str, List[Dict[str, Union[str, int]]]]]: The field counts of each year, keyed by year.
+        """
+        if not years:
+            return {}
+
+        response = self.opensearch.search(
+            index=_INDEX,
+            body=self._build_top_field_query(years=years, bucket_size=bucket_size),
         )
+        return self._parse_top_field_counts(response, years)
 
-        for field in result.keys():
-            response = self.opensearch.search(
-                index=_INDEX,
-                body={
-                    "query": {
-                        "bool": {"filter": {"term": {"graduated_academic_year": year}}}
+    @staticmethod
+    def _build_top_field_query(years: List[int], bucket_size: int) -> Dict[str, Any]:
+        return {
+            "size": 0,
+            "query": {
+                "bool": {"filter": {"terms": {"graduated_academic_year": years}}}
+            },
+            "aggs": {
+                "years": {
+                    "filters": {
+                        "filters": {
+                            str(year): {"term": {"graduated_academic_year": year}}
+                            for year in years
+                        }
                     },
-                    "aggs": {"counts": {"terms": {"field": field}}},
-                },
-            )
-            result[field] = response["aggregations"]["counts"]["buckets"]
-        return result
+                    "aggs": {
+                        field: {"terms": {"field": field, "size": bucket_size}}
+                        for field in _TOP_FIELDS
+                    },
+                }
+            },
+        }
+
+    @staticmethod
+    def _parse_top_field_counts(
+        response: Dict[str, Any], years: List[int]
+    ) -> Dict[int, Dict[str, List[Dict[str, Union[str, int]]]]]:
+        buckets = response["aggregations"]["years"]["buckets"]
+        return {
+            year: {field: buckets[str(year)][field]["buckets"] for field in _TOP_FIELDS}
+            for year in years
+        }
 
     def get_institution_department_stats(
         self, year: int
@@ -219,28 +1261,80 @@ class Search:
             list: A list of dictionaries containing the institution, department, and count of documents.
 
         """
+        response = self.opensearch.search(
+            index=_INDEX,
+            body=self._build_institution_department_query(year=year),
+        )
+        return self._parse_institution_department(response["aggregations"])
+
+    def get_institution_department_stats_by_year(
+        self, years: List[int]
+    ) -> Dict[int, List[Dict[str, Union[str, int]]]]:
+        """
+        Retrieves the institution and department statistics of several years in a single search request.
+
+        Args:
+            years (List[int]): The years for which the statistics are retrieved.
+
+        Returns:
+            Dict[int, List[Dict[str, Union[str, int]]]]: The statistics of each year, keyed by year.
+        """
+        if not years:
+            return {}
+
         response = self.opensearch.search(
             index=_INDEX,
             body={
                 "size": 0,
                 "query": {
-                    "bool": {"filter": {"term": {"graduated_academic_year": year}}}
+                    "bool": {"filter": {"terms": {"graduated_academic_year": years}}}
                 },
                 "aggs": {
-                    "institution_counts": {
-                        "terms": {"field": "institution"},
-                        "aggs": {
-                            "department_counts": {"terms": {"field": "department"}}
+                    "years": {
+                        "filters": {
+                            "filters": {
+                                str(year): {"term": {"graduated_academic_year": year}}
+                                for year in years
+                            }
                         },
+                        "aggs": self._build_institution_department_aggs(),
                     }
                 },
             },
         )
+        buckets = response["aggregations"]["years"]["buckets"]
+        return {
+            year: self._parse_institution_department(buckets[str(year)])
+            for year in years
+        }
+
+    @classmethod
+    def _build_institution_department_query(cls, year: int) -> Dict[str, Any]:
+        return {
+            "size": 0,
+            "query": {
+                "bool": {"filter": {"term": {"graduated_academic_year": year}}}
+            },
+            "aggs": cls._build_institution_department_aggs(),
+        }
+
+    @staticmethod
+    def _build_institution_department_aggs() -> Dict[str, Any]:
+        return {
+            "institution_counts": {
+                "terms": {"field": "institution"},
+                "aggs": {
+                    "department_counts": {"terms": {"field": "department"}}
+                },
+            }
+        }
 
+    @staticmethod
+    def _parse_institution_department(
+        aggregations: Dict[str, Any]
+    ) -> List[Dict[str, Union[str, int]]]:
         result = []
-        for institution_bucket in response["aggregations"]["institution_counts"][
-            "buckets"
-        ]:
+        for institution_bucket in aggregations["institution_counts"]["buckets"]:
             result.append(
                 {
                     "institution": institution_bucket["key"],
@@ -259,6 +1353,7 @@ class Search:
 
         return result
 
+    @timed
     def search_title(self, search_string: str) -> List[Document]:
         """
         Searches for documents with a matching title.
@@ -271,13 +1366,126 @@ class Search:
         """
         response = self.opensearch.search(
             index=_INDEX,
-            body={
-                "size": 10,
-                "query": {"match": {"title": search_string}},
-            },
-            _source_excludes=["embedding", "advisor", "title_ws", "abstract_ws"],
+            body=self._build_title_query(search_string),
+            _source_excludes=_DOCUMENT_SOURCE_EXCLUDES,
         )
         return [Document(**x["_source"]) for x in response["hits"]["hits"]]
 
+    @staticmethod
+    def _build_title_query(search_string: str) -> Dict[str, Any]:
+        return {
+            "size": 10,
+            "query": {"match": {"title": search_string}},
+        }
+
+    @timed
+    def search_title_hybrid(
+        self,
+        search_string: str,
+        vector: Optional[List[float]] = None,
+        size: int = 10,
+        search_after: Optional[str] = None,
+        rank_window_size: int = 100,
+        rank_constant: int = 60,
+        num_candidates: int = 100,
+    ) -> TitleSearchPage:
+        """
+        Searches titles lexically and by vector, fusing both rankings with reciprocal rank fusion.
+
+        The lexical match on title/title_ws/abstract_ws and the kNN query run in
+        one `msearch`, each returning its top `rank_window_size` hits with only
+        the fields of a `DocumentBrief`. A document scores
+        sum(1 / (rank_constant + rank)) over the lists it appears in. Pages are
+        cut from the fused window, so at most `rank_window_size` results are
+        reachable, as with OpenSearch's own hybrid search. Without `vector` only
+        the lexical ranking is used.
+
+        Args:
+            search_string (str): The search string.
+            vector (List[float], optional): The embedded search string. Defaults to None.
+            size (int, optional): The number of results per page. Defaults to 10.
+            search_after (str, optional): The `search_after` of the previous page. Defaults to None.
+            rank_window_size (int, optional): The number of hits fused from each ranking. Defaults to 100.
+            rank_constant (int, optional): Damps the weight of top ranks. Defaults to 60.
+            num_candidates (int, optional): The number of candidates to consider during the kNN search. Defaults to 100.
+
+        Returns:
+            TitleSearchPage: The page of results and the cursor of the next one.
+        """
+        response = self.opensearch.msearch(
+            body=self._build_hybrid_msearch_body(
+                search_string, vector, rank_window_size, num_candidates
+            )
+        )
+        return self._page_hybrid(
+            self._parse_hybrid_msearch(response, rank_constant), size, search_after
+        )
+
+    @classmethod
+    def _build_hybrid_msearch_body(
+        cls,
+        search_string: str,
+        vector: Optional[List[float]],
+        rank_window_size: int,
+        num_candidates: int,
+    ) -> List[Dict[str, Any]]:
+        body: List[Dict[str, Any]] = [
+            {"index": _INDEX},
+            {
+                "size": rank_window_size,
+                "query": {
+                    "multi_match": {"query": search_string, "fields": _HYBRID_TEXT_FIELDS}
+                },
+                "_source": _BRIEF_SOURCE_INCLUDES,
+            },
+        ]
+        if vector is not None:
+            query = cls._build_knn_query(
+                vector=vector, top_k=rank_window_size, num_candidates=num_candidates
+            )
+            query["_source"] = _BRIEF_SOURCE_INCLUDES
+            body += [{"index": _INDEX}, query]
+        return body
+
+    @staticmethod
+    def _parse_hybrid_msearch(
+        response: Dict[str, Any], rank_constant: int
+    ) -> List[DocumentBrief]:
+        scores: Dict[str, float] = {}
+        sources: Dict[str, Dict[str, Any]] = {}
+        for item in response["responses"]:
+            if "error" in item:
+                raise TransportError(item.get("status", 500), item["error"])
+            for rank, hit in enumerate(item["hits"]["hits"], start=1):
+                scores[hit["_id"]] = scores.get(hit["_id"], 0.0) + 1.0 / (rank_constant + rank)
+                sources.setdefault(hit["_id"], hit["_source"])
+        # Ties are broken by uid so that pages have a stable total order.
+        return [
+            DocumentBrief(uid=uid, score=score, **sources[uid])
+            for uid, score in sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+        ]
+
+    @staticmethod
+    def _page_hybrid(
+        briefs: List[DocumentBrief], size: int, search_after: Optional[str]
+    ) -> TitleSearchPage:
+        if search_after:
+            score, _, uid = search_after.partition(":")
+            try:
+                after = (-float(score), uid)
+            except ValueError:
+                raise ValueError(f"Invalid search_after: {search_after}")
+            briefs = [x for x in briefs if (-x.score, x.uid) > after]
+        page = briefs[:size]
+        return TitleSearchPage(
+            hits=page,
+            search_after=f"{page[-1].score!r}:{page[-1].uid}" if len(briefs) > size else None,
+        )
+
 
-os_search = Search()
\ No newline at end of file
+@functools.lru_cache(maxsize=None)
+def get_search() -> Search:
+    """
+    Returns the process-wide `Search`, built on the first call.
+    """
+    return Search()
@@ -0,0 +1,241 @@
+import argparse
+import asyncio
+import contextlib
+import functools
+import gzip
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Union
+
+from app.services.search import Search
+
+logger = logging.getLogger(__name__)
+
+_SNAPSHOT_FORMAT = 1
+
+_SNAPSHOT_BUCKET_SIZE = 50
+
+
+class StatsStore:
+    """
+    Materialized `/stats` answers for every year in the index.
+
+    A snapshot holds each year's top field counts and institution→department
+    breakdown, computed by `build` in two aggregation requests and saved as
+    gzipped JSON. Reads are served from memory; `refresh_if_stale` rebuilds
+    the snapshot when the index's document count or `_meta.version` changes.
+    """
+
+    def __init__(self, path: Optional[str], bucket_size: int = _SNAPSHOT_BUCKET_SIZE) -> None:
+        """
+        Initializes the StatsStore class.
+
+        Args:
+            path (str, optional): The snapshot file. None disables the store.
+            bucket_size (int, optional): The number of values stored per field. Defaults to 50.
+        """
+        self.path = path
+        self.bucket_size = bucket_size
+        self.snapshot: Optional[Dict[str, Any]] = None
+        # The modification time of the snapshot file that was last loaded or saved.
+        self._mtime: Optional[int] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def build(self, search: Search) -> Dict[str, Any]:
+        """
+        Computes a snapshot of every year's statistics.
+
+        Args:
+            search (Search): The search service to aggregate with.
+
+        Returns:
+            Dict[str, Any]: The snapshot.
+        """
+        marker = search.get_index_marker()
+        years = search.get_graduated_academic_years()
+        return {
+            "format": _SNAPSHOT_FORMAT,
+            "marker": marker,
+            "built_at": time.time(),
+            "bucket_size": self.bucket_size,
+            "top_field": search.get_top_field_counts(years=years, bucket_size=self.bucket_size),
+            "institution_department": search.get_institution_department_stats_by_year(years=years),
+        }
+
+    def save(self, snapshot: Dict[str, Any]) -> None:
+        """
+        Writes `snapshot` to the snapshot file atomically and serves it from memory.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with gzip.open(os.fdopen(fd, "wb"), "wt", encoding="utf-8") as f:
+                json.dump(snapshot, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+            raise
+        self._mtime = os.stat(self.path).st_mtime_ns
+        self.snapshot = self._index_by_year(snapshot)
+
+    def load(self) -> bool:
+        """
+        Loads the snapshot file into memory.
+
+        Returns:
+            bool: Whether a usable snapshot was loaded.
+        """
+        if not self.enabled or not os.path.exists(self.path):
+            return False
+        mtime = os.stat(self.path).st_mtime_ns
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            snapshot = json.load(f)
+        self._mtime = mtime
+        if snapshot.get("format") != _SNAPSHOT_FORMAT:
+            return False
+        self.snapshot = self._index_by_year(snapshot)
+        return True
+
+    def refresh(self, search: Search) -> None:
+        """
+        Rebuilds and saves the snapshot.
+        """
+        self.save(self.build(search))
+
+    def refresh_if_stale(self, search: Search) -> bool:
+        """
+        Rebuilds the snapshot if the index has changed since it was built.
+
+        When several workers share the snapshot file, the first to notice a
+        change rebuilds it and the others load its snapshot from the file.
+
+        Returns:
+            bool: Whether the snapshot was rebuilt.
+        """
+        marker = search.get_index_marker()
+        if self.snapshot is not None and self.snapshot["marker"] == marker:
+            return False
+        if self.load() and self.snapshot["marker"] == marker:
+            return False
+        self.refresh(search)
+        return True
+
+    def reload_if_changed(self) -> bool:
+        """
+        Loads the snapshot file again if it was replaced since it was last loaded.
+
+        Returns:
+            bool: Whether a new snapshot was loaded.
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == self._mtime:
+            return False
+        return self.load()
+
+    async def run_reload_loop(self, interval: float) -> None:
+        """
+        Checks the snapshot file every `interval` seconds and loads it when
+        another process has rebuilt it, without querying the index.
+        """
+        while True:
+            try:
+                if await asyncio.to_thread(self.reload_if_changed):
+                    logger.info("Reloaded stats snapshot %s", self.path)
+            except Exception:
+                logger.exception("Failed to reload stats snapshot %s", self.path)
+            await asyncio.sleep(interval)
+
+    async def run_refresh_loop(self, search: Search, interval: float) -> None:
+        """
+        Checks the index marker every `interval` seconds and rebuilds the snapshot when it changes.
+        """
+        while True:
+            try:
+                if await asyncio.to_thread(self.refresh_if_stale, search):
+                    logger.info("Rebuilt stats snapshot %s", self.path)
+            except Exception:
+                logger.exception("Failed to refresh stats snapshot %s", self.path)
+            await asyncio.sleep(interval)
+
+    @staticmethod
+    def _index_by_year(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+        # JSON object keys are strings; serve lookups by int year.
+        snapshot = dict(snapshot)
+        for key in ("top_field", "institution_department"):
+            snapshot[key] = {int(year): value for year, value in snapshot[key].items()}
+        return snapshot
+
+    def get_top_field_count(
+        self, year: int, bucket_size: int = 10
+    ) -> Optional[Dict[str, List[Dict[str, Union[str, int]]]]]:
+        """
+        Returns the snapshot's top field counts of `year`, or None if the snapshot cannot answer.
+        """
+        if self.snapshot is None or bucket_size > self.snapshot["bucket_size"]:
+            return None
+        counts = self.snapshot["top_field"].get(year)
+        if counts is None:
+            return None
+        return {field: buckets[:bucket_size] for field, buckets in counts.items()}
+
+    def get_top_field_counts(
+        self, years: List[int], bucket_size: int = 10
+    ) -> Optional[Dict[int, Dict[str, List[Dict[str, Union[str, int]]]]]]:
+        """
+        Returns the snapshot's top field counts of `years`, or None if the snapshot cannot answer.
+        """
+        result = {}
+        for year in years:
+            counts = self.get_top_field_count(year, bucket_size)
+            if counts is None:
+                return None
+            result[year] = counts
+        return result
+
+    def get_institution_department_stats(
+        self, year: int
+    ) -> Optional[List[Dict[str, Union[str, int]]]]:
+        """
+        Returns the snapshot's institution and department statistics of `year`, or None if the snapshot cannot answer.
+        """
+        if self.snapshot is None:
+            return None
+        return self.snapshot["institution_department"].get(year)
+
+
+def init_stats_store() -> StatsStore:
+    """
+    Builds the stats snapshot store from STATS_SNAPSHOT_PATH; unset disables it.
+    """
+    return StatsStore(path=os.getenv("STATS_SNAPSHOT_PATH"))
+
+
+@functools.lru_cache(maxsize=None)
+def get_stats_store() -> StatsStore:
+    """
+    Returns the process-wide stats snapshot store, built on the first call.
+    """
+    return init_stats_store()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the /stats snapshot file.")
+    parser.add_argument("--output", default=os.getenv("STATS_SNAPSHOT_PATH", "stats_snapshot.json.gz"))
+    parser.add_argument("--bucket-size", type=int, default=_SNAPSHOT_BUCKET_SIZE)
+    args = parser.parse_args()
+
+    from app.services import os_search
+
+    StatsStore(path=args.output, bucket_size=args.bucket_size).refresh(os_search)
+    print(f"Wrote {args.output}")
@@ -0,0 +1,379 @@
+import argparse
+import functools
+import json
+import os
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.classes import UIDwithScore
+
+if TYPE_CHECKING:
+    from app.services.search import Search
+
+_FILTER_FIELDS = ("narrow_field", "detailed_field")
+
+_SPACES = ("l2", "cosinesimil")
+
+
+class VectorIndex:
+    """
+    In-process kNN index over a memory-mapped float32 matrix of every document embedding.
+
+    Exact mode scores a batch of queries against all rows with blocked matrix
+    products. IVF mode (built with `n_lists > 0`) partitions the rows with
+    k-means and only scores the `n_probe` nearest partitions. The
+    narrow_field/detailed_field filters are answered from precomputed posting
+    lists. Scores use the OpenSearch formula of the index's space, so results
+    are interchangeable with the remote kNN path.
+    """
+
+    def __init__(self, directory: str, n_probe: int = 8, block_size: int = 65536) -> None:
+        """
+        Initializes the VectorIndex class from a directory written by `build`.
+
+        Args:
+            directory (str): The index directory.
+            n_probe (int, optional): The number of partitions scored per query in IVF mode. Defaults to 8.
+            block_size (int, optional): The number of rows scored per matrix product in exact mode. Defaults to 65536.
+        """
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+
+        self.directory = directory
+        self.n_probe = n_probe
+        self.block_size = block_size
+        self.space: str = meta["space"]
+        self.uids: List[str] = meta["uids"]
+        self.titles: List[str] = meta["titles"]
+        self.position: Dict[str, int] = {uid: i for i, uid in enumerate(self.uids)}
+
+        count = len(self.uids)
+        self.embeddings: np.ndarray = np.load(
+            os.path.join(directory, "embeddings.npy"), mmap_mode="r"
+        )[:count]
+        self.sq_norms: np.ndarray = np.load(os.path.join(directory, "sq_norms.npy"))
+
+        self.postings: np.ndarray = np.load(os.path.join(directory, "postings.npy"))
+        self.posting_offsets: Dict[str, Dict[str, Tuple[int, int]]] = meta["postings"]
+
+        self.n_lists: int = meta["n_lists"]
+        if self.n_lists:
+            self.centroids: np.ndarray = np.load(os.path.join(directory, "centroids.npy"))
+            self.list_rows: np.ndarray = np.load(os.path.join(directory, "list_rows.npy"))
+            self.list_offsets: np.ndarray = np.load(os.path.join(directory, "list_offsets.npy"))
+
+    def __len__(self) -> int:
+        return len(self.uids)
+
+    @classmethod
+    def build(
+        cls,
+        search: "Search",
+        directory: str,
+        n_lists: int = 0,
+        space: str = "l2",
+        batch_size: int = 1000,
+        seed: int = 0,
+    ) -> "VectorIndex":
+        """
+        Exports every uid/embedding pair from OpenSearch into a new index directory.
+
+        Args:
+            search (Search): The search service to export from.
+            directory (str): The index directory to write.
+            n_lists (int, optional): The number of IVF partitions. 0 builds an exact-only index. Defaults to 0.
+            space (str, optional): The OpenSearch space type of the `embedding` field, `l2` or `cosinesimil`. Defaults to `l2`.
+            batch_size (int, optional): The number of documents fetched per round trip. Defaults to 1000.
+            seed (int, optional): The k-means seed. Defaults to 0.
+
+        Returns:
+            VectorIndex: The loaded index.
+        """
+        if space not in _SPACES:
+            raise ValueError(f"Currently only support {', '.join(_SPACES)}, but got {space}")
+        os.makedirs(directory, exist_ok=True)
+
+        total = search.get_total_documents()["count"]
+        uids: List[str] = []
+        titles: List[str] = []
+        postings: Dict[str, Dict[str, List[int]]] = {field: {} for field in _FILTER_FIELDS}
+        matrix: Optional[np.ndarray] = None
+
+        for uid, source in search.scan_documents(
+            source_includes=["embedding", "title", *_FILTER_FIELDS], batch_size=batch_size
+        ):
+            if len(uids) >= total:
+                break
+            if matrix is None:
+                matrix = np.lib.format.open_memmap(
+                    os.path.join(directory, "embeddings.npy"),
+                    mode="w+",
+                    dtype=np.float32,
+                    shape=(total, len(source["embedding"])),
+                )
+            row = len(uids)
+            matrix[row] = source["embedding"]
+            uids.append(uid)
+            titles.append(source.get("title", ""))
+            for field in _FILTER_FIELDS:
+                value = source.get(field)
+                if value is not None:
+                    postings[field].setdefault(value, []).append(row)
+
+        if matrix is None:
+            raise ValueError("Cannot build a vector index from an empty index")
+        matrix.flush()
+        embeddings = matrix[: len(uids)]
+
+        np.save(
+            os.path.join(directory, "sq_norms.npy"),
+            np.einsum("ij,ij->i", embeddings, embeddings),
+        )
+
+        posting_arrays: List[np.ndarray] = []
+        posting_offsets: Dict[str, Dict[str, Tuple[int, int]]] = {}
+        offset = 0
+        for field, values in postings.items():
+            posting_offsets[field] = {}
+            for value, rows in values.items():
+                posting_arrays.append(np.asarray(rows, dtype=np.int32))
+                posting_offsets[field][value] = (offset, offset + len(rows))
+                offset += len(rows)
+        np.save(
+            os.path.join(directory, "postings.npy"),
+            np.concatenate(posting_arrays) if posting_arrays else np.zeros(0, np.int32),
+        )
+
+        if n_lists:
+            centroids, assignment = _kmeans(
+                _normalize(embeddings) if space == "cosinesimil" else embeddings,
+                n_lists=n_lists,
+                seed=seed,
+            )
+            list_rows = np.argsort(assignment, kind="stable").astype(np.int32)
+            list_offsets = np.searchsorted(assignment[list_rows], np.arange(n_lists + 1))
+            np.save(os.path.join(directory, "centroids.npy"), centroids)
+            np.save(os.path.join(directory, "list_rows.npy"), list_rows)
+            np.save(os.path.join(directory, "list_offsets.npy"), list_offsets)
+
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "space": space,
+                    "n_lists": n_lists,
+                    "uids": uids,
+                    "titles": titles,
+                    "postings": posting_offsets,
+                },
+                f,
+                ensure_ascii=False,
+            )
+        return cls(directory)
+
+    def get_vectors(self, uids: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Returns the stored embeddings of the uids present in the index.
+        """
+        return {
+            uid: np.array(self.embeddings[self.position[uid]])
+            for uid in uids
+            if uid in self.position
+        }
+
+    def search(
+        self,
+        vectors: np.ndarray,
+        top_k: int = 10,
+        narrow_field: str = None,
+        detailed_field: str = None,
+        n_probe: int = None,
+        round_decimal: int = 3,
+    ) -> List[List[UIDwithScore]]:
+        """
+        Finds the nearest documents of each query vector.
+
+        Args:
+            vectors (np.ndarray): The query vectors, one per row.
+            top_k (int, optional): The number of results per query. Defaults to 10.
+            narrow_field (str, optional): Only return documents of this narrow field. Defaults to None.
+            detailed_field (str, optional): Only return documents of this detailed field. Defaults to None.
+            n_probe (int, optional): Overrides the number of IVF partitions scored per query. Defaults to None.
+            round_decimal (int, optional): The number of decimal places to round the scores. Defaults to 3.
+
+        Returns:
+            List[List[UIDwithScore]]: The documents with their scores, in the same order as `vectors`.
+        """
+        queries = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        allowed = self._filter_rows(narrow_field=narrow_field, detailed_field=detailed_field)
+
+        if self.n_lists:
+            hits = self._search_ivf(queries, top_k, allowed, n_probe or self.n_probe)
+        elif allowed is not None:
+            hits = [self._top_k(queries[i : i + 1], allowed, top_k)[0] for i in range(len(queries))]
+        else:
+            hits = self._search_exact(queries, top_k)
+
+        return [
+            [
+                UIDwithScore(
+                    uid=self.uids[row],
+                    title=self.titles[row],
+                    score=round(float(score), round_decimal),
+                )
+                for row, score in result
+            ]
+            for result in hits
+        ]
+
+    def _filter_rows(self, narrow_field: str = None, detailed_field: str = None) -> Optional[np.ndarray]:
+        rows: Optional[np.ndarray] = None
+        for field, value in (("narrow_field", narrow_field), ("detailed_field", detailed_field)):
+            if not value:
+                continue
+            start, end = self.posting_offsets[field].get(value, (0, 0))
+            field_rows = self.postings[start:end]
+            rows = field_rows if rows is None else np.intersect1d(rows, field_rows, assume_unique=True)
+        return rows
+
+    def _score(self, queries: np.ndarray, rows: Optional[np.ndarray], start: int = 0, end: int = None) -> np.ndarray:
+        if rows is None:
+            block = self.embeddings[start:end]
+            sq_norms = self.sq_norms[start:end]
+        else:
+            block = self.embeddings[rows]
+            sq_norms = self.sq_norms[rows]
+        dot = queries @ block.T
+        if self.space == "cosinesimil":
+            q_norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            cosine = dot / np.maximum(q_norms * np.sqrt(sq_norms)[None, :], 1e-12)
+            return 1.0 / (2.0 - cosine)
+        q_sq = np.einsum("ij,ij->i", queries, queries)[:, None]
+        return 1.0 / (1.0 + np.maximum(q_sq + sq_norms[None, :] - 2.0 * dot, 0.0))
+
+    @staticmethod
+    def _select(scores: np.ndarray, ids: np.ndarray, top_k: int) -> List[List[Tuple[int, float]]]:
+        # Best score first; ties keep the lower row so results are deterministic.
+        k = min(top_k, scores.shape[1])
+        result = []
+        for row_scores in scores:
+            if 0 < k < len(row_scores):
+                candidates = np.argpartition(-row_scores, k - 1)[:k]
+            else:
+                candidates = np.arange(k)
+            chosen = candidates[np.lexsort((ids[candidates], -row_scores[candidates]))]
+            result.append(list(zip(ids[chosen].tolist(), row_scores[chosen].tolist())))
+        return result
+
+    def _top_k(self, queries: np.ndarray, rows: np.ndarray, top_k: int) -> List[List[Tuple[int, float]]]:
+        if len(rows) == 0:
+            return [[] for _ in range(len(queries))]
+        return self._select(self._score(queries, rows), rows, top_k)
+
+    def _search_exact(self, queries: np.ndarray, top_k: int) -> List[List[Tuple[int, float]]]:
+        best: List[List[Tuple[int, float]]] = [[] for _ in range(len(queries))]
+        for start in range(0, len(self), self.block_size):
+            end = min(start + self.block_size, len(self))
+            block_hits = self._select(
+                self._score(queries, None, start, end), np.arange(start, end), top_k
+            )
+            for i, hits in enumerate(block_hits):
+                merged = best[i] + hits
+                merged.sort(key=lambda x: (-x[1], x[0]))
+                best[i] = merged[:top_k]
+        return best
+
+    def _search_ivf(
+        self, queries: np.ndarray, top_k: int, allowed: Optional[np.ndarray], n_probe: int
+    ) -> List[List[Tuple[int, float]]]:
+        probe_queries = _normalize(queries) if self.space == "cosinesimil" else queries
+        distances = (
+            np.einsum("ij,ij->i", probe_queries, probe_queries)[:, None]
+            - 2.0 * probe_queries @ self.centroids.T
+            + np.einsum("ij,ij->i", self.centroids, self.centroids)[None, :]
+        )
+        n_probe = min(n_probe, self.n_lists)
+        probes = np.argpartition(distances, n_probe - 1, axis=1)[:, :n_probe]
+
+        result = []
+        for i, lists in enumerate(probes):
+            rows = np.concatenate(
+                [self.list_rows[self.list_offsets[x] : self.list_offsets[x + 1]] for x in lists]
+            )
+            if allowed is not None:
+                rows = rows[np.isin(rows, allowed)]
+            result.append(self._top_k(queries[i : i + 1], np.sort(rows), top_k)[0])
+        return result
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def _kmeans(
+    matrix: np.ndarray, n_lists: int, seed: int = 0, iterations: int = 10, sample_size: int = 100_000
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Trains k-means centroids on a sample of `matrix` and assigns every row to its nearest centroid.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(matrix)
+    sample = np.asarray(matrix[np.sort(rng.choice(n, size=min(n, sample_size), replace=False))])
+    centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+
+    def assign(rows: np.ndarray) -> np.ndarray:
+        distances = (
+            -2.0 * rows @ centroids.T + np.einsum("ij,ij->i", centroids, centroids)[None, :]
+        )
+        return np.argmin(distances, axis=1)
+
+    for _ in range(iterations):
+        labels = assign(sample)
+        for c in range(n_lists):
+            members = sample[labels == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+
+    assignment = np.concatenate(
+        [assign(np.asarray(matrix[i : i + 65536])) for i in range(0, n, 65536)]
+    )
+    return centroids.astype(np.float32), assignment
+
+
+def init_vector_index() -> Optional[VectorIndex]:
+    """
+    Loads the local vector index when VECTOR_BACKEND is `local`.
+    """
+    VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "opensearch")
+    if VECTOR_BACKEND == "opensearch":
+        return None
+    if VECTOR_BACKEND == "local":
+        return VectorIndex(
+            directory=os.getenv("VECTOR_INDEX_DIR", "vector_index"),
+            n_probe=int(os.getenv("VECTOR_INDEX_N_PROBE", "8")),
+        )
+    raise ValueError(f"Currently only support opensearch, local, but got {VECTOR_BACKEND}")
+
+
+@functools.lru_cache(maxsize=None)
+def get_vector_index() -> Optional[VectorIndex]:
+    """
+    Returns the process-wide local vector index, or None with the opensearch backend, built on the first call.
+    """
+    return init_vector_index()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the ndltd embeddings into a local vector index.")
+    parser.add_argument("--output", default=os.getenv("VECTOR_INDEX_DIR", "vector_index"))
+    parser.add_argument("--n-lists", type=int, default=0)
+    parser.add_argument("--space", choices=_SPACES, default="l2")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    from app.services import os_search
+
+    index = VectorIndex.build(
+        os_search, args.output, n_lists=args.n_lists, space=args.space, batch_size=args.batch_size
+    )
+    print(f"Wrote {len(index)} vectors to {args.output}")
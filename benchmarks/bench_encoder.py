@@ -0,0 +1,123 @@
+"""
+Measures query-encoding throughput with and without the TextEncoder micro-batcher.
+
+Encodes `--queries` distinct texts once one at a time (one forward pass per
+query) and once as `--concurrency` concurrent `aencode` calls that the batcher
+groups into shared forward passes, on CPU by default:
+
+    python -m benchmarks.bench_encoder --queries 512 --concurrency 64 --max-batch-size 32
+
+`--simulate` swaps the model for one that sleeps `fixed + per-text` ms per
+forward pass, to measure the batcher itself where the model is not installed.
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from app.services.encoder import TextEncoder
+from benchmarks.stub_opensearch import _WORDS
+
+
+class _SimulatedModel:
+    def __init__(self, fixed_ms: float, per_text_ms: float) -> None:
+        self.fixed_ms = fixed_ms
+        self.per_text_ms = per_text_ms
+
+    def encode(self, sentences: List[str], **kwargs) -> np.ndarray:
+        time.sleep((self.fixed_ms + self.per_text_ms * len(sentences)) / 1000)
+        return np.zeros((len(sentences), 768), dtype=np.float32)
+
+
+def _summary(latencies: List[float], elapsed: float, encoder: TextEncoder) -> Dict[str, float]:
+    latencies = sorted(latencies)
+    return {
+        "qps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(1000 * latencies[len(latencies) // 2], 2),
+        "p99_ms": round(1000 * latencies[int(len(latencies) * 0.99)], 2),
+        "forward_passes": encoder.batches,
+        "mean_batch": round(encoder.encoded / max(encoder.batches, 1), 1),
+    }
+
+
+def _sequential(encoder: TextEncoder, texts: List[str]) -> Dict[str, float]:
+    latencies = []
+    started = time.perf_counter()
+    for text in texts:
+        start = time.perf_counter()
+        encoder.encode([text])
+        latencies.append(time.perf_counter() - start)
+    return _summary(latencies, time.perf_counter() - started, encoder)
+
+
+async def _batched(encoder: TextEncoder, texts: List[str], concurrency: int) -> Dict[str, float]:
+    latencies = []
+    pending = iter(texts)
+
+    async def client() -> None:
+        for text in pending:
+            start = time.perf_counter()
+            await encoder.aencode(text)
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    await encoder.close()
+    return _summary(latencies, elapsed, encoder)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--queries", type=int, default=512)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--simulate", nargs=2, type=float, metavar=("FIXED_MS", "PER_TEXT_MS"))
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    texts = [
+        "".join(rng.choice(_WORDS, size=6)) + f" {i}" for i in range(args.queries)
+    ]
+
+    def make_encoder() -> TextEncoder:
+        kwargs = {"model_name": args.model} if args.model else {}
+        encoder = TextEncoder(
+            device=args.device,
+            max_batch_size=args.max_batch_size,
+            max_wait_ms=args.max_wait_ms,
+            **kwargs,
+        )
+        if args.simulate:
+            encoder._model = _SimulatedModel(*args.simulate)
+        encoder.warmup()
+        encoder.batches = encoder.encoded = 0
+        return encoder
+
+    results = {
+        "sequential": _sequential(make_encoder(), texts),
+        "batched": asyncio.run(_batched(make_encoder(), texts, args.concurrency)),
+    }
+    print(
+        json.dumps(
+            {
+                "queries": args.queries,
+                "concurrency": args.concurrency,
+                "max_batch_size": args.max_batch_size,
+                "max_wait_ms": args.max_wait_ms,
+                "simulate": args.simulate,
+                "results": results,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
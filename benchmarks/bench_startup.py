@@ -0,0 +1,162 @@
+"""
+Measures cold start: importing the app and serving its first request, in fresh interpreters.
+
+Each run starts a new Python process that imports `main`, starts uvicorn
+on it, which runs the app lifespan and connects to OpenSearch, and sends
+GET /health over HTTP. OpenSearch is `benchmarks.stub_opensearch`, started
+once for all runs. The process wall time, which includes interpreter
+startup, is measured too. A run fails if any LLM provider SDK
+was imported: those load on the first summary request only. The median
+time to the first response is checked against `--budget-ms`, and the exit
+status is 1 when it is over budget:
+
+    python -m benchmarks.bench_startup --runs 5 --budget-ms 1500
+
+`--importtime` adds the slowest imports from `python -X importtime`, to see
+what to defer next.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, List
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imported on first use of their `llm_service`, never at startup.
+_LAZY_MODULES = ("langchain_google_genai", "langchain_openai", "langchain_anthropic", "langchain_core")
+
+_PROBE = f"""
+import asyncio, json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+import httpx, uvicorn
+
+async def first_request():
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=0, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    # `started` is set once the lifespan startup has run and the socket listens.
+    while not server.started:
+        if serving.done():
+            sys.exit("uvicorn failed to start")
+        await asyncio.sleep(0.001)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    async with httpx.AsyncClient() as client:
+        (await client.get(f"http://127.0.0.1:{{port}}/health")).raise_for_status()
+    served = time.perf_counter()
+    server.should_exit = True
+    await serving
+    return served
+
+served = asyncio.run(first_request())
+print(json.dumps({{
+    "import_ms": 1000 * (imported - start),
+    "first_response_ms": 1000 * (served - start),
+    "lazy_modules_loaded": [m for m in {_LAZY_MODULES!r} if m in sys.modules],
+}}))
+"""
+
+
+def _env(stub_port: int) -> Dict[str, str]:
+    return dict(
+        os.environ,
+        OS_API_URL=f"http://127.0.0.1:{stub_port}",
+        OS_API_USER="bench",
+        OS_API_PWD="bench",
+        # The warmup runs in the background and would only compete with the measurement.
+        ENCODER_WARMUP="false",
+    )
+
+
+def _wait_ready(url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url).close()
+            return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    raise TimeoutError(f"{url} did not come up")
+
+
+def _run_once(env: Dict[str, str]) -> Dict[str, Any]:
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-c", _PROBE], capture_output=True, text=True, check=True, env=env
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["process_ms"] = 1000 * (time.perf_counter() - start)
+    return result
+
+
+def _slowest_imports(top: int, env: Dict[str, str]) -> List[Dict[str, Any]]:
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        capture_output=True, text=True, check=True, env=env,
+    )
+    imports = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            imports.append({"module": name.strip(), "cumulative_ms": int(cumulative) / 1000})
+    imports.sort(key=lambda x: x["cumulative_ms"], reverse=True)
+    return imports[:top]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1500.0, help="for the median time to the first response")
+    parser.add_argument("--importtime", type=int, default=0, metavar="N", help="report the N slowest imports")
+    parser.add_argument("--output", default=None, help="write the JSON results here instead of stdout")
+    parser.add_argument("--stub-port", type=int, default=9299)
+    args = parser.parse_args()
+
+    env = _env(args.stub_port)
+    stub = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.stub_opensearch", "--port", str(args.stub_port), "--n-docs", "100"],
+        cwd=_ROOT,
+        env=env,
+    )
+    try:
+        _wait_ready(f"http://127.0.0.1:{args.stub_port}/")
+        runs = [_run_once(env) for _ in range(args.runs)]
+        slowest_imports = _slowest_imports(args.importtime, env) if args.importtime else None
+    finally:
+        stub.terminate()
+        stub.wait()
+    report: Dict[str, Any] = {
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "budget_ms": args.budget_ms,
+    }
+    for metric in ("import_ms", "first_response_ms", "process_ms"):
+        values = sorted(run[metric] for run in runs)
+        report[metric] = {"median": round(statistics.median(values), 1), "max": round(values[-1], 1)}
+    lazy_loaded = sorted({m for run in runs for m in run["lazy_modules_loaded"]})
+    report["lazy_modules_loaded"] = lazy_loaded
+    if slowest_imports is not None:
+        report["slowest_imports"] = slowest_imports
+
+    over_budget = report["first_response_ms"]["median"] > args.budget_ms
+    report["ok"] = not over_budget and not lazy_loaded
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    sys.exit(0 if report["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Benchmarks the search service and the HTTP routes against the in-process OpenSearch stand-in.
+
+Every request goes through the real client code path to a `StubOpenSearch`
+holding a synthetic corpus of `--n-docs` theses with 768-dim embeddings,
+with `--latency-ms` of simulated network and cluster time per round trip.
+Each benchmark reports wall time, OpenSearch round trips and the peak
+memory allocated per request, and the whole run is written as JSON:
+
+    python -m benchmarks.bench_suite --n-docs 5000 --latency-ms 2 --output bench.json
+
+Caches are cleared before every request unless `--warm` is given. Pass an
+earlier run as `--baseline` to compare against it; the exit status is 1 when
+a benchmark's median got slower by more than `--max-regression`:
+
+    python -m benchmarks.bench_suite --baseline bench.json --max-regression 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+os.environ.setdefault("OS_API_URL", "http://stub:9200")
+os.environ.setdefault("OS_API_USER", "bench")
+os.environ.setdefault("OS_API_PWD", "bench")
+
+import httpx  # noqa: E402
+
+from app.services import os_async_search, os_search  # noqa: E402
+from app.services.cache import MemoryCacheBackend, ResultCache, get_embedding_cache  # noqa: E402
+from app.services.graph_analytics import analyze_network  # noqa: E402
+from benchmarks.stub_opensearch import (  # noqa: E402
+    StubOpenSearch,
+    SyntheticCorpus,
+    async_stub_client,
+    stub_client,
+)
+from main import app  # noqa: E402
+
+_SEED_UID = "109THU00099005"
+
+_ROUTES = {
+    "document": ("/api/v1/document/", {"uid": _SEED_UID}),
+    "similarity": ("/api/v1/document/similarity", {"uid": _SEED_UID, "layer": 2, "n_results": 5}),
+    "similarity_stream": (
+        "/api/v1/document/similarity/stream",
+        {"uid": _SEED_UID, "layer": 2, "n_results": 5},
+    ),
+    "title": ("/api/v1/document/title", {"query": "深度學習"}),
+    "top_field": ("/api/v1/stats/top_field", {"year": 109}),
+}
+
+
+class Runner:
+    """
+    Runs each benchmark `repeat` times after `warmup` runs, then once more
+    under tracemalloc, and collects the per-request figures.
+    """
+
+    def __init__(self, stub: StubOpenSearch, repeat: int, warmup: int, warm: bool) -> None:
+        self.stub = stub
+        self.repeat = repeat
+        self.warmup = warmup
+        self.warm = warm
+        self.loop = asyncio.new_event_loop()
+        self.results: Dict[str, Dict[str, float]] = {}
+
+    def _reset(self) -> None:
+        if not self.warm:
+            get_embedding_cache().clear()
+
+    def run(self, name: str, fn: Callable[[], Any]) -> None:
+        for _ in range(self.warmup):
+            self._reset()
+            fn()
+
+        latencies: List[float] = []
+        round_trips = 0
+        for _ in range(self.repeat):
+            self._reset()
+            before = self.stub.round_trips
+            start = time.perf_counter()
+            fn()
+            latencies.append(time.perf_counter() - start)
+            round_trips += self.stub.round_trips - before
+
+        # Measured apart: tracing slows every allocation down.
+        self._reset()
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        latencies.sort()
+        self.results[name] = {
+            "mean_ms": round(1000 * statistics.fmean(latencies), 3),
+            "p50_ms": round(1000 * latencies[len(latencies) // 2], 3),
+            "p95_ms": round(1000 * latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)], 3),
+            "round_trips": round(round_trips / self.repeat, 2),
+            "peak_alloc_kib": round(peak / 1024, 1),
+        }
+        print(f"{name}: {self.results[name]}", file=sys.stderr)
+
+    def run_async(self, name: str, fn: Callable[[], Awaitable[Any]]) -> None:
+        self.run(name, lambda: self.loop.run_until_complete(fn()))
+
+
+def _search_benchmarks(runner: Runner, layers: List[int], n_results: List[int]) -> None:
+    for layer in layers:
+        for n in n_results:
+            runner.run(
+                f"network/layer={layer}/n_results={n}",
+                lambda layer=layer, n=n: os_search.get_document_similarity_network(
+                    uid=_SEED_UID, layer=layer, n_results=n
+                ),
+            )
+    # Seeds with overlapping neighbourhoods: the seed's own network.
+    seeds = [node.uid for node in os_search.get_document_similarity_network(uid=_SEED_UID)[0]]
+    runner.run(
+        f"network_loop/seeds={len(seeds)}",
+        lambda: [os_search.get_document_similarity_network(uid=seed) for seed in seeds],
+    )
+    runner.run(
+        f"network_batch/seeds={len(seeds)}",
+        lambda: list(os_search.iter_document_similarity_networks(uids=seeds)),
+    )
+    network = os_search.get_document_similarity_network(uid=_SEED_UID, layer=3, n_results=10)
+    runner.run(f"analyze_network/nodes={len(network[0])}", lambda: analyze_network(*network))
+    runner.run("top_field_count", lambda: os_search.get_top_field_count(year=109))
+    runner.run("search_title", lambda: os_search.search_title("深度學習"))
+
+
+def _http_benchmarks(runner: Runner) -> None:
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+    for name, (path, params) in _ROUTES.items():
+
+        async def request(path: str = path, params: dict = params) -> None:
+            response = await client.get(path, params=params)
+            response.raise_for_status()
+
+        runner.run_async(f"http/{name}", request)
+    runner.loop.run_until_complete(client.aclose())
+
+
+def _revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]]) -> Dict[str, float]:
+    return {
+        name: round(result["p50_ms"] / baseline[name]["p50_ms"] - 1, 3)
+        for name, result in results.items()
+        if name in baseline and baseline[name]["p50_ms"] > 0
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--n-docs", type=int, default=5000)
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    parser.add_argument("--layers", type=int, nargs="+", default=[1, 2, 3])
+    parser.add_argument("--n-results", type=int, nargs="+", default=[5, 10, 20])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--warm", action="store_true", help="keep caches between requests")
+    parser.add_argument("--skip-http", action="store_true")
+    parser.add_argument("--output", default=None, help="write the JSON results here instead of stdout")
+    parser.add_argument("--baseline", default=None, help="an earlier --output to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    stub = StubOpenSearch(SyntheticCorpus(n_docs=args.n_docs))
+    # Measure the OpenSearch path: no local indexes, and no network cache unless --warm.
+    for search in (os_search, os_async_search):
+        search.vector_index = search.knn_graph = search.doc_store = None
+        if not args.warm:
+            search.network_cache = ResultCache(MemoryCacheBackend(), ttl=0)
+            search.document_cache = ResultCache(MemoryCacheBackend(), ttl=0)
+    os_search.opensearch = stub_client(stub, latency_ms=args.latency_ms)
+
+    runner = Runner(stub, repeat=args.repeat, warmup=args.warmup, warm=args.warm)
+    runner.loop.run_until_complete(
+        os_async_search.connect(async_stub_client(stub, latency_ms=args.latency_ms))
+    )
+    _search_benchmarks(runner, args.layers, args.n_results)
+    if not args.skip_http:
+        _http_benchmarks(runner)
+
+    report: Dict[str, Any] = {
+        "revision": _revision(),
+        "python": platform.python_version(),
+        "config": {
+            "n_docs": args.n_docs,
+            "latency_ms": args.latency_ms,
+            "repeat": args.repeat,
+            "warm": args.warm,
+        },
+        "results": runner.results,
+    }
+    regressed = False
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            changes = _compare(runner.results, json.load(f)["results"])
+        report["p50_change_vs_baseline"] = changes
+        regressed = any(change > args.max_regression for change in changes.values())
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Measures HTTP throughput of the API against the local OpenSearch stand-in.
+
+Starts `benchmarks.stub_opensearch` and a uvicorn worker serving `main:app`
+from `--app-dir` (defaults to this checkout, so an older checkout can be
+measured for a before/after comparison), then drives each route with
+`--concurrency` clients for `--duration` seconds:
+
+    python -m benchmarks.bench_throughput --concurrency 64 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_ROUTES = {
+    "document": "/api/v1/document/?uid=109THU00099005",
+    "similarity": "/api/v1/document/similarity?uid=109THU00099005&layer=2&n_results=5",
+    "top_field": "/api/v1/stats/top_field?year=109",
+}
+
+
+async def _wait_ready(url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise TimeoutError(f"{url} did not come up")
+
+
+async def _drive(url: str, concurrency: int, duration: float) -> Dict[str, float]:
+    latencies: List[float] = []
+    errors = 0
+    stop = time.monotonic() + duration
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        nonlocal errors
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            response = await client.get(url)
+            latencies.append(time.perf_counter() - start)
+            errors += response.status_code != 200
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+        started = time.monotonic()
+        await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+        elapsed = time.monotonic() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(1000 * latencies[len(latencies) // 2], 1),
+        "p99_ms": round(1000 * latencies[int(len(latencies) * 0.99)], 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--app-dir", default=_ROOT)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--n-docs", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--stub-port", type=int, default=9299)
+    parser.add_argument("--app-port", type=int, default=8799)
+    parser.add_argument("--routes", nargs="+", default=list(_ROUTES), choices=list(_ROUTES))
+    args = parser.parse_args()
+
+    env = dict(
+        os.environ,
+        OS_API_URL=f"http://127.0.0.1:{args.stub_port}",
+        OS_API_USER="bench",
+        OS_API_PWD="bench",
+    )
+    stub = subprocess.Popen(
+        [
+            sys.executable, "-m", "benchmarks.stub_opensearch",
+            "--port", str(args.stub_port),
+            "--n-docs", str(args.n_docs),
+            "--latency-ms", str(args.latency_ms),
+        ],
+        cwd=_ROOT,
+        env=env,
+    )
+    app = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--port", str(args.app_port), "--log-level", "warning",
+        ],
+        cwd=args.app_dir,
+        env=env,
+    )
+    try:
+        base = f"http://127.0.0.1:{args.app_port}"
+        asyncio.run(_wait_ready(f"http://127.0.0.1:{args.stub_port}/"))
+        asyncio.run(_wait_ready(f"{base}/health"))
+        results = {
+            name: asyncio.run(_drive(base + _ROUTES[name], args.concurrency, args.duration))
+            for name in args.routes
+        }
+        print(json.dumps({"concurrency": args.concurrency, "results": results}, indent=2))
+    finally:
+        app.terminate()
+        stub.terminate()
+        app.wait()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main()
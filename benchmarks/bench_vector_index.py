@@ -0,0 +1,113 @@
+"""
+Compares recall and latency of the local VectorIndex against the OpenSearch kNN path.
+
+Builds exact and IVF indexes from a synthetic corpus served by the in-process
+stub, then runs the same batch of queries through `Search` with the remote
+backend (one `msearch`) and with each local index:
+
+    python -m benchmarks.bench_vector_index --n-docs 20000 --queries 200 --top-k 10
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+os.environ.setdefault("OS_API_URL", "http://stub:9200")
+os.environ.setdefault("OS_API_USER", "bench")
+os.environ.setdefault("OS_API_PWD", "bench")
+
+from app.services.classes import UIDwithScore  # noqa: E402
+from app.services.search import Search  # noqa: E402
+from app.services.vector_index import VectorIndex  # noqa: E402
+from benchmarks.stub_opensearch import StubOpenSearch, SyntheticCorpus, stub_client  # noqa: E402
+
+
+def _recall(expected: List[List[UIDwithScore]], actual: List[List[UIDwithScore]]) -> float:
+    return float(
+        np.mean(
+            [
+                len({x.uid for x in a} & {x.uid for x in b}) / max(len(a), 1)
+                for a, b in zip(expected, actual)
+            ]
+        )
+    )
+
+
+def _timed(fn, repeat: int) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--n-docs", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--n-lists", type=int, default=64)
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[2, 4, 8, 16])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    stub = StubOpenSearch(SyntheticCorpus(n_docs=args.n_docs))
+    search = Search()
+    search.opensearch = stub_client(stub)
+    search.vector_index = None
+
+    rng = np.random.default_rng(0)
+    rows = rng.choice(args.n_docs, size=args.queries, replace=False)
+    queries = stub.corpus.embeddings[rows]
+    query_lists = [q.tolist() for q in queries]
+
+    def remote() -> List[List[UIDwithScore]]:
+        return search.search_titles_with_vectors(
+            query_lists, top_k=args.top_k, num_candidates=args.top_k
+        )
+
+    expected = remote()
+    results: Dict[str, Dict[str, float]] = {
+        "opensearch_stub": {
+            "recall": 1.0,
+            "ms_per_query": 1000 * _timed(remote, args.repeat) / args.queries,
+        }
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        exact = VectorIndex.build(search, os.path.join(directory, "exact"))
+        ivf = VectorIndex.build(search, os.path.join(directory, "ivf"), n_lists=args.n_lists)
+
+        runs = [("exact", exact, None)] + [(f"ivf_nprobe{p}", ivf, p) for p in args.n_probe]
+        for name, index, n_probe in runs:
+            def local(index=index, n_probe=n_probe) -> List[List[UIDwithScore]]:
+                return index.search(queries, top_k=args.top_k, n_probe=n_probe)
+
+            results[name] = {
+                "recall": _recall(expected, local()),
+                "ms_per_query": 1000 * _timed(local, args.repeat) / args.queries,
+            }
+
+    print(
+        json.dumps(
+            {
+                "n_docs": args.n_docs,
+                "queries": args.queries,
+                "top_k": args.top_k,
+                "n_lists": args.n_lists,
+                "results": {
+                    name: {k: round(v, 4) for k, v in result.items()}
+                    for name, result in results.items()
+                },
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
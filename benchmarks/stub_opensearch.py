@@ -0,0 +1,518 @@
+"""
+A local stand-in for the `ndltd` OpenSearch index.
+
+It serves a synthetic corpus of theses with random 768-dim embeddings and
+implements the subset of the REST API the backend uses (get, mget, search
+with knn/match/term/aggs, msearch, count, mapping). It can run as an HTTP
+server so the real app can be pointed at it:
+
+    python -m benchmarks.stub_opensearch --port 9200 --n-docs 5000 --latency-ms 20
+    OS_API_URL=http://localhost:9200 OS_API_USER=x OS_API_PWD=x uvicorn main:app
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Any, Collection, Dict, List, Optional, Tuple
+
+import numpy as np
+from opensearchpy import AsyncOpenSearch, OpenSearch
+from opensearchpy.connection import Connection
+
+_DIM = 768
+
+_DEGREES = ["碩士", "博士"]
+_INSTITUTIONS = [f"國立測試大學{i:02d}" for i in range(20)]
+_DEPARTMENTS = [f"測試學系{i:02d}" for i in range(40)]
+_NARROW_FIELDS = [f"狹義領域{i:02d}" for i in range(12)]
+_DETAILED_FIELDS = [f"細學類{i:02d}" for i in range(30)]
+_TYPES_OF_PAPER = ["學術論文", "技術報告"]
+_WORDS = [
+    "深度", "學習", "網路", "分析", "台灣", "教育", "研究", "模型", "系統", "設計",
+    "影響", "策略", "管理", "社會", "文化", "資料", "演算法", "評估", "應用", "發展",
+]
+
+
+class SyntheticCorpus:
+    """
+    Deterministic synthetic corpus shaped like the `ndltd` index.
+    """
+
+    def __init__(
+        self,
+        n_docs: int = 2000,
+        dim: int = _DIM,
+        n_clusters: int = 50,
+        years: Tuple[int, ...] = (107, 108, 109, 110),
+        seed: int = 42,
+    ) -> None:
+        rng = np.random.default_rng(seed)
+        pyrng = random.Random(seed)
+
+        centers = rng.normal(size=(n_clusters, dim)).astype(np.float32)
+        assignment = rng.integers(0, n_clusters, size=n_docs)
+        embeddings = centers[assignment] + 0.6 * rng.normal(size=(n_docs, dim)).astype(
+            np.float32
+        )
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        self.embeddings: np.ndarray = embeddings.astype(np.float32)
+
+        self.uids: List[str] = []
+        self.sources: List[Dict[str, Any]] = []
+        for i in range(n_docs):
+            year = years[i % len(years)]
+            uid = f"{year}THU{i:08d}"
+            if i == 0:
+                uid = "109THU00099005"
+                year = 109
+            title = "".join(pyrng.sample(_WORDS, 4))
+            abstract = "，".join("".join(pyrng.sample(_WORDS, 6)) for _ in range(8))
+            self.uids.append(uid)
+            self.sources.append(
+                {
+                    "uid": uid,
+                    "title": title,
+                    "title_ws": " ".join(title),
+                    "abstract": abstract,
+                    "abstract_ws": " ".join(abstract),
+                    "author": f"作者{i}",
+                    "advisor": [f"指導教授{i % 97}"],
+                    "degree": pyrng.choice(_DEGREES),
+                    "institution": pyrng.choice(_INSTITUTIONS),
+                    "department": pyrng.choice(_DEPARTMENTS),
+                    "narrow_field": _NARROW_FIELDS[assignment[i] % len(_NARROW_FIELDS)],
+                    "detailed_field": _DETAILED_FIELDS[assignment[i] % len(_DETAILED_FIELDS)],
+                    "graduated_academic_year": year,
+                    "url": f"https://hdl.handle.net/11296/{uid}",
+                    "keywords": pyrng.sample(_WORDS, 3),
+                    "types_of_paper": pyrng.choice(_TYPES_OF_PAPER),
+                    "language": "zh_TW",
+                }
+            )
+        self.position: Dict[str, int] = {uid: i for i, uid in enumerate(self.uids)}
+        self._embedding_lists: Dict[int, List[float]] = {}
+        self._columns: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.uids)
+
+    def source(self, i: int) -> Dict[str, Any]:
+        source = dict(self.sources[i])
+        if i not in self._embedding_lists:
+            self._embedding_lists[i] = self.embeddings[i].tolist()
+        source["embedding"] = self._embedding_lists[i]
+        return source
+
+    def column(self, field: str) -> np.ndarray:
+        if field not in self._columns:
+            self._columns[field] = np.array(
+                [s.get(field) for s in self.sources], dtype=object
+            )
+        return self._columns[field]
+
+
+def _split_fields(value: Optional[Any]) -> Optional[List[str]]:
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+    return [x for x in str(value).split(",") if x]
+
+
+def _filter_source(
+    source: Dict[str, Any], includes: Optional[List[str]], excludes: Optional[List[str]]
+) -> Dict[str, Any]:
+    if includes:
+        source = {k: v for k, v in source.items() if k in includes}
+    if excludes:
+        source = {k: v for k, v in source.items() if k not in excludes}
+    return source
+
+
+class StubOpenSearch:
+    """
+    Request handler that answers OpenSearch REST calls from a `SyntheticCorpus`.
+
+    Every handled request increments `round_trips`, so callers can count how
+    many calls a code path makes.
+    """
+
+    def __init__(self, corpus: SyntheticCorpus, index: str = "ndltd") -> None:
+        self.corpus = corpus
+        self.index = index
+        self.round_trips = 0
+        self._pits: Dict[str, int] = {}
+        self._scrolls: Dict[str, Tuple[List[int], Dict[str, Any]]] = {}
+
+    # -- dispatch -------------------------------------------------------------
+
+    def handle(
+        self, method: str, path: str, params: Dict[str, Any], body: Any
+    ) -> Tuple[int, Any]:
+        self.round_trips += 1
+        path = path.split("?")[0].rstrip("/")
+        parts = [p for p in path.split("/") if p]
+
+        if isinstance(body, (bytes, bytearray)):
+            body = body.decode("utf-8")
+        if parts and parts[-1] == "_msearch":
+            return 200, self._msearch(body, params)
+        if isinstance(body, str) and body:
+            body = json.loads(body)
+
+        if not parts:
+            return 200, {"version": {"number": "2.11.0", "distribution": "opensearch"}}
+        if parts[-2:] == ["_search", "point_in_time"]:
+            if method == "DELETE":
+                return 200, {"pits": []}
+            pit_id = f"pit-{len(self._pits)}"
+            self._pits[pit_id] = len(self.corpus)
+            return 200, {"pit_id": pit_id}
+        if parts[-2:] == ["_search", "scroll"]:
+            if method == "DELETE":
+                return 200, {"succeeded": True}
+            return 200, self._scroll(body)
+        if len(parts) == 3 and parts[1] == "_doc":
+            return self._get(parts[2], params)
+        if parts[-1] == "_mget":
+            return 200, self._mget(body, params)
+        if parts[-1] == "_search":
+            return 200, self._search(body or {}, params)
+        if parts[-1] == "_count":
+            return 200, {"count": len(self.corpus)}
+        if parts[-1] == "_mapping":
+            return 200, {self.index: {"mappings": {"_meta": {"version": "stub"}}}}
+        return 404, {"error": f"unsupported path {path}"}
+
+    # -- documents ------------------------------------------------------------
+
+    def _doc(self, uid: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        i = self.corpus.position.get(uid)
+        if i is None:
+            return {"_index": self.index, "_id": uid, "found": False}
+        return {
+            "_index": self.index,
+            "_id": uid,
+            "found": True,
+            "_source": _filter_source(
+                self.corpus.source(i),
+                _split_fields(params.get("_source_includes")),
+                _split_fields(params.get("_source_excludes")),
+            ),
+        }
+
+    def _get(self, uid: str, params: Dict[str, Any]) -> Tuple[int, Any]:
+        doc = self._doc(uid, params)
+        return (200 if doc["found"] else 404), doc
+
+    def _mget(self, body: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        ids = body.get("ids") or [d["_id"] for d in body.get("docs", [])]
+        return {"docs": [self._doc(uid, params) for uid in ids]}
+
+    # -- search ---------------------------------------------------------------
+
+    def _msearch(self, body: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        lines = [json.loads(x) for x in body.splitlines() if x.strip()]
+        responses = []
+        for header, query in zip(lines[0::2], lines[1::2]):
+            merged = dict(params)
+            merged.update(header)
+            responses.append(dict(self._search(query, merged), status=200))
+        return {"took": 1, "responses": responses}
+
+    def _matches(self, query: Optional[Dict[str, Any]]) -> np.ndarray:
+        n = len(self.corpus)
+        mask = np.ones(n, dtype=bool)
+        if not query:
+            return mask
+        if "bool" in query:
+            clauses = []
+            for key in ("must", "filter"):
+                value = query["bool"].get(key, [])
+                clauses += value if isinstance(value, list) else [value]
+            for clause in clauses:
+                mask &= self._matches(clause)
+            return mask
+        if "term" in query or "terms" in query:
+            kind = "term" if "term" in query else "terms"
+            field, value = next(iter(query[kind].items()))
+            if isinstance(value, dict):
+                value = value.get("value")
+            values = value if isinstance(value, list) else [value]
+            return np.isin(self.corpus.column(field), values)
+        if "match_all" in query:
+            return mask
+        return mask
+
+    def _score_text(self, query: Dict[str, Any]) -> np.ndarray:
+        if "match" in query:
+            fields = [next(iter(query["match"].keys()))]
+            text = next(iter(query["match"].values()))
+        else:
+            fields = [f.split("^")[0] for f in query["multi_match"]["fields"]]
+            text = query["multi_match"]["query"]
+        if isinstance(text, dict):
+            text = text["query"]
+        tokens = set(str(text))
+        scores = np.zeros(len(self.corpus), dtype=np.float32)
+        for i, source in enumerate(self.corpus.sources):
+            for field in fields:
+                scores[i] += len(tokens & set(str(source.get(field, ""))))
+        return scores
+
+    def _search(self, body: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        query = body.get("query") or {}
+        size = int(body.get("size", params.get("size", 10)))
+        scores = np.ones(len(self.corpus), dtype=np.float32)
+        mask = np.ones(len(self.corpus), dtype=bool)
+
+        if "knn" in query:
+            field = next(iter(query["knn"].values()))
+            vector = np.asarray(field["vector"], dtype=np.float32)
+            diff = self.corpus.embeddings - vector
+            scores = 1.0 / (1.0 + np.einsum("ij,ij->i", diff, diff))
+            if "filter" in field:
+                mask &= self._matches(field["filter"])
+            order = np.argsort(-scores, kind="stable")
+            order = order[mask[order]][: int(field["k"])]
+            mask = np.zeros_like(mask)
+            mask[order] = True
+        elif "match" in query or "multi_match" in query:
+            scores = self._score_text(query)
+            mask &= scores > 0
+        else:
+            mask &= self._matches(query)
+
+        total = int(mask.sum())
+        aggregations = (
+            {name: self._agg(spec, mask) for name, spec in body["aggs"].items()}
+            if "aggs" in body
+            else None
+        )
+
+        candidates = np.flatnonzero(mask)
+        if "sort" in body:
+            candidates = sorted(candidates, key=lambda i: self.corpus.uids[i])
+            if body.get("search_after"):
+                after = body["search_after"][0]
+                candidates = [i for i in candidates if self.corpus.uids[i] > after]
+        else:
+            candidates = sorted(candidates, key=lambda i: -scores[i])
+        if "slice" in body:
+            slice_id, slice_max = body["slice"]["id"], body["slice"]["max"]
+            candidates = [i for i in candidates if i % slice_max == slice_id]
+
+        includes = _split_fields(params.get("_source_includes"))
+        excludes = _split_fields(params.get("_source_excludes"))
+        source_spec = body.get("_source")
+        if isinstance(source_spec, dict):
+            includes = source_spec.get("includes", includes)
+            excludes = source_spec.get("excludes", excludes)
+        elif isinstance(source_spec, list):
+            includes = source_spec
+
+        page = dict(
+            scores=scores, includes=includes, excludes=excludes, size=size, sort="sort" in body
+        )
+        candidates = list(candidates)
+        hits = self._hits(candidates[:size], page)
+
+        response = {
+            "took": 1,
+            "timed_out": False,
+            "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+            "hits": {"total": {"value": total, "relation": "eq"}, "hits": hits},
+        }
+        if "pit" in body:
+            response["pit_id"] = body["pit"]["id"]
+        if aggregations is not None:
+            response["aggregations"] = aggregations
+        if "scroll" in params:
+            scroll_id = f"scroll-{len(self._scrolls)}"
+            self._scrolls[scroll_id] = (candidates[size:], page)
+            response["_scroll_id"] = scroll_id
+        return response
+
+    def _hits(self, candidates: List[int], page: Dict[str, Any]) -> List[Dict[str, Any]]:
+        hits = []
+        for i in candidates:
+            hit = {
+                "_index": self.index,
+                "_id": self.corpus.uids[i],
+                "_score": float(page["scores"][i]),
+                "_source": _filter_source(
+                    self.corpus.source(i), page["includes"], page["excludes"]
+                ),
+            }
+            if page["sort"]:
+                hit["sort"] = [self.corpus.uids[i]]
+            hits.append(hit)
+        return hits
+
+    def _scroll(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        scroll_id = body["scroll_id"]
+        remaining, page = self._scrolls[scroll_id]
+        self._scrolls[scroll_id] = (remaining[page["size"] :], page)
+        return {
+            "_scroll_id": scroll_id,
+            "took": 1,
+            "timed_out": False,
+            "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+            "hits": {
+                "total": {"value": len(remaining), "relation": "eq"},
+                "hits": self._hits(remaining[: page["size"]], page),
+            },
+        }
+
+    def _agg(self, spec: Dict[str, Any], mask: np.ndarray) -> Dict[str, Any]:
+        sub_aggs = spec.get("aggs", {})
+
+        def bucket(key: Any, bucket_mask: np.ndarray) -> Dict[str, Any]:
+            result = {"key": key, "doc_count": int(bucket_mask.sum())}
+            for name, sub_spec in sub_aggs.items():
+                result[name] = self._agg(sub_spec, bucket_mask)
+            return result
+
+        if "terms" in spec:
+            field = spec["terms"]["field"]
+            size = spec["terms"].get("size", 10)
+            values = self.corpus.column(field)
+            counts: Dict[Any, int] = {}
+            for value in values[mask]:
+                if value is not None:
+                    counts[value] = counts.get(value, 0) + 1
+            keys = sorted(counts, key=lambda k: (-counts[k], str(k)))[:size]
+            return {
+                "doc_count_error_upper_bound": 0,
+                "sum_other_doc_count": sum(counts.values())
+                - sum(counts[k] for k in keys),
+                "buckets": [bucket(k, mask & (values == k)) for k in keys],
+            }
+        if "filters" in spec:
+            filters = spec["filters"]["filters"]
+            return {
+                "buckets": {
+                    name: bucket(name, mask & self._matches(clause))
+                    for name, clause in filters.items()
+                }
+            }
+        raise ValueError(f"unsupported aggregation {spec}")
+
+
+class StubConnection(Connection):
+    """
+    In-process transport that hands requests straight to a `StubOpenSearch`,
+    so the real client code path runs without any network:
+
+        OpenSearch(connection_class=StubConnection, stub=stub)
+
+    `latency_ms` adds a sleep per request to stand in for the network and
+    the cluster.
+    """
+
+    def __init__(self, stub: StubOpenSearch, latency_ms: float = 0.0, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.stub = stub
+        self.latency_ms = latency_ms
+
+    def _respond(
+        self,
+        method: str,
+        url: str,
+        params: Optional[Dict[str, Any]],
+        body: Optional[bytes],
+        ignore: Collection[int],
+    ) -> Tuple[int, Dict[str, str], str]:
+        status, payload = self.stub.handle(method, url, dict(params or {}), body)
+        raw = json.dumps(payload)
+        if not (200 <= status < 300) and status not in ignore:
+            self._raise_error(status, raw)
+        return status, {}, raw
+
+    def perform_request(
+        self,
+        method: str,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        body: Optional[bytes] = None,
+        timeout: Optional[float] = None,
+        ignore: Collection[int] = (),
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Tuple[int, Dict[str, str], str]:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return self._respond(method, url, params, body, ignore)
+
+
+class AsyncStubConnection(StubConnection):
+    """
+    Asyncio counterpart of `StubConnection`, for `AsyncOpenSearch`.
+    """
+
+    async def perform_request(
+        self,
+        method: str,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        body: Optional[bytes] = None,
+        timeout: Optional[float] = None,
+        ignore: Collection[int] = (),
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Tuple[int, Dict[str, str], str]:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return self._respond(method, url, params, body, ignore)
+
+    async def close(self) -> None:
+        pass
+
+
+def stub_client(stub: StubOpenSearch, latency_ms: float = 0.0) -> OpenSearch:
+    """
+    Returns a synchronous `OpenSearch` client wired to `stub` in-process.
+    """
+    return OpenSearch(
+        hosts="http://stub:9200", connection_class=StubConnection, stub=stub, latency_ms=latency_ms
+    )
+
+
+def async_stub_client(stub: StubOpenSearch, latency_ms: float = 0.0) -> AsyncOpenSearch:
+    """
+    Returns an `AsyncOpenSearch` client wired to `stub` in-process.
+    """
+    return AsyncOpenSearch(
+        hosts="http://stub:9200", connection_class=AsyncStubConnection, stub=stub, latency_ms=latency_ms
+    )
+
+
+def serve(stub: StubOpenSearch, host: str, port: int, latency_ms: float) -> None:
+    """
+    Serves the stub over HTTP with an artificial per-request latency.
+    """
+    from aiohttp import web
+
+    async def handler(request: "web.Request") -> "web.Response":
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        body = await request.read()
+        status, payload = stub.handle(
+            request.method, request.path, dict(request.query), body or None
+        )
+        return web.json_response(payload, status=status)
+
+    app = web.Application(client_max_size=1024**3)
+    app.router.add_route("*", "/{tail:.*}", handler)
+    web.run_app(app, host=host, port=port, print=None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--n-docs", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    args = parser.parse_args()
+    serve(StubOpenSearch(SyntheticCorpus(n_docs=args.n_docs)), args.host, args.port, args.latency_ms)
@@ -1,14 +1,89 @@
+import asyncio
+import fcntl
+import os
+from contextlib import asynccontextmanager
+from typing import IO, Optional
+
 from fastapi import FastAPI
 from app.api import api_router
+from app.api import metrics
+from app.api.compression import CompressionMiddleware, init_compression_kwargs
 
+from app.services import get_async_search, get_search
 from app.services.constants import _VERSION, _API_PREFIX
+from app.services.encoder import get_encoder
+from app.services.stats_store import get_stats_store
+
+# Held open for the life of the worker that won the election.
+_leader_lock: Optional[IO] = None
+
+def _elect_leader() -> bool:
+    """
+    Returns whether this process does the once-per-host startup work.
+
+    serve.py's workers share LEADER_LOCK_FILE and the first to lock it is
+    the leader; a process started on its own always is.
+    """
+    global _leader_lock
+    LEADER_LOCK_FILE = os.getenv("LEADER_LOCK_FILE")
+    if not LEADER_LOCK_FILE:
+        return True
+    f = open(LEADER_LOCK_FILE, "a")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        return False
+    _leader_lock = f
+    return True
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The services are built here, not at import, and handed to the routes
+    # by `app.api.dependencies`.
+    async_search = get_async_search()
+    await async_search.connect()
+    encoder = get_encoder()
+    stats_store = get_stats_store()
+    # Only the leader warms up the encoder and rebuilds the stats snapshot;
+    # other workers load the encoder on first use and reload the snapshot file.
+    leader = _elect_leader()
+    encoder_warmup = None
+    if leader and os.getenv("ENCODER_WARMUP", "true").lower() == "true":
+        encoder_warmup = asyncio.create_task(encoder.awarmup())
+    stats_refresh = None
+    if stats_store.enabled:
+        await asyncio.to_thread(stats_store.load)
+        interval = float(os.getenv("STATS_REFRESH_INTERVAL", "300"))
+        if leader:
+            stats_refresh = asyncio.create_task(stats_store.run_refresh_loop(get_search(), interval=interval))
+        else:
+            stats_refresh = asyncio.create_task(stats_store.run_reload_loop(interval=interval))
+    metrics_flush = None
+    if metrics.registry.directory is not None:
+        interval = float(os.getenv("METRICS_FLUSH_INTERVAL", "1"))
+        metrics_flush = asyncio.create_task(metrics.registry.run_flush_loop(interval))
+    yield
+    if metrics_flush is not None:
+        metrics_flush.cancel()
+    if stats_refresh is not None:
+        stats_refresh.cancel()
+    if encoder_warmup is not None:
+        encoder_warmup.cancel()
+    await encoder.close()
+    await async_search.close()
 
 app = FastAPI(
     title="NDLTD TW Papers Graph",
     description="API for NDLTD TW Papers Graph",
     version=_VERSION,
+    lifespan=lifespan,
 )
 app.include_router(api_router, prefix=_API_PREFIX)
+app.include_router(metrics.router)
+# Added first so it runs inside the metrics middleware, which then sees compressed sizes.
+app.add_middleware(CompressionMiddleware, **init_compression_kwargs())
+app.add_middleware(metrics.MetricsMiddleware, server_timing=metrics.server_timing_enabled())
 
 @app.get("/")
 def read_root():
@@ -0,0 +1,134 @@
+"""
+Production entry point: warms the shared caches once, then serves `main:app`
+with one uvicorn worker process per core.
+
+    WORKERS=8 SHARED_CACHE_DIR=/dev/shm/ndltd PRELOAD_UIDS_FILE=hot_uids.txt python serve.py
+
+WORKERS defaults to the number of cores this process may use, as limited
+by its CPU affinity and cgroup CPU quota. Several workers need
+SHARED_CACHE_DIR, where embeddings, documents, similarity networks and
+summaries are shared by every worker on the host: with per-process
+caches, DELETE /document/similarity/cache would only clear the worker that
+received it. Without it, a default count falls back to one worker and an
+explicit WORKERS above 1 is refused. With
+PRELOAD_UIDS_FILE, the networks of the uids it lists, one per line, are
+built into the shared caches before the workers start.
+
+One worker is elected, through a lock file, to warm up the query encoder
+and rebuild the stats snapshot; the others load the encoder on first use
+and reload the snapshot file when it changes.
+
+With SHARED_CACHE_DIR, the workers also write their metrics under its
+`metrics` directory, so that GET /metrics on any worker reports the
+totals of all of them.
+"""
+import contextlib
+import glob
+import logging
+import os
+import tempfile
+from typing import Optional
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+
+def _cpu_quota() -> Optional[float]:
+    # The cgroup CPU limit in cores (v2, then v1), or None when unlimited.
+    try:
+        with open("/sys/fs/cgroup/cpu.max", encoding="utf-8") as f:
+            quota, period = f.read().split()[:2]
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", encoding="utf-8") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us", encoding="utf-8") as f:
+            period = int(f.read())
+        return None if quota <= 0 else quota / period
+    except (OSError, ValueError):
+        return None
+
+
+def _available_cpus() -> int:
+    """
+    Returns the number of cores this process may use: the CPU affinity
+    mask, capped by the cgroup quota of a container.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    quota = _cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, max(int(quota), 1))
+    return cpus
+
+
+def _workers() -> int:
+    WORKERS = os.getenv("WORKERS")
+    if os.getenv("SHARED_CACHE_DIR"):
+        return int(WORKERS) if WORKERS else _available_cpus()
+    if WORKERS and int(WORKERS) > 1:
+        raise SystemExit(
+            "WORKERS > 1 requires SHARED_CACHE_DIR: per-worker caches cannot all be invalidated"
+        )
+    if not WORKERS and _available_cpus() > 1:
+        logger.warning("Serving with 1 worker: set SHARED_CACHE_DIR to run one per core")
+    return 1
+
+
+def preload() -> None:
+    """
+    Builds the similarity networks of the uids in PRELOAD_UIDS_FILE, with
+    the default parameters of `/document/similarity`, into the shared caches.
+    """
+    PRELOAD_UIDS_FILE = os.getenv("PRELOAD_UIDS_FILE")
+    if not PRELOAD_UIDS_FILE:
+        return
+    if not os.getenv("SHARED_CACHE_DIR"):
+        logger.warning("PRELOAD_UIDS_FILE is ignored without SHARED_CACHE_DIR: the workers would not see it")
+        return
+
+    from app.services import os_search
+
+    with open(PRELOAD_UIDS_FILE, encoding="utf-8") as f:
+        uids = [line.strip() for line in f if line.strip()]
+    try:
+        for _ in os_search.iter_document_similarity_networks(uids=uids):
+            pass
+    except Exception:
+        # A cold cache is slower, not broken.
+        logger.exception("Preloading %s failed", PRELOAD_UIDS_FILE)
+        return
+    logger.info("Preloaded the networks of %d uids", len(uids))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    preload()
+    workers = _workers()
+    # The workers inherit the path and elect a leader by locking the file.
+    fd, leader_lock = tempfile.mkstemp(prefix="ndltd-leader-", suffix=".lock")
+    os.close(fd)
+    os.environ["LEADER_LOCK_FILE"] = leader_lock
+    SHARED_CACHE_DIR = os.getenv("SHARED_CACHE_DIR")
+    if SHARED_CACHE_DIR:
+        metrics_dir = os.path.join(SHARED_CACHE_DIR, "metrics")
+        os.makedirs(metrics_dir, mode=0o700, exist_ok=True)
+        # Totals start from zero with every server, as Prometheus expects of a restart.
+        for path in glob.glob(os.path.join(metrics_dir, "worker-*.json")):
+            os.remove(path)
+        os.environ["METRICS_DIR"] = metrics_dir
+    try:
+        uvicorn.run(
+            "main:app",
+            host=os.getenv("HOST", "0.0.0.0"),
+            port=int(os.getenv("PORT", "8777")),
+            workers=workers,
+        )
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(leader_lock)
@@ -0,0 +1,12 @@
+import pytest
+
+
+@pytest.fixture(autouse=True, scope="module")
+def lifespan(request):
+    # Startup connects the search client; the module's requests then share its event loop.
+    client = getattr(request.module, "client", None)
+    if client is None:
+        yield
+        return
+    with client:
+        yield
@@ -1,12 +1,15 @@
+import json
 import os
 import sys
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import numpy as np
 import pytest
 from fastapi.testclient import TestClient
 
 from app.services.constants import _API_PREFIX
+from app.services.encoder import get_encoder
 from main import app
 
 client = TestClient(
@@ -26,4 +29,320 @@ def test_get_document_similarity():
     data = response.json()
     assert "nodes" in data
     assert "edges" in data
-    assert "documents" in data
\ No newline at end of file
+    assert "documents" in data
+
+def test_get_document_similarity_compact():
+    params = {"uid": "109THU00099005", "layer": 2, "n_results": 5}
+    full = client.get(f"{_API_PREFIX}/document/similarity", params=params).json()
+    response = client.get(
+        f"{_API_PREFIX}/document/similarity",
+        params={**params, "format": "compact"},
+        headers={"accept-encoding": "gzip"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    data = response.json()
+    assert data["uids"] == [x["uid"] for x in full["nodes"]]
+    assert [(data["uids"][s], data["uids"][t]) for s, t in zip(data["sources"], data["targets"])] == [
+        (x["source"], x["target"]) for x in full["edges"]
+    ]
+    assert "abstract" not in data["documents"]
+    assert data["documents"]["title"][0] == full["documents"][data["uids"][0]]["title"]
+
+    abstracts = client.get(f"{_API_PREFIX}/document/abstracts", params={"uid": data["uids"][:3]}).json()
+    assert abstracts == {uid: full["documents"][uid]["abstract"] for uid in data["uids"][:3]}
+
+def test_get_document_similarity_analytics():
+    params = {"uid": "109THU00099005", "layer": 2, "n_results": 5}
+    plain = client.get(f"{_API_PREFIX}/document/similarity", params=params).json()
+    response = client.get(f"{_API_PREFIX}/document/similarity", params={**params, "analytics": True})
+    assert response.status_code == 200
+    data = response.json()
+    assert [x["uid"] for x in data["nodes"]] == [x["uid"] for x in plain["nodes"]]
+    assert data["edges"] == plain["edges"]
+    assert all(set(x) == {"uid", "layer"} for x in plain["nodes"])
+    assert abs(sum(x["pagerank"] for x in data["nodes"]) - 1) < 1e-3
+    # The network of one seed is connected.
+    assert {x["component"] for x in data["nodes"]} == {0}
+    degree = {x["uid"]: 0.0 for x in data["nodes"]}
+    for edge in data["edges"]:
+        if edge["source"] != edge["target"]:
+            degree[edge["source"]] += edge["score"]
+            degree[edge["target"]] += edge["score"]
+    assert all(abs(x["weighted_degree"] - degree[x["uid"]]) < 1e-3 for x in data["nodes"])
+
+    compact = client.get(
+        f"{_API_PREFIX}/document/similarity", params={**params, "analytics": True, "format": "compact"}
+    ).json()
+    assert compact["analytics"]["community"] == [x["community"] for x in data["nodes"]]
+
+def test_invalidate_similarity_cache_requires_token():
+    response = client.delete(f"{_API_PREFIX}/document/similarity/cache")
+    assert response.status_code == 403
+
+def test_invalidate_similarity_cache_clears_embeddings(monkeypatch):
+    from app.services.cache import get_embedding_cache
+    embedding_cache = get_embedding_cache()
+
+    monkeypatch.setenv("CACHE_ADMIN_TOKEN", "secret")
+    embedding_cache.put("stale", [0.0] * 768)
+    response = client.delete(f"{_API_PREFIX}/document/similarity/cache", headers={"admin-token": "secret"})
+    assert response.status_code == 200
+    assert embedding_cache.get("stale") is None
+
+def test_get_document_similarity_with_field_filter():
+    narrow_field = client.get(
+        f"{_API_PREFIX}/document/", params={"uid": "109THU00099005"}
+    ).json()["narrow_field"]
+    response = client.get(
+        f"{_API_PREFIX}/document/similarity",
+        params={"uid": "109THU00099005", "narrow_field": narrow_field, "num_candidates": 50},
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data["nodes"]) > 1
+    for uid, document in data["documents"].items():
+        assert document["narrow_field"] == narrow_field
+
+def test_get_document_similarity_deadline_in_hydration(monkeypatch):
+    from opensearchpy.exceptions import ConnectionTimeout
+
+    from app.services import os_search
+
+    mget = os_search.opensearch.mget
+    timeouts = []
+
+    def slow_document_mget(**kwargs):
+        timeouts.append(kwargs.get("request_timeout"))
+        if "_source_excludes" in kwargs:
+            raise ConnectionTimeout("TIMEOUT", "read timed out", None)
+        return mget(**kwargs)
+
+    monkeypatch.setattr(os_search.opensearch, "mget", slow_document_mget)
+    os_search.document_cache.invalidate()
+    network = os_search.get_document_similarity_network(
+        "109THU00099005", layer=2, n_results=4, symmetric=True, deadline_ms=60_000
+    )
+    assert network[3]
+    assert network[2] == {}
+    assert timeouts and all(0 < x <= 60 for x in timeouts)
+
+def test_get_document_similarity_deadline():
+    params = {"uid": "109THU00099005", "layer": 3, "n_results": 4}
+    response = client.get(
+        f"{_API_PREFIX}/document/similarity", params={**params, "deadline_ms": 1}
+    )
+    assert response.status_code == 200
+    partial = response.json()
+    assert partial["truncated"]
+    assert {x["uid"] for x in partial["nodes"]} == set(partial["documents"])
+    full = client.get(f"{_API_PREFIX}/document/similarity", params=params).json()
+    assert not full["truncated"]
+    assert len(full["nodes"]) > len(partial["nodes"])
+
+def test_stream_document_similarity():
+    params = {"uid": "109THU00099005", "layer": 2, "n_results": 5}
+    expected = client.get(f"{_API_PREFIX}/document/similarity", params=params).json()
+    response = client.get(f"{_API_PREFIX}/document/similarity/stream", params=params)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    nodes, edges, documents = [], [], {}
+    for line in response.text.splitlines():
+        chunk = json.loads(line)
+        nodes += chunk["nodes"]
+        edges += chunk["edges"]
+        documents.update(chunk["documents"])
+    assert nodes == expected["nodes"]
+    assert edges == expected["edges"]
+    assert documents == expected["documents"]
+
+def test_get_document_similarity_symmetric():
+    response = client.get(
+        f"{_API_PREFIX}/document/similarity",
+        params={"uid": "109THU00099005", "layer": 2, "n_results": 5, "symmetric": True},
+    )
+    assert response.status_code == 200
+    pairs = [frozenset((x["source"], x["target"])) for x in response.json()["edges"]]
+    assert len(pairs) == len(set(pairs))
+
+class _FakeSentenceTransformer:
+    def encode(self, sentences, **kwargs):
+        return np.ones((len(sentences), 768), dtype=np.float32)
+
+def test_search_semantic():
+    get_encoder()._model = _FakeSentenceTransformer()
+    try:
+        response = client.get(
+            f"{_API_PREFIX}/document/semantic", params={"query": "深度學習", "top_k": 5}
+        )
+    finally:
+        get_encoder()._model = None
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data) == 5
+    assert all("uid" in x and "score" in x for x in data)
+
+def test_search_title_hybrid_pagination():
+    get_encoder()._model = _FakeSentenceTransformer()
+    try:
+        first = client.get(
+            f"{_API_PREFIX}/document/title/hybrid", params={"query": "深度學習", "size": 5}
+        ).json()
+        second = client.get(
+            f"{_API_PREFIX}/document/title/hybrid",
+            params={"query": "深度學習", "size": 5, "search_after": first["search_after"]},
+        ).json()
+    finally:
+        get_encoder()._model = None
+    assert len(first["hits"]) == 5
+    assert set(first["hits"][0]) == {"uid", "title", "graduated_academic_year", "institution", "score"}
+    assert not {x["uid"] for x in first["hits"]} & {x["uid"] for x in second["hits"]}
+    assert first["hits"][-1]["score"] >= second["hits"][0]["score"]
+
+class _BrokenSentenceTransformer:
+    def encode(self, sentences, **kwargs):
+        raise OSError("model files are missing")
+
+def test_search_with_broken_encoder():
+    get_encoder()._model = _BrokenSentenceTransformer()
+    try:
+        semantic = client.get(f"{_API_PREFIX}/document/semantic", params={"query": "類神經網路"})
+        hybrid = client.get(f"{_API_PREFIX}/document/title/hybrid", params={"query": "類神經網路", "size": 5})
+    finally:
+        get_encoder()._model = None
+    assert semantic.status_code == 503
+    assert hybrid.status_code == 200
+    assert len(hybrid.json()["hits"]) == 5
+
+def test_stream_document_similarity_from_knn_graph(tmp_path):
+    from app.services import os_async_search, os_search
+    from app.services.knn_graph import KnnGraph
+
+    params = {"uid": "109THU00099005", "layer": 2, "n_results": 5}
+    expected = client.get(f"{_API_PREFIX}/document/similarity/stream", params=params).text
+    os_async_search.knn_graph = KnnGraph.build(os_search, str(tmp_path), k=10, workers=1)
+    try:
+        response = client.get(f"{_API_PREFIX}/document/similarity/stream", params=params)
+    finally:
+        os_async_search.knn_graph = None
+    assert response.status_code == 200
+    assert response.text == expected
+
+def test_rebuild_knn_graph(tmp_path):
+    from app.services import os_search
+    from app.services.knn_graph import KnnGraph
+
+    directory = tmp_path / "graph"
+    KnnGraph.build(os_search, str(directory), k=5, workers=1)
+    graph = KnnGraph.build(os_search, str(directory), k=10, workers=1)
+    assert graph.k == 10
+    assert sorted(os.listdir(tmp_path)) == ["graph"]
+
+    unrelated = tmp_path / "unrelated"
+    unrelated.mkdir()
+    (unrelated / "keep.txt").write_text("x")
+    with pytest.raises(FileExistsError):
+        KnnGraph.build(os_search, str(unrelated), k=5, workers=1)
+    assert (unrelated / "keep.txt").exists()
+
+def test_get_document_from_doc_store(tmp_path):
+    from app.services import os_async_search, os_search
+    from app.services.doc_store import DocumentStore
+
+    params = {"uid": "109THU00099005"}
+    expected = client.get(f"{_API_PREFIX}/document/", params=params).json()
+    os_async_search.doc_store = DocumentStore.build(os_search, str(tmp_path))
+    try:
+        response = client.get(f"{_API_PREFIX}/document/", params=params)
+    finally:
+        os_async_search.doc_store = None
+    assert response.status_code == 200
+    assert response.json() == expected
+
+def test_batch_document_similarity():
+    from app.services import os_async_search
+    from app.services.cache import MemoryCacheBackend, ResultCache
+
+    params = {"layer": 1, "n_results": 3}
+    seed = client.get(
+        f"{_API_PREFIX}/document/similarity", params={"uid": "109THU00099005", **params}
+    ).json()
+    uids = [node["uid"] for node in seed["nodes"]]
+    network_cache = os_async_search.network_cache
+    os_async_search.network_cache = ResultCache(MemoryCacheBackend(), ttl=0)
+    try:
+        response = client.post(f"{_API_PREFIX}/document/similarity/batch", json={"uids": uids, **params})
+        merged = client.post(
+            f"{_API_PREFIX}/document/similarity/batch", json={"uids": uids, "merge": True, **params}
+        ).json()
+        expected = [
+            client.get(f"{_API_PREFIX}/document/similarity", params={"uid": uid, **params}).json()
+            for uid in uids
+        ]
+    finally:
+        os_async_search.network_cache = network_cache
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["uid"] for line in lines] == uids
+    assert [line["network"] for line in lines] == expected
+    assert [node["uid"] for node in merged["nodes"][: len(uids)]] == uids
+    assert {node["uid"] for node in merged["nodes"]} == {
+        node["uid"] for network in expected for node in network["nodes"]
+    }
+
+def test_batch_document_similarity_bounds(monkeypatch):
+    from app.services import os_search, search
+    from app.services.cache import MemoryCacheBackend, ResultCache
+
+    for body in ({"uids": ["x"] * 10001}, {"uids": ["x"], "layer": 6}, {"uids": ["x"], "n_results": 0}):
+        response = client.post(f"{_API_PREFIX}/document/similarity/batch", json=body)
+        assert response.status_code == 422
+
+    # Neighbours evicted between batches are searched again, with the same networks.
+    seed = os_search.get_document_similarity_network(uid="109THU00099005", layer=1, n_results=3)
+    uids = [node.uid for node in seed[0]]
+    monkeypatch.setattr(os_search, "network_cache", ResultCache(MemoryCacheBackend(), ttl=0))
+    shared = list(os_search.iter_document_similarity_networks(uids, layer=1, n_results=3, batch_size=1))
+    monkeypatch.setattr(search, "_BATCH_NEIGHBOURS", 1)
+    evicted = list(os_search.iter_document_similarity_networks(uids, layer=1, n_results=3, batch_size=1))
+    assert evicted == shared
+
+def test_network_cache_survives_cancelled_leader():
+    import asyncio
+
+    from app.services.cache import MemoryCacheBackend, ResultCache
+
+    cache = ResultCache(MemoryCacheBackend(), ttl=60)
+
+    async def compute():
+        await asyncio.sleep(0.05)
+        return "network"
+
+    async def main():
+        leader = asyncio.create_task(cache.aget_or_compute("key", compute))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.aget_or_compute("key", compute))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await waiter
+
+    assert asyncio.run(main()) == "network"
+    assert cache.stats() == {"hits": 0, "misses": 1, "coalesced": 1, "entries": 1}
+
+def test_get_document_through_shared_cache(tmp_path):
+    from app.services import os_async_search
+    from app.services.cache import ResultCache, SharedMemoryBackend
+
+    path = str(tmp_path / "document.shm")
+    params = {"uid": "109THU00099005"}
+    expected = client.get(f"{_API_PREFIX}/document/", params=params).json()
+    document_cache = os_async_search.document_cache
+    os_async_search.document_cache = ResultCache(SharedMemoryBackend(path, slots=64, slot_size=16384), ttl=60)
+    try:
+        response = client.get(f"{_API_PREFIX}/document/", params=params)
+    finally:
+        os_async_search.document_cache = document_cache
+    # Another worker maps the same table.
+    other = SharedMemoryBackend(path, slots=64, slot_size=16384)
+    assert response.json() == expected
+    assert other.get("109THU00099005").model_dump() == expected
@@ -0,0 +1,35 @@
+import io
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+
+from app.services.constants import _API_PREFIX
+from app.services.export import iter_embedding_blocks
+from main import app
+
+client = TestClient(
+    app=app
+)
+
+def test_export_documents():
+    params = {"year": 109, "fields": ["title"], "batch_size": 50}
+    response = client.get(f"{_API_PREFIX}/export/documents", params=params)
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines and all(set(line) == {"uid", "title"} for line in lines)
+    uids = [line["uid"] for line in lines]
+    assert uids == sorted(set(uids))
+
+    response = client.get(f"{_API_PREFIX}/export/documents", params={**params, "slices": 3})
+    assert response.status_code == 200
+    assert sorted(json.loads(line)["uid"] for line in response.text.splitlines()) == uids
+
+    response = client.get(f"{_API_PREFIX}/export/documents", params={**params, "format": "f32"})
+    assert response.status_code == 200
+    blocks = list(iter_embedding_blocks(io.BytesIO(response.content)))
+    assert [uid for block_uids, _ in blocks for uid in block_uids] == uids
+    assert all(matrix.shape == (len(block_uids), 768) for block_uids, matrix in blocks)
@@ -16,3 +16,63 @@ def test_health():
     response = client.get("/health")
     assert response.status_code == 200
     assert response.json() == {"status": "ok"}
+
+def test_metrics():
+    client.get("/health")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'ndltd_http_request_seconds_count{route="/health",method="GET",status="200"}' in response.text
+    assert "ndltd_cache_hits_total" in response.text
+    assert 'ndltd_opensearch_round_trips_per_request_bucket{route="/health",le="0"}' in response.text
+
+def test_metrics_add_up_across_workers(tmp_path):
+    import re
+    import socket
+    import subprocess
+    import time
+
+    import httpx
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    env = dict(
+        os.environ,
+        WORKERS="2",
+        SHARED_CACHE_DIR=str(tmp_path),
+        HOST="127.0.0.1",
+        PORT=str(port),
+        ENCODER_WARMUP="false",
+        METRICS_FLUSH_INTERVAL="0.1",
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    server = subprocess.Popen([sys.executable, "serve.py"], cwd=root, env=env)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 60
+        sent = 0
+        # Both workers are up once both have written their metrics.
+        while len(list((tmp_path / "metrics").glob("worker-*.json"))) < 2:
+            assert time.monotonic() < deadline and server.poll() is None
+            try:
+                httpx.get(f"{base}/health").raise_for_status()
+                sent += 1
+            except httpx.TransportError:
+                time.sleep(0.2)
+        for _ in range(30):
+            # A connection per request, so the requests spread over the workers.
+            httpx.get(f"{base}/health").raise_for_status()
+            sent += 1
+        time.sleep(0.5)
+        counts = []
+        for _ in range(4):
+            text = httpx.get(f"{base}/metrics").text
+            match = re.search(r'ndltd_http_request_seconds_count\{route="/health",method="GET",status="200"\} (\d+)', text)
+            counts.append(int(match.group(1)))
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    # Whichever worker answers, the scrape reports the requests of both.
+    assert counts == [sent] * 4
+    assert len(set(re.findall(r'ndltd_cache_entries\{cache="network",pid="(\d+)"\}', text))) == 2
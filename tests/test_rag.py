@@ -30,3 +30,43 @@ def test_generate_summary_google():
     data = response.json()
     assert data["status"] == "ok"
     assert data["target_uid"] == target_uid
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+    from app.services import rag
+
+    answers = []
+    monkeypatch.setitem(
+        rag._LLM_FACTORIES,
+        "openai",
+        lambda model_name, api_key: FakeListChatModel(responses=answers),
+    )
+    rag.llm_pool.clear()
+    rag.get_summary_cache().invalidate()
+    yield answers
+    rag.llm_pool.clear()
+    rag.get_summary_cache().invalidate()
+
+
+def test_generate_summary_fake_llm_is_cached(fake_llm):
+    fake_llm += ["第一次的摘要", "第二次的摘要"]
+    params = {"llm_service": "openai", "model_name": "fake", "target_uid": "109THU00099005"}
+    first = client.get("/api/v1/genai/summary", params=params, headers={"genai-api-key": "test"})
+    second = client.get("/api/v1/genai/summary", params=params, headers={"genai-api-key": "test"})
+    assert first.status_code == 200
+    assert first.json()["summary"] == "第一次的摘要"
+    assert second.json()["summary"] == "第一次的摘要"
+
+
+def test_stream_summary_fake_llm(fake_llm):
+    fake_llm.append("逐字輸出的摘要")
+    params = {"llm_service": "openai", "model_name": "fake", "target_uid": "109THU00099005"}
+    with client.stream(
+        "GET", "/api/v1/genai/summary/stream", params=params, headers={"genai-api-key": "test"}
+    ) as response:
+        assert response.status_code == 200
+        chunks = list(response.iter_text())
+    assert "".join(chunks) == "逐字輸出的摘要"
@@ -31,3 +31,10 @@ def test_stats_get_institution_department():
     assert response.status_code == 200
     data = response.json()
     assert data
+
+def test_stats_get_top_field_counts_multiple_years():
+    response = client.get("api/v1/stats/top_field/years?years=108&years=109&bucket_size=3")
+    assert response.status_code == 200
+    data = response.json()
+    assert set(data) == {"108", "109"}
+    assert all(len(buckets) <= 3 for buckets in data["109"].values())